@@ -1,27 +1,118 @@
 import streamlit as st
-import json, os, dotenv
-from openai import Client
+import os, dotenv
+import hashlib, json, threading
 import pandas as pd
-from core.extractors import extract_ctg_from_pdf, extract_miscarriage_from_pdf
-from core.embeddings import load_embedding_model, precompute_doc_embeddings, query_docs
-from core.predictors import load_ctg_model, predict_miscarriage, predict_ctg, run_risk_system_ctg, run_risk_system_miscarriage, load_miscarriage_model
-from core.widgets import render_report_dashboard
+from core.extractors import extract_ctg_fields, extract_miscarriage_from_pdf
+from core.report_parser import LLM_CONFIDENCE
+from core.embeddings import load_embedding_model
+from core.embedding_store import load_advices, load_doc_embeddings
+from core.lexical import load_lexical_index, retrieve_docs
+from core.retrieval import load_doc_index
+from core.predictors import CTG_COLUMNS, ctg_query, miscarriage_query, run_risk_system_ctg, run_risk_system_miscarriage
+from core.backends import load_predictor
+from core.llm_utils import OPENROUTER_BASE_URL, PooledLLMClient
+from core.pipeline import run_assessment
+from core.widgets import generate_pdf, pdf_styles, render_report_dashboard
 
 # ------------------ SETUP ------------------ #
-dotenv.load_dotenv()
-os.environ['TOKENIZERS_PARALLELISM'] = 'false'
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-client = Client(api_key=OPENROUTER_API_KEY, base_url="https://openrouter.ai/api/v1")
+# everything in this section is built once per process and shared by all sessions
+@st.cache_resource
+def load_config():
+    dotenv.load_dotenv()
+    os.environ['TOKENIZERS_PARALLELISM'] = 'false'
+    return {"openrouter_api_key": os.getenv("OPENROUTER_API_KEY")}
+
+@st.cache_resource
+def load_client():
+    return PooledLLMClient(api_key=load_config()["openrouter_api_key"], base_url=OPENROUTER_BASE_URL)
+
+@st.cache_resource
+def load_lexical():
+    advice_docs = load_advices()
+    return advice_docs, load_lexical_index(advice_docs)
+
+@st.cache_resource
+def load_dense_retrieval(_advice_docs):
+    """Embedding model, store and index, loaded in a background thread; "resources" stays None until ready."""
+    state = {"resources": None, "error": None}
+    def load():
+        try:
+            tokenizer, emb_model = load_embedding_model()
+            doc_embeddings = load_doc_embeddings(_advice_docs, emb_model, tokenizer)
+            state["resources"] = (doc_embeddings, emb_model, tokenizer, load_doc_index(doc_embeddings))
+        except Exception as e:
+            state["error"] = f"{type(e).__name__}: {e}"
+    threading.Thread(target=load, name="dense-retrieval-loader", daemon=True).start()
+    return state
+
+load_config()
+client = load_client()
 
 st.set_page_config(page_title="PreSafe", layout="wide")
 
 # ------------------ LOAD MODELS ------------------ #
-ctg_model = st.cache_resource(load_ctg_model)()
-miscarriage_model = st.cache_resource(load_miscarriage_model)()
-with open('ml/data/advices.jsonl') as f:
-    advice_docs = json.loads(f.read())
-tokenizer, emb_model = st.cache_resource(load_embedding_model)()
-doc_embeddings = st.cache_resource(precompute_doc_embeddings)(advice_docs, emb_model, tokenizer)
+# backends come from CTG_BACKEND / MISCARRIAGE_BACKEND (see core.backends)
+ctg_predictor = st.cache_resource(load_predictor)("ctg")
+miscarriage_predictor = st.cache_resource(load_predictor)("miscarriage")
+# BM25 serves retrieval right away; hybrid reranking starts once the embedding model is loaded
+advice_docs, lexical_index = load_lexical()
+dense_retrieval = load_dense_retrieval(advice_docs)
+
+def retrieve(query):
+    return retrieve_docs(query, advice_docs, lexical_index, dense=dense_retrieval["resources"])
+
+# ------------------ ASSESSMENT RESULTS ------------------ #
+MAX_RESULTS_PER_SESSION = 16
+
+def input_hash(test_type, inputs):
+    payload = json.dumps({"test": test_type, "inputs": {k: float(v) for k, v in inputs.items()}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def run_memoized(test_type, inputs, assess):
+    """Assessment result for `inputs`, computed once per session and input vector."""
+    results = st.session_state.setdefault("assessments", {})
+    key = input_hash(test_type, inputs)
+    if key not in results:
+        stages = assess(pd.DataFrame([inputs]))
+        results[key] = {"report": stages["report"].result(), "pdf": stages["pdf"].result().getvalue()}
+        while len(results) > MAX_RESULTS_PER_SESSION:
+            results.pop(next(iter(results)))
+    st.session_state[f"{test_type}_result"] = key
+    return results[key]
+
+@st.fragment
+def show_result(test_type):
+    """Last result of this test, kept across reruns until new inputs are assessed."""
+    key = st.session_state.get(f"{test_type}_result")
+    result = st.session_state.get("assessments", {}).get(key)
+    if result is not None:
+        render_report_dashboard(result["report"], test_type=test_type, pdf_buffer=result["pdf"])
+
+def assess_ctg(ctg_df):
+    return run_assessment(
+        ctg_df,
+        predict=ctg_predictor.predict,
+        make_query=ctg_query,
+        retrieve=retrieve,
+        risk_system=lambda top_advices, ctg_output: run_risk_system_ctg(top_advices, ctg_output, client),
+        render=generate_pdf,
+        warm_render=pdf_styles,
+    )
+
+def assess_miscarriage(miscarriage_df):
+    return run_assessment(
+        miscarriage_df,
+        predict=miscarriage_predictor.predict,
+        make_query=miscarriage_query,
+        retrieve=retrieve,
+        risk_system=lambda top_advices, miscarriage_output: run_risk_system_miscarriage(top_advices, miscarriage_output, client),
+        render=generate_pdf,
+        warm_render=pdf_styles,
+    )
+
+def prefill_version(values):
+    """Changes with the extracted values, so a new form (and its new defaults) replaces the old one."""
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:12]
 
 # ------------------ PAGE NAVIGATION ------------------ #
 if "page" not in st.session_state:
@@ -57,50 +148,47 @@ elif st.session_state.page == "ctg":
         ctg_pdf = st.file_uploader("Upload CTG Report (PDF)", type=["pdf"])
 
         if ctg_pdf:
+            refresh = st.button("🔄 Re-extract", key="ctg_refresh")
             try:
-                ctg_features = extract_ctg_from_pdf(ctg_pdf, client)
-                st.session_state.ctg_features = ctg_features  # ✅ store extracted data
+                # memoized by the PDF's content hash, so reruns don't re-parse or re-query the LLM
+                extraction = extract_ctg_fields(ctg_pdf, client, refresh=refresh)
+                st.session_state.ctg_features = extraction["values"]  # ✅ store extracted data
                 st.success("✅ CTG features extracted successfully and fields auto-filled.")
+                llm_filled = [f for f, c in extraction["confidence"].items() if c <= LLM_CONFIDENCE]
+                if llm_filled:
+                    st.warning(f"Filled by the LLM, please double-check: {', '.join(llm_filled)}")
+                if extraction["missing"]:
+                    st.warning(f"Not found in the report: {', '.join(extraction['missing'])}")
             except Exception as e:
                 st.error(f"CTG extraction failed: {e}")
 
     st.header("CTG Input (Manual Entry or Auto-filled from PDF)")
 
-    ctg_columns = [
-        "baseline_value", "accelerations", "fetal_movement", "uterine_contractions",
-        "light_decelerations", "severe_decelerations", "prolongued_decelerations",
-        "abnormal_short_term_variability", "mean_value_of_short_term_variability",
-        "percentage_of_time_with_abnormal_long_term_variability",
-        "mean_value_of_long_term_variability", "histogram_width", "histogram_min",
-        "histogram_max", "histogram_number_of_peaks", "histogram_number_of_zeroes",
-        "histogram_mode", "histogram_mean", "histogram_median", "histogram_variance",
-        "histogram_tendency"
-    ]
-
-    col1, col2, col3 = st.columns(3)
-    ctg_inputs = {}
-
     # Use extracted values if available
     prefilled = st.session_state.get("ctg_features", {})
 
-    for i, feature in enumerate(ctg_columns):
-        col = [col1, col2, col3][i % 3]
-        with col:
-            default_val = prefilled.get(feature, 0.0)
-            ctg_inputs[feature] = st.number_input(
-                feature.replace("_", " ").title(),
-                value=float(default_val) if isinstance(default_val, (int, float)) else 0.0,
-                step=0.1,
-                format="%.3f"
-            )
-
-    if st.button("Run CTG Assessment"):
-        ctg_df = pd.DataFrame([ctg_inputs])
-        ctg_output = predict_ctg(ctg_model, ctg_df)
-        query = f"CTG Prediction: {ctg_output['predicted_class']}, top features: {ctg_output['top_features']}, recommendations: {ctg_output['recommendations']}"
-        top_advices = query_docs(query, doc_embeddings, emb_model, tokenizer, advice_docs)
-        report = run_risk_system_ctg(top_advices, ctg_output, client)
-        render_report_dashboard(report, test_type="CTG")
+    # a form, so editing the 21 inputs does not rerun the script until submitted
+    with st.form(f"ctg_form_{prefill_version(prefilled)}"):
+        col1, col2, col3 = st.columns(3)
+        ctg_inputs = {}
+        for i, feature in enumerate(CTG_COLUMNS):
+            col = [col1, col2, col3][i % 3]
+            with col:
+                default_val = prefilled.get(feature, 0.0)
+                ctg_inputs[feature] = st.number_input(
+                    feature.replace("_", " ").title(),
+                    value=float(default_val) if isinstance(default_val, (int, float)) else 0.0,
+                    step=0.1,
+                    format="%.3f"
+                )
+        submitted = st.form_submit_button("Run CTG Assessment")
+
+    if submitted:
+        try:
+            run_memoized("CTG", ctg_inputs, assess_ctg)
+        except Exception as e:
+            st.error(f"Error running assessment: {e}")
+    show_result("CTG")
 
     if st.button("⬅ Back"):
         st.session_state.page = "intro"
@@ -117,8 +205,9 @@ elif st.session_state.page == "miscarriage":
         miscarriage_pdf = st.file_uploader("Upload Ultrasound Report (PDF)", type=["pdf"])
 
         if miscarriage_pdf:
+            refresh = st.button("🔄 Re-extract", key="miscarriage_refresh")
             try:
-                miscarriage_inputs = extract_miscarriage_from_pdf(miscarriage_pdf, client)
+                miscarriage_inputs = extract_miscarriage_from_pdf(miscarriage_pdf, client, refresh=refresh)
                 st.session_state.miscarriage_inputs = miscarriage_inputs  # ✅ store for auto-fill
                 st.success("✅ Miscarriage data extracted and fields auto-filled.")
             except Exception as e:
@@ -128,25 +217,27 @@ elif st.session_state.page == "miscarriage":
 
     prefilled = st.session_state.get("miscarriage_inputs", {})
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        Age = st.number_input("Age", 15, 60, int(prefilled.get("Age", 30)))
-        BMI = st.number_input("BMI", 10.0, 40.0, float(prefilled.get("BMI", 22.0)), step=0.1)
-        Nmisc = st.number_input("Previous Miscarriages (Nmisc)", 0, 10, int(prefilled.get("Nmisc", 0)))
-        Activity = st.selectbox("Activity Level", [0, 1], index=int(prefilled.get("Activity", 0)))
-        Binking = st.selectbox("Binking", [0, 1], index=int(prefilled.get("Binking", 0)))
-        Walking = st.selectbox("Walking", [0, 1], index=int(prefilled.get("Walking", 0)))
-    with col2:
-        Drinving = st.selectbox("Driving", [0, 1], index=int(prefilled.get("Drinving", 0)))
-        Sitting = st.selectbox("Sitting", [0, 1], index=int(prefilled.get("Sitting", 0)))
-        Location = st.selectbox("Location", [0, 1, 2], index=int(prefilled.get("Location", 0)))
-        temp = st.number_input("Temperature (°C)", 30.0, 42.0, float(prefilled.get("temp", 37.0)), step=0.1)
-        bpm = st.number_input("Heart Rate (bpm)", 40, 220, int(prefilled.get("bpm", 90)))
-        stress = st.selectbox("Stress Level", [0, 1, 2, 3], index=int(prefilled.get("stress", 0)))
-    with col3:
-        bp = st.number_input("Blood Pressure (mmHg)", 80, 250, int(prefilled.get("bp", 120)))
-        Alcohol_Consumption = st.number_input("Alcohol Consumption", 0, 1000, int(prefilled.get("Alcohol Comsumption", 0)))
-        Drunk = st.selectbox("Drunk Frequency", [0, 1, 2, 3], index=int(prefilled.get("Drunk", 0)))
+    with st.form(f"miscarriage_form_{prefill_version(prefilled)}"):
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            Age = st.number_input("Age", 15, 60, int(prefilled.get("Age", 30)))
+            BMI = st.number_input("BMI", 10.0, 40.0, float(prefilled.get("BMI", 22.0)), step=0.1)
+            Nmisc = st.number_input("Previous Miscarriages (Nmisc)", 0, 10, int(prefilled.get("Nmisc", 0)))
+            Activity = st.selectbox("Activity Level", [0, 1], index=int(prefilled.get("Activity", 0)))
+            Binking = st.selectbox("Binking", [0, 1], index=int(prefilled.get("Binking", 0)))
+            Walking = st.selectbox("Walking", [0, 1], index=int(prefilled.get("Walking", 0)))
+        with col2:
+            Drinving = st.selectbox("Driving", [0, 1], index=int(prefilled.get("Drinving", 0)))
+            Sitting = st.selectbox("Sitting", [0, 1], index=int(prefilled.get("Sitting", 0)))
+            Location = st.selectbox("Location", [0, 1, 2], index=int(prefilled.get("Location", 0)))
+            temp = st.number_input("Temperature (°C)", 30.0, 42.0, float(prefilled.get("temp", 37.0)), step=0.1)
+            bpm = st.number_input("Heart Rate (bpm)", 40, 220, int(prefilled.get("bpm", 90)))
+            stress = st.selectbox("Stress Level", [0, 1, 2, 3], index=int(prefilled.get("stress", 0)))
+        with col3:
+            bp = st.number_input("Blood Pressure (mmHg)", 80, 250, int(prefilled.get("bp", 120)))
+            Alcohol_Consumption = st.number_input("Alcohol Consumption", 0, 1000, int(prefilled.get("Alcohol Comsumption", 0)))
+            Drunk = st.selectbox("Drunk Frequency", [0, 1, 2, 3], index=int(prefilled.get("Drunk", 0)))
+        submitted = st.form_submit_button("Run Miscarriage Assessment")
 
     miscarriage_inputs = {
         "Age": Age,
@@ -166,16 +257,12 @@ elif st.session_state.page == "miscarriage":
         "Drunk": Drunk,
     }
 
-    if st.button("Run Miscarriage Assessment"):
+    if submitted:
         try:
-            miscarriage_df = pd.DataFrame([miscarriage_inputs])
-            miscarriage_output = predict_miscarriage(miscarriage_model, miscarriage_df)
-            query = f"Miscarriage Output: {miscarriage_output}"
-            top_advices = query_docs(query, doc_embeddings, emb_model, tokenizer, advice_docs)
-            report = run_risk_system_miscarriage(top_advices, miscarriage_output, client)
-            render_report_dashboard(report, test_type="Miscarriage")
+            run_memoized("Miscarriage", miscarriage_inputs, assess_miscarriage)
         except Exception as e:
             st.error(f"Error running assessment: {e}")
+    show_result("Miscarriage")
 
     if st.button("⬅ Back"):
         st.session_state.page = "intro"
@@ -0,0 +1,10 @@
+"""
+Benchmarks for the assessment hot paths.
+
+    python -m bench                         # run and compare against bench/baseline.json
+    python -m bench --save-baseline         # record a new baseline
+    python -m bench --only predict_ctg generate_pdf
+
+The LLM is served by the local stub in core.llm_stub, so runs need no network
+and no API key. See bench/runner.py for the stages and their inputs.
+"""
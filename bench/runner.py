@@ -0,0 +1,428 @@
+"""
+Stage timings for the assessment hot paths, compared against a JSON baseline.
+
+Each stage builds its inputs once (models, explainers, the advice corpus and a
+stub LLM client), then times a zero-argument call after a few warmup runs.
+A stage regresses when its median exceeds the baseline median by more than
+`threshold` (a ratio) and by more than `min_delta_ms`, so sub-millisecond
+stages do not fail on scheduler noise. The process exits with status 1 on any
+regression, on a stage that raises, on a baseline stage that no longer
+produces a timing, and when there is no baseline to compare against. Only a
+stage whose optional dependency is not installed (ImportError) is skipped.
+
+Baselines are only comparable on the same machine and thread settings; the
+environment is recorded alongside the timings and differences are reported.
+For that reason no baseline is committed: CI records one on its own runner
+from main with --save-baseline and restores it before comparing.
+"""
+import argparse
+import functools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BASELINE_PATH = 'bench/baseline.json'
+CTG_PDF_PATH = 'input/CTG_Feature_Report.pdf'
+CTG_DATA_PATH = 'ml/data/fetal_health.csv'
+DEFAULT_THRESHOLD = 1.25
+DEFAULT_MIN_DELTA_MS = 2.0
+SEED = 0
+
+
+# ------------------ timing
+
+def time_calls(fn, repeats, warmup):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times):
+    ordered = sorted(times)
+    return {
+        "median": statistics.median(ordered),
+        "min": ordered[0],
+        "p90": ordered[min(len(ordered) - 1, int(round(0.9 * (len(ordered) - 1))))],
+        "runs": len(ordered),
+    }
+
+
+def environment(args):
+    import torch
+
+    from core.embeddings import EMBEDDING_BACKEND
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+        "embedding_model": args.embedding_model,
+        "embedding_backend": EMBEDDING_BACKEND,
+        "llm_delay": args.llm_delay,
+    }
+
+
+# ------------------ fixtures
+
+class Fixtures:
+    """Inputs shared by the stages, built on first use and excluded from timings."""
+
+    def __init__(self, embedding_model, llm_delay):
+        self.embedding_model = embedding_model
+        self.llm_delay = llm_delay
+        self.notes = {}
+
+    @functools.cached_property
+    def ctg_rows(self):
+        from core.predictors import CTG_COLUMNS, align_columns
+
+        data = align_columns(pd.read_csv(CTG_DATA_PATH), CTG_COLUMNS)
+        return data.sample(n=1, random_state=SEED).reset_index(drop=True)
+
+    @functools.cached_property
+    def ctg(self):
+        from core.predictors import load_ctg_explainer, load_ctg_model
+
+        model = load_ctg_model()
+        return model, load_ctg_explainer(model)
+
+    @functools.cached_property
+    def miscarriage(self):
+        from sklearn.ensemble import RandomForestClassifier
+
+        from core.predictors import MISCARRIAGE_COLUMNS, load_explainer, load_miscarriage_model
+
+        try:
+            model = load_miscarriage_model()
+        except FileNotFoundError:
+            # same shape as the production model so the predict/SHAP path is exercised
+            rng = np.random.default_rng(SEED)
+            X = pd.DataFrame(rng.normal(size=(500, len(MISCARRIAGE_COLUMNS))), columns=MISCARRIAGE_COLUMNS)
+            y = (X.iloc[:, :3].sum(axis=1) > 0).astype(int)
+            model = RandomForestClassifier(n_estimators=100, random_state=SEED).fit(X, y)
+            self.notes["predict_miscarriage"] = "stand-in forest, miscarriage model not found"
+        rng = np.random.default_rng(SEED)
+        row = pd.DataFrame(rng.normal(size=(1, len(MISCARRIAGE_COLUMNS))), columns=MISCARRIAGE_COLUMNS)
+        return model, load_explainer(model), row
+
+    @functools.cached_property
+    def advice_docs(self):
+        from core.embedding_store import load_advices
+
+        return load_advices()
+
+    @functools.cached_property
+    def embedder(self):
+        from core.embeddings import load_embedding_model
+
+        return load_embedding_model(self.embedding_model)
+
+    @functools.cached_property
+    def doc_embeddings(self):
+        from core.embeddings import precompute_doc_embeddings
+
+        tokenizer, emb_model = self.embedder
+        return precompute_doc_embeddings(self.advice_docs, emb_model, tokenizer)
+
+    @functools.cached_property
+    def doc_index(self):
+        from core.retrieval import build_index
+
+        return build_index(self.doc_embeddings, kind="flat")
+
+    @functools.cached_property
+    def ctg_output(self):
+        from core.predictors import predict_ctg
+
+        model, explainer = self.ctg
+        return predict_ctg(model, self.ctg_rows, explainer)
+
+    @functools.cached_property
+    def report(self):
+        return {
+            "classification": "Suspect",
+            "confidence": 72,
+            "reason": "Reduced short term variability with prolonged decelerations.",
+            "recommendations": [{"advice": d["advice"], "source": f"{d['source']}, page {d['page_number']}"} for d in self.advice_docs[:3]],
+        }
+
+    @functools.cached_property
+    def client(self):
+        from core.llm_stub import start_stub_server
+        from core.llm_utils import PooledLLMClient
+
+        report = json.dumps(self.report)
+        _, base_url = start_stub_server(delay=self.llm_delay, respond=lambda request: report)
+        return PooledLLMClient(api_key="stub", base_url=base_url)
+
+
+# ------------------ stages
+# each returns the zero-argument call to time
+
+def stage_extract_text(fx):
+    from core.extractors import extract_text
+
+    with open(CTG_PDF_PATH, "rb") as f:
+        pdf_bytes = f.read()
+    return lambda: extract_text(pdf_bytes)
+
+
+def stage_compute_embedding(fx):
+    from core.embeddings import compute_embedding
+    from core.predictors import ctg_query
+
+    tokenizer, emb_model = fx.embedder
+    query = ctg_query(fx.ctg_output)
+    return lambda: compute_embedding(query, emb_model, tokenizer)
+
+
+def stage_precompute_doc_embeddings(fx):
+    from core.embeddings import precompute_doc_embeddings
+
+    tokenizer, emb_model = fx.embedder
+    return lambda: precompute_doc_embeddings(fx.advice_docs, emb_model, tokenizer)
+
+
+def stage_query_docs(fx):
+    from core.embeddings import clear_query_cache, query_docs
+    from core.predictors import ctg_query
+
+    tokenizer, emb_model = fx.embedder
+    query = ctg_query(fx.ctg_output)
+
+    def run():
+        clear_query_cache()
+        query_docs(query, fx.doc_embeddings, emb_model, tokenizer, fx.advice_docs, index=fx.doc_index)
+    return run
+
+
+def stage_query_docs_cached(fx):
+    from core.embeddings import query_docs
+    from core.predictors import ctg_query
+
+    tokenizer, emb_model = fx.embedder
+    query = ctg_query(fx.ctg_output)
+    return lambda: query_docs(query, fx.doc_embeddings, emb_model, tokenizer, fx.advice_docs)
+
+
+def stage_retrieve_docs(mode):
+    """Tiered retrieval (core.lexical) of the CTG query, the query vector cached as in steady state."""
+    def setup(fx):
+        from core.lexical import LexicalIndex, retrieve_docs
+        from core.predictors import ctg_query
+
+        tokenizer, emb_model = fx.embedder
+        lexical_index = LexicalIndex.build([d["advice"] for d in fx.advice_docs])
+        dense = (fx.doc_embeddings, emb_model, tokenizer, None)
+        query = ctg_query(fx.ctg_output)
+        return lambda: retrieve_docs(query, fx.advice_docs, lexical_index, dense=dense, mode=mode)
+    return setup
+
+
+def stage_predict_ctg(fx):
+    from core.predictors import predict_ctg
+
+    model, explainer = fx.ctg
+    return lambda: predict_ctg(model, fx.ctg_rows, explainer)
+
+
+def stage_predict_miscarriage(fx):
+    from core.predictors import predict_miscarriage
+
+    model, explainer, row = fx.miscarriage
+    return lambda: predict_miscarriage(model, row, explainer)
+
+
+def stage_ctg_proba(backend):
+    """predict_proba alone (no SHAP) of one CTG backend, to compare TabPFN on CPU with the forest."""
+    def setup(fx):
+        from core.backends import load_predictor
+
+        predictor = load_predictor("ctg", backend, unvalidated=True)
+        return lambda: predictor.predict_proba(fx.ctg_rows)
+    return setup
+
+
+def stage_generate_pdf(fx):
+    from core.reports import render_pdf
+
+    # the uncached render; generate_pdf would serve repeats from its memo
+    return lambda: render_pdf(fx.report)
+
+
+def stage_pipeline_ctg(fx):
+    from core.embeddings import query_docs
+    from core.pipeline import run_assessment
+    from core.predictors import ctg_query, predict_ctg, run_risk_system_ctg
+    from core.widgets import generate_pdf, pdf_styles
+
+    model, explainer = fx.ctg
+    tokenizer, emb_model = fx.embedder
+    doc_embeddings, doc_index, client = fx.doc_embeddings, fx.doc_index, fx.client
+
+    def run():
+        stages = run_assessment(
+            fx.ctg_rows,
+            predict=lambda df: predict_ctg(model, df, explainer),
+            make_query=ctg_query,
+            retrieve=lambda query: query_docs(query, doc_embeddings, emb_model, tokenizer, fx.advice_docs, index=doc_index),
+            risk_system=lambda advices, output: run_risk_system_ctg(advices, output, client),
+            render=generate_pdf,
+            warm_render=pdf_styles,
+        )
+        stages["pdf"].result()
+    return run
+
+
+STAGES = {
+    "extract_text": stage_extract_text,
+    "compute_embedding": stage_compute_embedding,
+    "precompute_doc_embeddings": stage_precompute_doc_embeddings,
+    "query_docs": stage_query_docs,
+    "query_docs_cached": stage_query_docs_cached,
+    "retrieve_lexical": stage_retrieve_docs("lexical"),
+    "retrieve_hybrid": stage_retrieve_docs("hybrid"),
+    "predict_ctg": stage_predict_ctg,
+    "predict_miscarriage": stage_predict_miscarriage,
+    "ctg_proba_rf": stage_ctg_proba("rf"),
+    "ctg_proba_tabpfn": stage_ctg_proba("tabpfn"),
+    "ctg_proba_tabpfn_fast": stage_ctg_proba("tabpfn-fast"),
+    "generate_pdf": stage_generate_pdf,
+    "pipeline_ctg": stage_pipeline_ctg,
+}
+
+# run only when named with --only: the TabPFN backends are not validated for serving
+OPTIONAL_STAGES = {"ctg_proba_tabpfn", "ctg_proba_tabpfn_fast"}
+DEFAULT_STAGES = [name for name in STAGES if name not in OPTIONAL_STAGES]
+
+
+# ------------------ run and compare
+
+def run_stages(names, fx, repeats, warmup):
+    results = {}
+    for name in names:
+        try:
+            call = STAGES[name](fx)
+            times = time_calls(call, repeats, warmup)
+        except ImportError as e:
+            results[name] = {"skipped": f"{type(e).__name__}: {e}"}
+            print(f"{name:<28} skipped ({results[name]['skipped']})")
+            continue
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+            print(f"{name:<28} FAILED ({results[name]['error']})")
+            continue
+        results[name] = summarize(times)
+        if name in fx.notes:
+            results[name]["note"] = fx.notes[name]
+        print(f"{name:<28} median {results[name]['median'] * 1000:9.2f} ms   min {results[name]['min'] * 1000:9.2f} ms")
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Names and messages of stages whose median regressed past `threshold` against `baseline`,
+    or that were timed in the baseline and failed or were skipped in `results`.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous or "median" not in previous:
+            continue
+        if "median" not in current:
+            reason = current.get("error") or current.get("skipped")
+            regressions.append((name, f"{name}: {previous['median'] * 1000:.2f} ms in the baseline, now no timing ({reason})"))
+            continue
+        ratio = current["median"] / previous["median"] if previous["median"] > 0 else float("inf")
+        delta_ms = (current["median"] - previous["median"]) * 1000
+        if ratio > threshold and delta_ms > min_delta_ms:
+            regressions.append((name, f"{name}: {previous['median'] * 1000:.2f} ms -> {current['median'] * 1000:.2f} ms ({ratio:.2f}x)"))
+    return regressions
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    from core.embeddings import DEFAULT_EMBEDDING_MODEL
+
+    parser = argparse.ArgumentParser(description="Benchmark the assessment hot paths against a JSON baseline.")
+    parser.add_argument("--only", nargs="+", choices=list(STAGES),
+                        help=f"Run only these stages (default: all but {', '.join(sorted(OPTIONAL_STAGES))})")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed median ratio over the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Simulated LLM latency in seconds")
+    args = parser.parse_args(argv)
+
+    # every pipeline run must reach the stub, not the response cache
+    os.environ["LLM_CACHE"] = "0"
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    np.random.seed(SEED)
+
+    fx = Fixtures(args.embedding_model, args.llm_delay)
+    results = {
+        "environment": environment(args),
+        "repeats": args.repeats,
+        "warmup": args.warmup,
+        "stages": run_stages(args.only or DEFAULT_STAGES, fx, args.repeats, args.warmup),
+    }
+    if args.output:
+        write_json(args.output, results)
+    failed = [name for name, r in results["stages"].items() if "error" in r]
+    if failed:
+        print(f"Stages failed: {', '.join(failed)}")
+        sys.exit(1)
+    if args.save_baseline:
+        write_json(args.baseline, results)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; record one on this machine with --save-baseline.")
+        sys.exit(1)
+    changed = {k: (v, results["environment"].get(k)) for k, v in baseline.get("environment", {}).items() if results["environment"].get(k) != v}
+    for key, (before, now) in changed.items():
+        print(f"warning: {key} differs from the baseline ({before!r} -> {now!r})")
+
+    regressions = compare(results["stages"], baseline, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"Regressions past {args.threshold:.2f}x the baseline median, or stages no longer timed:")
+        for _, message in regressions:
+            print(f"  {message}")
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Registry of model backends per task, behind one predictor interface.
+
+    predictor = load_predictor("ctg")          # CTG_BACKEND, default "rf"
+    predictor.predict(one_row_df)              # predict_ctg-style result
+    predictor.predict_batch(cohort_df)         # predict_batch-style result
+
+Backends: "rf" (the random forest pickles; MODEL_BACKEND picks the sklearn or
+compact runtime), "xgboost" and "tabpfn" / "tabpfn-fast" (CTG only, the
+latter two on CPU through core.tabpfn_cpu).
+
+The evaluator scores every CTG backend on the held-out split of
+ml/data/fetal_health.csv (the notebooks' 80/20 stratified split, seed 42) and
+reports accuracy, single-row serving latency (prediction + SHAP, p50/p99),
+single-row prediction latency alone, batch throughput and serialized model size:
+
+    python -m core.backends --task ctg --output ml/models/ctg_backends.json
+
+With CTG_BACKEND=auto the app loads the backend with the lowest p99 latency
+in that report whose accuracy is at least CTG_MIN_ACCURACY.
+
+Backends in UNVALIDATED_BACKENDS (tabpfn, tabpfn-fast) are evaluated and
+benchmarked but neither selected by "auto" nor served unless
+ALLOW_UNVALIDATED_BACKENDS=1: without a tree explainer their SHAP values come
+from the permutation explainer, thousands of predict_proba calls per row.
+"""
+import argparse
+import functools
+import json
+import os
+import pickle
+import time
+from functools import cached_property
+
+import numpy as np
+
+from core.predictors import (
+    CTG_CLASS_MAP, CTG_COLUMNS, MISCARRIAGE_CLASS_MAP, MISCARRIAGE_COLUMNS, align_columns, ctg_split,
+    load_ctg_explainer, load_ctg_model, load_ctg_xgboost, load_miscarriage_explainer, load_miscarriage_model,
+    predict_batch, row_output,
+)
+from core.tabpfn_cpu import load_ctg_tabpfn, load_ctg_tabpfn_fast
+
+# task -> (feature columns, class map, explainer loader)
+TASKS = {
+    "ctg": (CTG_COLUMNS, CTG_CLASS_MAP, load_ctg_explainer),
+    "miscarriage": (MISCARRIAGE_COLUMNS, MISCARRIAGE_CLASS_MAP, load_miscarriage_explainer),
+}
+
+# task -> backend name -> model loader
+BACKENDS = {
+    "ctg": {
+        "rf": load_ctg_model, "xgboost": load_ctg_xgboost,
+        "tabpfn": load_ctg_tabpfn, "tabpfn-fast": load_ctg_tabpfn_fast,
+    },
+    "miscarriage": {"rf": load_miscarriage_model},
+}
+
+DEFAULT_BACKEND = "rf"
+
+# task -> backends not validated for serving
+UNVALIDATED_BACKENDS = {"ctg": {"tabpfn", "tabpfn-fast"}}
+
+
+def allow_unvalidated():
+    return os.getenv("ALLOW_UNVALIDATED_BACKENDS", "0") == "1"
+
+
+def is_validated(task, backend):
+    return backend not in UNVALIDATED_BACKENDS.get(task, ())
+
+
+def register_backend(task, name, loader):
+    """Add a backend; `loader()` returns a fitted model with predict_proba."""
+    BACKENDS[task][name] = loader
+    clear_predictor_cache()
+
+
+class Predictor:
+    """A task's model and explainer, scoring one row or a cohort through the same predict_batch pass."""
+
+    def __init__(self, task, backend, model):
+        self.task = task
+        self.backend = backend
+        self.model = model
+        self.columns, self.class_map, self._load_explainer = TASKS[task]
+
+    @cached_property
+    def explainer(self):
+        return self._load_explainer(self.model)
+
+    def predict_proba(self, patient_data):
+        return self.model.predict_proba(align_columns(patient_data, self.columns))
+
+    def predict_batch(self, patient_data, top_k=3):
+        return predict_batch(self.model, align_columns(patient_data, self.columns), self.class_map, self.explainer, top_k)
+
+    def predict(self, patient_data):
+        """Result for the first row of `patient_data`, shaped like predict_ctg/predict_miscarriage."""
+        return row_output(self.predict_batch(patient_data.iloc[:1]))
+
+    def __repr__(self):
+        return f"Predictor({self.task!r}, {self.backend!r})"
+
+
+# ------------------ selection
+
+def report_path(task):
+    return f"ml/models/{task}_backends.json"
+
+
+def configured_backend(task):
+    return os.getenv(f"{task.upper()}_BACKEND", DEFAULT_BACKEND)
+
+
+def select_backend(task, min_accuracy=None, report=None):
+    """Fastest evaluated, servable backend (lowest p99 latency) whose accuracy meets `min_accuracy`."""
+    if min_accuracy is None:
+        min_accuracy = float(os.getenv(f"{task.upper()}_MIN_ACCURACY", "0"))
+    if report is None:
+        path = report_path(task)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run `python -m core.backends --task {task} --output {path}`")
+        with open(path) as f:
+            report = json.load(f)
+
+    results = {
+        name: r for name, r in report["backends"].items()
+        if "error" not in r and name in BACKENDS[task] and (is_validated(task, name) or allow_unvalidated())
+    }
+    eligible = [name for name, r in results.items() if r["accuracy"] >= min_accuracy]
+    if not eligible:
+        best = max(results.values(), key=lambda r: r["accuracy"], default={"accuracy": float("nan")})
+        raise ValueError(f"No {task} backend reaches accuracy {min_accuracy} (best: {best['accuracy']:.4f})")
+    return min(eligible, key=lambda name: results[name]["latency_ms"]["p99"])
+
+
+def load_predictor(task, backend=None, unvalidated=False):
+    """
+    Predictor for `task` with `backend`, or the configured one (`<TASK>_BACKEND`, "auto" to select).
+    Unvalidated backends need unvalidated=True (evaluation, benchmarks) or ALLOW_UNVALIDATED_BACKENDS=1.
+    The backend is resolved before the cache, so the default and its explicit name share one predictor.
+    """
+    backend = backend or configured_backend(task)
+    if backend == "auto":
+        backend = select_backend(task)
+    if backend not in BACKENDS[task]:
+        raise ValueError(f"Unknown {task} backend {backend!r}, expected one of {sorted(BACKENDS[task])} or 'auto'")
+    if not (unvalidated or is_validated(task, backend) or allow_unvalidated()):
+        raise ValueError(f"The {task} backend {backend!r} is not validated for serving "
+                         f"(SHAP falls back to the permutation explainer); set ALLOW_UNVALIDATED_BACKENDS=1 to use it")
+    return _cached_predictor(task, backend)
+
+
+@functools.lru_cache(maxsize=None)
+def _cached_predictor(task, backend):
+    return Predictor(task, backend, BACKENDS[task][backend]())
+
+
+def clear_predictor_cache():
+    _cached_predictor.cache_clear()
+
+
+# ------------------ evaluation
+
+def ctg_eval_split():
+    """Held-out rows and labels of the training CSV."""
+    _, x_test, _, y_test = ctg_split()
+    return x_test, y_test.to_numpy()
+
+
+EVAL_SPLITS = {"ctg": ctg_eval_split}
+
+
+def serialized_mb(model):
+    """Pickled size of `model` in MB: what is stored and shipped, not the memory it takes once loaded."""
+    return len(pickle.dumps(model)) / 1e6
+
+
+def _latency_ms(fn, x_test, rows):
+    times = []
+    for i in range(min(rows, len(x_test))):
+        start = time.perf_counter()
+        fn(x_test.iloc[i:i + 1])
+        times.append((time.perf_counter() - start) * 1000)
+    return {"p50": float(np.percentile(times, 50)), "p99": float(np.percentile(times, 99))}
+
+
+def evaluate_backend(predictor, x_test, y_test, latency_rows=50):
+    start = time.perf_counter()
+    probs = predictor.predict_proba(x_test)
+    batch_seconds = time.perf_counter() - start
+
+    predictor.predict(x_test.iloc[:1])  # builds the explainer outside the timed calls
+    return {
+        "accuracy": float((probs.argmax(axis=1) == y_test).mean()),
+        "latency_ms": _latency_ms(predictor.predict, x_test, latency_rows),
+        "predict_latency_ms": _latency_ms(predictor.predict_proba, x_test, latency_rows),
+        "batch_ms_per_row": batch_seconds * 1000 / len(x_test),
+        "serialized_mb": serialized_mb(predictor.model),
+    }
+
+
+def evaluate(task="ctg", backends=None, latency_rows=50):
+    """{"task", "rows", "backends": {name: metrics or {"error"}}} for every (or the given) backend."""
+    x_test, y_test = EVAL_SPLITS[task]()
+    report = {"task": task, "rows": len(x_test), "backends": {}}
+    for name in backends or BACKENDS[task]:
+        try:
+            report["backends"][name] = evaluate_backend(load_predictor(task, name, unvalidated=True), x_test, y_test, latency_rows)
+        except Exception as e:
+            report["backends"][name] = {"error": f"{type(e).__name__}: {e}"}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare model backends on accuracy, latency and size.")
+    parser.add_argument("--task", choices=sorted(EVAL_SPLITS), default="ctg")
+    parser.add_argument("--backends", nargs="*", help="Backends to evaluate (default: all registered)")
+    parser.add_argument("--latency-rows", type=int, default=50, help="Single-row predictions timed per backend")
+    parser.add_argument("--min-accuracy", type=float, help="Accuracy floor for the selection (default: <TASK>_MIN_ACCURACY)")
+    parser.add_argument("--output", help="Write the report as JSON (the app reads ml/models/<task>_backends.json)")
+    args = parser.parse_args(argv)
+
+    report = evaluate(args.task, args.backends, args.latency_rows)
+    print(f"{args.task}: {report['rows']} held-out rows")
+    for name, r in report["backends"].items():
+        if "error" in r:
+            print(f"  {name:<11} failed: {r['error'].splitlines()[0]}")
+            continue
+        print(f"  {name:<11} accuracy {r['accuracy']:.4f}  latency p50 {r['latency_ms']['p50']:.1f} ms "
+              f"p99 {r['latency_ms']['p99']:.1f} ms (predict alone p50 {r['predict_latency_ms']['p50']:.1f} ms "
+              f"p99 {r['predict_latency_ms']['p99']:.1f} ms)  batch {r['batch_ms_per_row']:.3f} ms/row  "
+              f"pickled {r['serialized_mb']:.1f} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    try:
+        selected = select_backend(args.task, args.min_accuracy, report)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(f"Selected with {args.task.upper()}_BACKEND=auto: {selected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Micro-batching in front of predict_batch.
+
+Concurrent single-patient requests are queued and coalesced: the worker waits
+up to `max_wait_ms` after the first queued request (or until `max_batch_size`
+rows are waiting), runs one predict_proba and one batched SHAP pass over all
+of them, and resolves each caller's Future with its own row.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import pandas as pd
+
+from core.predictors import predict_batch, row_output
+
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    def __init__(self, model, explainer, class_map, max_batch_size=None, max_wait_ms=None):
+        self.model = model
+        self.explainer = explainer
+        self.class_map = class_map
+        self.max_batch_size = max_batch_size or BATCH_MAX_SIZE
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else BATCH_MAX_WAIT_MS) / 1000
+        self.stats = {"requests": 0, "batches": 0, "rows": 0}
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, patient_data):
+        """Queue a single-row DataFrame; the Future resolves to its predict_ctg-style result."""
+        if len(patient_data) != 1:
+            raise ValueError(f"MicroBatcher expects one row per request, got {len(patient_data)}")
+        future = Future()
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._queue.append((patient_data, future))
+            self.stats["requests"] += 1
+            self._cond.notify()
+        return future
+
+    def predict(self, patient_data, timeout=None):
+        return self.submit(patient_data).result(timeout)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._worker.join()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            # the first request opens a window; fill it until it is full or expires
+            deadline = time.monotonic() + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [(frame, future) for frame, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            frames, futures = zip(*batch)
+            try:
+                patient_data = pd.concat(frames, ignore_index=True)
+                result = predict_batch(self.model, patient_data, self.class_map, self.explainer)
+            except BaseException as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            self.stats["batches"] += 1
+            self.stats["rows"] += len(frames)
+            for row, future in enumerate(futures):
+                future.set_result(row_output(result, row))
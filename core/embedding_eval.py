@@ -0,0 +1,151 @@
+"""
+Offline check that an embedding backend retrieves the same advices as fp32.
+
+Embeds the advice corpus and a set of representative queries (CTG queries
+built from predictions on the training CSV, or a file with one query per
+line) with both backends, then reports top-k overlap, top-1 agreement, query
+latency and model size. The candidate's advice vectors come from (and are
+written to) its embedding store, and the result is recorded in that store's
+manifest with the model and corpus digest: EMBEDDING_BACKEND only serves a
+backend whose recorded evaluation passed. Exits with status 1 when the mean
+top-k overlap is below --min-overlap (default 1.0: every query retrieves the
+same k advices as fp32).
+
+    python -m core.embedding_eval --backend int8 --k 3 --output int8-eval.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from core.embedding_store import STORE_DIR, advice_hash, load_advices, load_doc_embeddings, record_evaluation
+from core.embeddings import DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKENDS, compute_embedding, encode, load_embedding_model
+from core.startup import lazy_import
+
+
+def ctg_queries(n_rows=200, seed=0):
+    """Distinct CTG retrieval queries, as the app builds them, for a sample of training rows."""
+    from core.predictors import (
+        CTG_BACKGROUND_PATH, CTG_CLASS_MAP, CTG_COLUMNS, align_columns, ctg_query, load_ctg_explainer,
+        load_ctg_model, predict_batch, row_output,
+    )
+
+    data = align_columns(pd.read_csv(CTG_BACKGROUND_PATH), CTG_COLUMNS)
+    rows = data.sample(n=min(n_rows, len(data)), random_state=seed).reset_index(drop=True)
+    model = load_ctg_model()
+    batch = predict_batch(model, rows, CTG_CLASS_MAP, load_ctg_explainer(model))
+    return list(dict.fromkeys(ctg_query(row_output(batch, i)) for i in range(len(rows))))
+
+
+def top_k(query_vecs, doc_vecs, k):
+    scores = query_vecs @ doc_vecs.T
+    idx = np.argpartition(-scores, kth=min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1)
+
+
+def model_bytes(emb_model):
+    """Bytes held by the model's weights; quantized Linear layers keep theirs as packed (weight, bias) tuples."""
+    torch = lazy_import("torch")
+
+    def size(value):
+        if isinstance(value, torch.Tensor):
+            return value.element_size() * value.nelement()
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        return 0
+    return sum(size(v) for v in emb_model.state_dict().values())
+
+
+def median_latency(queries, emb_model, tokenizer, n=50):
+    times = []
+    for query in queries[:n]:
+        start = time.perf_counter()
+        compute_embedding(query, emb_model, tokenizer)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def evaluate(queries, docs, model_name=DEFAULT_EMBEDDING_MODEL, backend="int8", ks=(1, 3, 5), store_dir=STORE_DIR):
+    texts = [d["advice"] for d in docs]
+    report = {"model": model_name, "backend": backend, "queries": len(queries), "docs": len(docs), "k": {}}
+    results = {}
+    for name in ("fp32", backend):
+        tokenizer, emb_model = load_embedding_model(model_name, name)
+        if name == backend:
+            # the vectors the backend will serve, so the recorded evaluation covers its store
+            doc_vectors = np.asarray(load_doc_embeddings(docs, emb_model, tokenizer, model_name, store_dir, backend,
+                                                         unvalidated=True))
+        else:
+            doc_vectors = encode(texts, emb_model, tokenizer)
+        results[name] = {
+            "docs": doc_vectors,
+            "queries": encode(queries, emb_model, tokenizer),
+            "latency": median_latency(queries, emb_model, tokenizer),
+            "bytes": model_bytes(emb_model),
+        }
+
+    reference, candidate = results["fp32"], results[backend]
+    for k in ks:
+        expected = top_k(reference["queries"], reference["docs"], k)
+        actual = top_k(candidate["queries"], candidate["docs"], k)
+        overlap = np.array([len(set(a) & set(b)) / k for a, b in zip(expected, actual)])
+        report["k"][k] = {
+            "mean_overlap": float(overlap.mean()),
+            "min_overlap": float(overlap.min()),
+            "identical_sets": float((overlap == 1).mean()),
+            "top1_agreement": float((expected[:, 0] == actual[:, 0]).mean()),
+        }
+    report["query_cosine"] = float(np.mean(np.sum(reference["queries"] * candidate["queries"], axis=1)))
+    report["latency_ms"] = {name: r["latency"] * 1000 for name, r in results.items()}
+    report["model_mb"] = {name: r["bytes"] / 1e6 for name, r in results.items()}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare top-k advice retrieval of an embedding backend against fp32.")
+    parser.add_argument("--backend", choices=[b for b in EMBEDDING_BACKENDS if b != "fp32"], default="int8")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--queries", help="File with one query per line (default: CTG queries from the training CSV)")
+    parser.add_argument("--rows", type=int, default=200, help="Training rows to build CTG queries from")
+    parser.add_argument("--k", type=int, default=3, help="k used by query_docs, checked against --min-overlap")
+    parser.add_argument("--min-overlap", type=float, default=1.0)
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.queries:
+        with open(args.queries) as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = ctg_queries(args.rows)
+    ks = sorted({1, args.k, 5})
+    docs = load_advices()
+    report = evaluate(queries, docs, args.model, args.backend, ks, args.store_dir)
+    report["passed"] = report["k"][args.k]["mean_overlap"] >= args.min_overlap
+    record_evaluation(args.model, args.backend, [advice_hash(d) for d in docs], {
+        "k": args.k, "min_overlap": args.min_overlap, "mean_overlap": report["k"][args.k]["mean_overlap"],
+        "queries": report["queries"], "passed": report["passed"],
+    }, args.store_dir)
+
+    print(f"{report['queries']} queries over {report['docs']} advices, {args.model} fp32 vs {args.backend}")
+    for k, stats in report["k"].items():
+        print(f"  top-{k}: mean overlap {stats['mean_overlap']:.3f}, min {stats['min_overlap']:.3f}, "
+              f"identical {stats['identical_sets']:.1%}, top-1 agreement {stats['top1_agreement']:.1%}")
+    print(f"  query vector cosine (fp32 vs {args.backend}): {report['query_cosine']:.4f}")
+    print("  query latency: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in report["latency_ms"].items()))
+    print("  model size: " + ", ".join(f"{name} {mb:.1f} MB" for name, mb in report["model_mb"].items()))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not report["passed"]:
+        raise SystemExit(f"top-{args.k} overlap {report['k'][args.k]['mean_overlap']:.3f} is below {args.min_overlap}")
+    print(f"top-{args.k} overlap meets {args.min_overlap}; the passing evaluation is recorded in the "
+          f"{args.backend} store, so EMBEDDING_BACKEND={args.backend} will be served for this corpus.")
+
+
+if __name__ == "__main__":
+    main()
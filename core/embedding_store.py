@@ -0,0 +1,180 @@
+"""
+On-disk store for advice embeddings.
+
+Vectors live in `<store_dir>/<model>.npy` next to a JSON manifest holding the
+embedding model name, pooling scheme and a content hash per advice. Loading
+memory-maps the matrix; only advices whose hash is not in the manifest are
+re-embedded.
+
+Backends other than fp32 are only served once `python -m core.embedding_eval`
+has recorded a passing evaluation in their manifest for the same model and
+corpus digest (ALLOW_UNVALIDATED_BACKENDS=1 overrides). Rewriting the store
+for a changed corpus drops the evaluation.
+
+    python -m core.embedding_store ml/data/advices.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from core.embeddings import (
+    DEFAULT_EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_BACKENDS, POOLING, load_embedding_model, model_key,
+    precompute_doc_embeddings,
+)
+from core.startup import timed_load
+
+STORE_DIR = 'ml/data/embeddings'
+ADVICES_PATH = 'ml/data/advices.jsonl'
+
+
+def load_advices(path=ADVICES_PATH):
+    with open(path) as f:
+        return json.loads(f.read())
+
+
+def advice_hash(doc):
+    return hashlib.sha256(doc["advice"].encode("utf-8")).hexdigest()
+
+
+def corpus_digest(hashes):
+    """Digest of a corpus from its per-advice hashes, stamped on indexes built over the store."""
+    return hashlib.sha256("".join(hashes).encode("utf-8")).hexdigest()
+
+
+def store_paths(model_name, store_dir=STORE_DIR):
+    slug = re.sub(r"[^A-Za-z0-9.-]+", "_", model_name)
+    base = os.path.join(store_dir, slug)
+    return f"{base}.npy", f"{base}.json"
+
+
+def read_manifest(model_name, store_dir=STORE_DIR, dim=None):
+    """Manifest of the store for `model_name`, or None when missing or stale (other model, pooling or width)."""
+    vectors_path, manifest_path = store_paths(model_name, store_dir)
+    if not (os.path.exists(vectors_path) and os.path.exists(manifest_path)):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get("model") != model_name or manifest.get("pooling") != POOLING:
+        return None
+    if dim is not None and manifest.get("dim") != dim:
+        return None
+    return manifest
+
+
+def allow_unvalidated():
+    return os.getenv("ALLOW_UNVALIDATED_BACKENDS", "0") == "1"
+
+
+def record_evaluation(model_name, backend, hashes, result, store_dir=STORE_DIR):
+    """Stamp an embedding_eval `result` for `model_name` on `backend` over the corpus `hashes` in the store manifest."""
+    manifest = read_manifest(model_key(model_name, backend), store_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"No {backend} embedding store for {model_name} in {store_dir}")
+    manifest["evaluation"] = {"model": model_name, "backend": backend, "corpus": corpus_digest(hashes), **result}
+    _, manifest_path = store_paths(model_key(model_name, backend), store_dir)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest["evaluation"]
+
+
+def require_evaluation(manifest, model_name, backend, hashes):
+    """Raise ValueError unless `manifest` holds a passing evaluation of `backend` for `model_name` over `hashes`."""
+    evaluation = (manifest or {}).get("evaluation") or {}
+    if (evaluation.get("model") == model_name and evaluation.get("backend") == backend
+            and evaluation.get("corpus") == corpus_digest(hashes) and evaluation.get("passed")):
+        return
+    reason = "it failed" if evaluation.get("corpus") == corpus_digest(hashes) else "none was recorded for this model and corpus"
+    raise ValueError(f"The {backend} embedding backend needs a passing `python -m core.embedding_eval --backend {backend}` "
+                     f"({reason}); set ALLOW_UNVALIDATED_BACKENDS=1 to use it anyway")
+
+
+def _write_store(vectors, hashes, model_name, store_dir):
+    vectors_path, manifest_path = store_paths(model_name, store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    # write to temp files first so a crash never leaves a half-written store
+    with open(vectors_path + ".tmp", "wb") as f:
+        np.save(f, vectors)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump({"model": model_name, "pooling": POOLING, "dim": int(vectors.shape[1]), "hashes": hashes}, f)
+    os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+@timed_load
+def load_doc_embeddings(docs, _emb_model, _tokenizer, model_name=DEFAULT_EMBEDDING_MODEL, store_dir=STORE_DIR, backend=None,
+                        unvalidated=False):
+    """
+    Embedding matrix for `docs`, memory-mapped from the store.
+    New or changed advices are embedded and the store is rewritten; unchanged
+    rows are copied from the previous matrix. Each embedding backend has its own store.
+    Backends other than fp32 need a passing evaluation, unvalidated=True (building, evaluating)
+    or ALLOW_UNVALIDATED_BACKENDS=1.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    key = model_key(model_name, backend)
+    vectors_path, _ = store_paths(key, store_dir)
+    hashes = [advice_hash(d) for d in docs]
+    # vectors written by a model of another width (e.g. a test model under this name) are never reused
+    manifest = read_manifest(key, store_dir, dim=getattr(getattr(_emb_model, "config", None), "hidden_size", None))
+    if backend != "fp32" and not (unvalidated or allow_unvalidated()):
+        require_evaluation(manifest, model_name, backend, hashes)
+
+    if manifest is not None and manifest["hashes"] == hashes:
+        return np.load(vectors_path, mmap_mode="r")
+
+    old_rows = {}
+    old_vectors = None
+    if manifest is not None:
+        old_vectors = np.load(vectors_path, mmap_mode="r")
+        old_rows = {h: i for i, h in enumerate(manifest["hashes"])}
+
+    missing = [i for i, h in enumerate(hashes) if h not in old_rows]
+    new_vectors = precompute_doc_embeddings([docs[i] for i in missing], _emb_model, _tokenizer) if missing else None
+
+    if new_vectors is not None:
+        dim = new_vectors.shape[1]
+    elif old_vectors is not None:
+        dim = old_vectors.shape[1]
+    else:
+        # empty corpus and no store yet: an empty matrix of the model's width
+        dim = _emb_model.config.hidden_size
+    vectors = np.empty((len(docs), dim), dtype=np.float32)
+    for j, i in enumerate(missing):
+        vectors[i] = new_vectors[j]
+    for i, h in enumerate(hashes):
+        if h in old_rows:
+            vectors[i] = old_vectors[old_rows[h]]
+    del old_vectors
+
+    _write_store(vectors, hashes, key, store_dir)
+    return np.load(vectors_path, mmap_mode="r")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the advice embedding store.")
+    parser.add_argument("corpus", nargs="?", default=ADVICES_PATH)
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND)
+    args = parser.parse_args(argv)
+
+    docs = load_advices(args.corpus)
+    tokenizer, emb_model = load_embedding_model(args.model, args.backend)
+    vectors = load_doc_embeddings(docs, emb_model, tokenizer, model_name=args.model, store_dir=args.store_dir,
+                                  backend=args.backend, unvalidated=True)
+    print(f"{vectors.shape[0]} advice embeddings ({vectors.shape[1]}d) in {store_paths(model_key(args.model, args.backend), args.store_dir)[0]}")
+
+    # the BM25 index is built with the store so retrieval works before the embedding model loads
+    from core.lexical import lexical_paths, load_lexical_index
+
+    lexical = load_lexical_index(docs, args.store_dir)
+    print(f"{lexical.n_docs} advices, {len(lexical.terms)} terms in {lexical_paths(args.store_dir)[0]}")
+
+
+if __name__ == "__main__":
+    main()
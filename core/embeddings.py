@@ -1,24 +1,182 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
 import numpy as np
-import torch
-from transformers import AutoTokenizer, AutoModel
+
+from core.startup import lazy_import, timed_load
+from core.telemetry import incr, span, traced
+
+# torch and transformers are imported on first use (see core.startup)
+
+DEFAULT_EMBEDDING_MODEL = "abhinand/MedEmbed-base-v0.1"
+# bump when the vector definition changes so stored embeddings are rebuilt
+POOLING = "masked-mean-l2"
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_MAX_LENGTH = int(os.getenv("EMBED_MAX_LENGTH", "512"))
+EMBED_NUM_THREADS = int(os.getenv("EMBED_NUM_THREADS", "0")) or None
+
+# "fp32" runs the model as published, "int8" dynamically quantizes its Linear layers.
+# Only switch after `python -m core.embedding_eval` shows unchanged top-k retrieval.
+EMBEDDING_BACKENDS = ("fp32", "int8")
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "fp32")
+
+# retrieval queries are templated from a small space of predictions, so most repeat
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+
+_threads_lock = threading.Lock()
+
+
+def set_torch_threads(num_threads):
+    """
+    Set torch's intra-op thread count. The setting is process-wide, so it is
+    applied once when a model loads and never swapped per call; with several
+    settings (EMBED_NUM_THREADS, TABPFN_CPU_THREADS) the last model loaded wins.
+    """
+    if not num_threads:
+        return
+    torch = lazy_import("torch")
+    with _threads_lock:
+        if torch.get_num_threads() != num_threads:
+            torch.set_num_threads(num_threads)
+
+
+def encode(texts, emb_model, tokenizer, batch_size=None, max_length=None):
+    """
+    Embed a list of texts in length-bucketed batches.
+    Returns an (n, dim) float32 array of L2-normalized, attention-mask mean-pooled vectors.
+    """
+    batch_size = batch_size or EMBED_BATCH_SIZE
+    max_length = max_length or EMBED_MAX_LENGTH
+
+    out = np.empty((len(texts), emb_model.config.hidden_size), dtype=np.float32)
+    if not texts:
+        return out
+
+    # tokenize once, then sort by length so each batch pads to a similar size
+    encodings = tokenizer(list(texts), truncation=True, max_length=max_length)
+    keys = list(encodings.keys())
+    order = np.argsort([len(ids) for ids in encodings["input_ids"]], kind="stable")
+
+    torch = lazy_import("torch")
+    with span("embed", texts=len(texts)), torch.inference_mode():
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            batch = tokenizer.pad([{k: encodings[k][i] for k in keys} for i in idx], return_tensors="pt")
+            hidden = emb_model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            out[idx] = torch.nn.functional.normalize(pooled, p=2, dim=1).float().numpy()
+    return out
 
 def compute_embedding(text, emb_model, tokenizer):
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True)
-    with torch.no_grad():
-        outputs = emb_model(**inputs)
-    return outputs.last_hidden_state.mean(dim=1).squeeze().numpy()
-
-def load_embedding_model(model_name="abhinand/MedEmbed-base-v0.1"):
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
-    emb_model = AutoModel.from_pretrained(model_name)
+    return encode([text], emb_model, tokenizer)[0]
+
+def model_key(model_name=DEFAULT_EMBEDDING_MODEL, backend=None):
+    """Name under which vectors produced by `model_name` on `backend` are stored."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    return model_name if backend == "fp32" else f"{model_name}+{backend}"
+
+def quantize_int8(emb_model):
+    """Dynamic int8 quantization of every Linear layer (weights int8, activations quantized per batch)."""
+    torch = lazy_import("torch")
+    return torch.ao.quantization.quantize_dynamic(emb_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+@timed_load
+def load_embedding_model(model_name=DEFAULT_EMBEDDING_MODEL, backend=None):
+    backend = backend or EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {EMBEDDING_BACKENDS}")
+    transformers = lazy_import("transformers")
+    set_torch_threads(EMBED_NUM_THREADS)
+    tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
+    emb_model = transformers.AutoModel.from_pretrained(model_name)
+    emb_model.eval()
+    if backend == "int8":
+        emb_model = quantize_int8(emb_model)
     return tokenizer, emb_model
 
 def precompute_doc_embeddings(docs, _emb_model, _tokenizer):
-    return np.array([compute_embedding(d["advice"], _emb_model, _tokenizer) for d in docs])
+    return encode([d["advice"] for d in docs], _emb_model, _tokenizer)
+
+
+# ------------------ retrieval
+
+_query_cache = weakref.WeakKeyDictionary()  # emb_model -> OrderedDict(normalized query -> vector)
+_normalized_docs = {}  # id(doc_embeddings) -> (weakref, row-normalized copy)
+_cache_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Cache key for a query: whitespace-insensitive, otherwise the exact text the model sees."""
+    return " ".join(query.split())
+
+
+def embed_query(query, emb_model, tokenizer):
+    """Query vector, served from a per-model LRU of the last QUERY_CACHE_SIZE distinct queries."""
+    key = normalize_query(query)
+    with _cache_lock:
+        cache = _query_cache.setdefault(emb_model, OrderedDict())
+        vec = cache.get(key)
+        if vec is not None:
+            cache.move_to_end(key)
+    if vec is not None:
+        incr("query_cache_total", result="hit")
+        return vec
+    incr("query_cache_total", result="miss")
+    vec = compute_embedding(key, emb_model, tokenizer)
+    vec.flags.writeable = False
+    with _cache_lock:
+        cache[key] = vec
+        while len(cache) > QUERY_CACHE_SIZE:
+            cache.popitem(last=False)
+    return vec
+
+
+def clear_query_cache():
+    with _cache_lock:
+        _query_cache.clear()
+
+
+def normalized_doc_matrix(doc_embeddings):
+    """Row-normalized float32 copy of `doc_embeddings`, computed once per matrix."""
+    key = id(doc_embeddings)
+    with _cache_lock:
+        entry = _normalized_docs.get(key)
+        if entry is not None and entry[0]() is doc_embeddings:
+            return entry[1]
+    matrix = np.array(doc_embeddings, dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    with _cache_lock:
+        _normalized_docs[key] = (weakref.ref(doc_embeddings, lambda _: _normalized_docs.pop(key, None)), matrix)
+    return matrix
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without sorting the whole array."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def dense_search(query_vec, doc_embeddings, k=3, index=None):
+    """Ids of the k documents closest to `query_vec`, best first."""
+    if index is not None:
+        # vectors are already normalized, so inner product is cosine similarity
+        _, ids = index.search(query_vec[None, :], k)
+        return [int(i) for i in ids[0] if i >= 0]
+    scores = normalized_doc_matrix(doc_embeddings) @ query_vec
+    return [int(i) for i in top_k_indices(scores, k)]
 
 
-def query_docs(query, doc_embeddings, emb_model, tokenizer, advice_docs, k=3):
-    query_vec = compute_embedding(query, emb_model, tokenizer)
-    scores = np.dot(doc_embeddings, query_vec) / (np.linalg.norm(doc_embeddings, axis=1) * np.linalg.norm(query_vec))
-    top_docs = [advice_docs[i] for i in scores.argsort()[-k:][::-1]]
-    return top_docs
\ No newline at end of file
+@traced("retrieve")
+def query_docs(query, doc_embeddings, emb_model, tokenizer, advice_docs, k=3, index=None):
+    query_vec = embed_query(query, emb_model, tokenizer)
+    return [advice_docs[i] for i in dense_search(query_vec, doc_embeddings, k, index)]
@@ -1,41 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
 import numpy as np
 from PyPDF2 import PdfReader
 
-from core.llm_utils import safe_parse_json
+from core.llm_cache import CACHE_PERSIST
+from core.llm_utils import LLMOutputError, llm_generate, safe_parse_json
+from core.predictors import CTG_COLUMNS
+from core.report_parser import LLM_CONFIDENCE, in_range, parse_ctg_report
+from core.telemetry import incr, traced
+
+EXTRACTION_MODEL = "qwen/qwen3-vl-30b-a3b-instruct"
+# bump when text extraction, the prompts or the CTG parser change so cached extractions are not reused
+EXTRACTION_VERSION = "extract-v1"
+# extracted text and fields are patient data: they only go to disk with CACHE_PERSIST=1
+EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", ".cache/extractions")
+EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))
+
+# ------------------ fingerprinting and memoization
+
+def read_pdf_bytes(pdf_file):
+    """Raw bytes of a path, Streamlit UploadedFile, BytesIO or open file."""
+    if isinstance(pdf_file, bytes):
+        return pdf_file
+    if isinstance(pdf_file, (str, os.PathLike)):
+        with open(pdf_file, "rb") as f:
+            return f.read()
+    if hasattr(pdf_file, "getvalue"):
+        return pdf_file.getvalue()
+    position = pdf_file.tell()
+    data = pdf_file.read()
+    pdf_file.seek(position)
+    return data
+
+def fingerprint(data):
+    return hashlib.sha256(data).hexdigest()
+
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+_MEMO_SIZE = 128
+
+def _memo_get(key):
+    with _memo_lock:
+        if key in _memo:
+            _memo.move_to_end(key)
+            incr("extraction_cache_total", result="memory_hit")
+            return _memo[key]
+    path = os.path.join(EXTRACTION_CACHE_DIR, f"{key}.json")
+    if CACHE_PERSIST and os.path.exists(path):
+        if EXTRACTION_CACHE_TTL and time.time() - os.path.getmtime(path) > EXTRACTION_CACHE_TTL:
+            os.remove(path)
+        else:
+            with open(path) as f:
+                value = json.load(f)
+            _memo_put(key, value, persist=False)
+            incr("extraction_cache_total", result="disk_hit")
+            return value
+    incr("extraction_cache_total", result="miss")
+    return None
+
+def _memo_put(key, value, persist=True):
+    with _memo_lock:
+        _memo[key] = value
+        _memo.move_to_end(key)
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    if persist and CACHE_PERSIST:
+        os.makedirs(EXTRACTION_CACHE_DIR, exist_ok=True)
+        path = os.path.join(EXTRACTION_CACHE_DIR, f"{key}.json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(value, f)
+        os.replace(path + ".tmp", path)
 
+def clear_extraction_cache():
+    with _memo_lock:
+        _memo.clear()
+
+# ------------------ extraction
+
+@traced("extract")
 def extract_text(pdf_file):
+    if isinstance(pdf_file, bytes):
+        pdf_file = BytesIO(pdf_file)
     return "".join([page.extract_text() or "" for page in PdfReader(pdf_file).pages])
 
-def extract_miscarriage_from_pdf(pdf_file, client, model="qwen/qwen3-vl-30b-a3b-instruct"):
-    text = extract_text(pdf_file)
-    prompt = "\n".join([
+def cached_extract_text(pdf_file, refresh=False):
+    """PDF text memoized by EXTRACTION_VERSION and the fingerprint of the file's bytes. Returns (fingerprint, text)."""
+    data = read_pdf_bytes(pdf_file)
+    fp = fingerprint(data)
+    key = f"text-{EXTRACTION_VERSION}-{fp}"
+    entry = None if refresh else _memo_get(key)
+    if entry is None:
+        entry = {"text": extract_text(data)}
+        _memo_put(key, entry)
+    return fp, entry["text"]
+
+def _memoized_fields(kind, pdf_file, client, model, extract, refresh):
+    """
+    Structured fields for `pdf_file`, reused per (kind, EXTRACTION_VERSION, model, fingerprint)
+    within the process and, with CACHE_PERSIST=1, across processes via EXTRACTION_CACHE_DIR.
+    refresh=True re-parses the PDF and bypasses the LLM cache.
+    """
+    fp, text = cached_extract_text(pdf_file, refresh=refresh)
+    key = f"{kind}-{EXTRACTION_VERSION}-{fingerprint(model.encode('utf-8'))[:12]}-{fp}"
+    entry = None if refresh else _memo_get(key)
+    if entry is None:
+        entry = {"fields": extract(text, client, model, refresh)}
+        _memo_put(key, entry)
+    return entry["fields"]
+
+def _llm_fields(kind, prompt, client, model, refresh):
+    response = llm_generate(prompt, client, model=model, temp=None, cache=False if refresh else None)
+    try:
+        return safe_parse_json(response)
+    except Exception as e:
+        # still an LLMError, so the service answers 502 rather than 500
+        raise LLMOutputError(f"Could not extract {kind} data: {e}") from e
+
+def miscarriage_prompt(text):
+    return "\n".join([
         f"Extract Miscarriage data as JSON with these features:",
         "['Age', 'BMI', 'Nmisc', 'Activity', 'Binking', 'Walking', 'Drinving', 'Sitting', 'Location', 'temp', 'bpm', 'stress', 'bp', 'Alcohol Comsumption', 'Drunk', 'Miscarriage/ No Miscarriage']",
-        "INPUT:\n{text}"
+        f"INPUT:\n{text}"
         ])
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
-    )
-    try:
-        return safe_parse_json(response.choices[0].message.content)
-    except Exception as e:
-        raise ValueError(f"Could not extract miscarriage data {e}")
 
-def extract_ctg_from_pdf(pdf_file, client, model="qwen/qwen3-vl-30b-a3b-instruct"):
-    text = extract_text(pdf_file)
-    prompt = "\n".join(
+def ctg_prompt(text, features=CTG_COLUMNS):
+    return "\n".join(
         [
         "Extract CTG data as JSON with these features:",
-        "[baseline_value, accelerations, fetal_movement, uterine_contractions, light_decelerations, severe_decelerations, prolongued_decelerations, abnormal_short_term_variability, mean_value_of_short_term_variability, percentage_of_time_with_abnormal_long_term_variability, mean_value_of_long_term_variability, histogram_width, histogram_min, histogram_max, histogram_number_of_peaks, histogram_number_of_zeroes, histogram_mode, histogram_mean, histogram_median, histogram_variance, histogram_tendency]"
+        f"[{', '.join(features)}]",
         f"INPUT:\n{text}"
         ]
     )
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
-    )
-    try:
-        return safe_parse_json(response.choices[0].message.content)
-    except Exception as e:
-        raise ValueError(f"Could not extract CTG data {e}")
+
+def _extract_miscarriage(text, client, model, refresh):
+    return _llm_fields("miscarriage", miscarriage_prompt(text), client, model, refresh)
+
+def _extract_ctg(text, client, model, refresh):
+    """Rule-based parse first; the LLM is only asked for the fields the parser could not resolve."""
+    result = parse_ctg_report(text)
+    if not result["missing"]:
+        return result
+
+    llm_values = _llm_fields("CTG", ctg_prompt(text, result["missing"]), client, model, refresh)
+    for field in list(result["missing"]):
+        value = llm_values.get(field)
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                continue
+        if isinstance(value, (int, float)) and in_range(field, value):
+            result["values"][field] = float(value)
+            result["confidence"][field] = LLM_CONFIDENCE
+            result["missing"].remove(field)
+    return result
+
+def extract_miscarriage_from_pdf(pdf_file, client, model=EXTRACTION_MODEL, refresh=False):
+    return _memoized_fields("miscarriage", pdf_file, client, model, _extract_miscarriage, refresh)
+
+def extract_ctg_fields(pdf_file, client, model=EXTRACTION_MODEL, refresh=False):
+    """CTG features with per-field confidence: {"values", "confidence", "missing"}."""
+    return _memoized_fields("ctg_fields", pdf_file, client, model, _extract_ctg, refresh)
+
+def extract_ctg_from_pdf(pdf_file, client, model=EXTRACTION_MODEL, refresh=False):
+    return extract_ctg_fields(pdf_file, client, model=model, refresh=refresh)["values"]
+
+def extract_ctg_fields_from_text(text, client=None, model=EXTRACTION_MODEL):
+    """Like extract_ctg_fields for already extracted text; without a client only the parser runs."""
+    if client is None:
+        return parse_ctg_report(text)
+    return _extract_ctg(text, client, model, refresh=False)
+
+def extract_miscarriage_from_text(text, client, model=EXTRACTION_MODEL):
+    return _extract_miscarriage(text, client, model, refresh=False)
@@ -0,0 +1,190 @@
+"""
+Array-backed runtime for sklearn random forests.
+
+`export_forest` flattens every tree of a fitted RandomForestClassifier into
+contiguous arrays (feature, threshold, children, leaf class fractions in
+float32) and `CompactForest.predict_proba` walks all trees for all rows at
+once with NumPy, without sklearn's validation or per-estimator dispatch.
+
+Thresholds are rounded down to float32 so that `x <= threshold` on float32
+inputs takes exactly the branch sklearn takes (sklearn casts inputs to
+float32 and compares against float64 thresholds).
+
+    python -m core.forest ml/models/random_forest_model_stillbirth.pkl --check ml/data/fetal_health.csv
+"""
+import argparse
+import pickle
+
+import numpy as np
+import pandas as pd
+
+
+class CompactForest:
+    """Drop-in replacement for RandomForestClassifier.predict_proba/predict."""
+
+    ARRAYS = ("feature", "threshold", "left", "right", "value", "node_weight", "roots")
+
+    def __init__(self, feature, threshold, left, right, value, node_weight, roots, classes, feature_names, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.node_weight = node_weight
+        self.roots = roots
+        self.classes_ = classes
+        self.feature_names_in_ = feature_names
+        self.max_depth = int(max_depth)
+        self.n_features_in_ = len(feature_names) if feature_names is not None else int(feature.max()) + 1
+
+    @property
+    def n_estimators(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.ARRAYS)
+
+    def _as_array(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names_in_ is not None:
+                X = X[list(self.feature_names_in_)]
+            X = X.to_numpy()
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def apply(self, X):
+        """Leaf node index (into the flat arrays) of every row in every tree: shape (rows, trees)."""
+        X = self._as_array(X)
+        rows = np.arange(X.shape[0])[:, None]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            left = self.left[nodes]
+            internal = left >= 0
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(internal, np.where(go_left, left, self.right[nodes]), nodes)
+        return nodes
+
+    def predict_proba(self, X):
+        return self.value[self.apply(X)].mean(axis=1, dtype=np.float64)
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def shap_model(self):
+        """The forest in SHAP's dictionary tree format, for shap.TreeExplainer."""
+        trees = []
+        bounds = list(self.roots) + [len(self.feature)]
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            left = self.left[start:end].astype(np.int32)
+            right = self.right[start:end].astype(np.int32)
+            leaf = left < 0
+            left = np.where(leaf, -1, left - start)
+            right = np.where(leaf, -1, right - start)
+            trees.append({
+                "children_left": left,
+                "children_right": right,
+                "children_default": left.copy(),
+                "features": np.where(leaf, -2, self.feature[start:end]).astype(np.int32),
+                "thresholds": self.threshold[start:end].astype(np.float64),
+                "values": self.value[start:end].astype(np.float64) / self.n_estimators,
+                "node_sample_weight": self.node_weight[start:end].astype(np.float64),
+            })
+        return {"trees": trees, "input_dtype": np.float32, "tree_output": "probability", "objective": "squared_error"}
+
+    def save(self, path):
+        np.savez(
+            path,
+            classes=self.classes_,
+            feature_names=np.array([] if self.feature_names_in_ is None else self.feature_names_in_, dtype=str),
+            max_depth=self.max_depth,
+            **{name: getattr(self, name) for name in self.ARRAYS},
+        )
+
+
+def _round_down_float32(threshold):
+    t32 = threshold.astype(np.float32)
+    too_high = t32.astype(np.float64) > threshold
+    t32[too_high] = np.nextafter(t32[too_high], np.float32(-np.inf))
+    return t32
+
+
+def export_forest(model):
+    """Flatten a fitted sklearn RandomForestClassifier into a CompactForest."""
+    features, thresholds, lefts, rights, values, weights, roots = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        leaf = tree.children_left < 0
+        value = tree.value[:, 0, :].astype(np.float64)
+        value /= np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+
+        roots.append(offset)
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(_round_down_float32(tree.threshold))
+        lefts.append(np.where(leaf, -1, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(leaf, -1, tree.children_right + offset).astype(np.int32))
+        values.append(value.astype(np.float32))
+        weights.append(tree.weighted_n_node_samples.astype(np.float32))
+        max_depth = max(max_depth, tree.max_depth)
+        offset += tree.node_count
+
+    return CompactForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        node_weight=np.concatenate(weights),
+        roots=np.array(roots, dtype=np.int32),
+        classes=np.asarray(model.classes_),
+        feature_names=getattr(model, "feature_names_in_", None),
+        max_depth=max_depth,
+    )
+
+
+def load_compact_forest(path):
+    with np.load(path) as data:
+        arrays = {name: data[name] for name in CompactForest.ARRAYS}
+        feature_names = data["feature_names"]
+        return CompactForest(
+            classes=data["classes"],
+            feature_names=feature_names if len(feature_names) else None,
+            max_depth=int(data["max_depth"]),
+            **arrays,
+        )
+
+
+def check_parity(model, compact, X):
+    """Largest absolute predict_proba difference between sklearn and the compact forest."""
+    return float(np.abs(model.predict_proba(X) - compact.predict_proba(X)).max())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a random forest pickle to a compact .npz forest.")
+    parser.add_argument("model", help="Pickled RandomForestClassifier")
+    parser.add_argument("output", nargs="?", help="Output .npz (default: next to the pickle)")
+    parser.add_argument("--check", help="CSV to compare predict_proba against sklearn on")
+    parser.add_argument("--atol", type=float, default=1e-6)
+    args = parser.parse_args(argv)
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    compact = export_forest(model)
+    output = args.output or args.model.rsplit(".", 1)[0] + ".npz"
+    compact.save(output)
+    print(f"{compact.n_estimators} trees, {len(compact.feature)} nodes, {compact.nbytes / 1e6:.1f} MB -> {output}")
+
+    if args.check:
+        from core.predictors import align_columns
+
+        X = align_columns(pd.read_csv(args.check), list(model.feature_names_in_))
+        diff = check_parity(model, compact, X)
+        print(f"max |predict_proba difference| on {len(X)} rows: {diff:.2e}")
+        if diff > args.atol:
+            raise SystemExit(f"Parity check failed: {diff:.2e} > {args.atol:.0e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Bulk ingestion of report PDFs into a feature table for batch scoring.
+
+    python -m core.ingest reports/ctg/ ctg_features.parquet --kind ctg
+    python -m core.batch ctg_features.parquet scores.parquet --task ctg --keep file
+
+PDFs under the input directory are parsed to text in a process pool. Field
+extraction (the rule-based CTG parser, then the LLM for whatever it could not
+resolve) runs on a bounded thread pool as soon as each text is ready. Every
+finished PDF is appended to `<output>.checkpoint.jsonl`, so an interrupted run
+resumes where it stopped. A PDF is only skipped when its record has the same
+content fingerprint, no error and no missing fields; changed, failed and
+incomplete PDFs are extracted again on the next run.
+
+The output (.csv or .parquet) has a `file` column followed by the model's
+feature columns, one row per fully extracted PDF. PDFs with missing fields or
+errors are listed in `<output>.rejects.csv` instead.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import dotenv
+import pandas as pd
+
+from core.extractors import (
+    EXTRACTION_MODEL, extract_ctg_fields_from_text, extract_miscarriage_from_text, extract_text, fingerprint,
+)
+from core.predictors import CTG_COLUMNS, MISCARRIAGE_COLUMNS
+
+KIND_COLUMNS = {"ctg": CTG_COLUMNS, "miscarriage": MISCARRIAGE_COLUMNS}
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or None
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+
+
+def discover_pdfs(directory):
+    """Paths of every .pdf under `directory`, relative to it and sorted."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return sorted(found)
+
+
+def file_fingerprint(path):
+    with open(path, "rb") as f:
+        return fingerprint(f.read())
+
+
+def read_text(path):
+    """Process-pool task: (fingerprint, text) of one PDF."""
+    with open(path, "rb") as f:
+        data = f.read()
+    return fingerprint(data), extract_text(data)
+
+
+def extract_fields(kind, text, client, model=EXTRACTION_MODEL):
+    """{"values", "missing"} for one report, values restricted to the model's feature columns."""
+    columns = KIND_COLUMNS[kind]
+    if kind == "ctg":
+        result = extract_ctg_fields_from_text(text, client, model)
+        return {"values": {c: result["values"][c] for c in columns if c in result["values"]}, "missing": list(result["missing"])}
+
+    if client is None:
+        raise ValueError("Miscarriage reports need an LLM client")
+    raw = extract_miscarriage_from_text(text, client, model)
+    values, missing = {}, []
+    for c in columns:
+        try:
+            values[c] = float(raw[c])
+        except (KeyError, TypeError, ValueError):
+            missing.append(c)
+    return {"values": values, "missing": missing}
+
+
+# ------------------ checkpoint
+
+def checkpoint_path(output_path):
+    return f"{output_path}.checkpoint.jsonl"
+
+
+def load_checkpoint(path):
+    """Latest record per file from a checkpoint written by `ingest`."""
+    records = {}
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a torn last line from an interrupted run
+                continue
+            records[record["file"]] = record
+    return records
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def is_complete(record, fp):
+    """Whether a checkpoint `record` can stand for a PDF whose bytes have fingerprint `fp`."""
+    return (record.get("fingerprint") == fp and not record.get("error")
+            and not record.get("missing") and "values" in record)
+
+
+# ------------------ ingestion
+
+def ingest(input_dir, output_path, kind="ctg", client=None, model=EXTRACTION_MODEL,
+           workers=None, concurrency=None, on_record=None):
+    """
+    Extract every PDF under `input_dir` without a complete checkpoint record for
+    its current bytes, then write the feature table and rejects file.
+    Returns {"done", "skipped", "rejected"}.
+    """
+    columns = KIND_COLUMNS[kind]
+    checkpoint = checkpoint_path(output_path)
+    records = load_checkpoint(checkpoint)
+    found = discover_pdfs(input_dir)
+    pending = [p for p in found
+               if p not in records or not is_complete(records[p], file_fingerprint(os.path.join(input_dir, p)))]
+    skipped = len(found) - len(pending)
+
+    with open(checkpoint, "a") as log, \
+            ProcessPoolExecutor(max_workers=workers or INGEST_WORKERS) as parsers, \
+            ThreadPoolExecutor(max_workers=concurrency or INGEST_CONCURRENCY) as extractors:
+        if log.tell() and not _ends_with_newline(checkpoint):
+            # end a torn last line so the first new record is not appended to it
+            log.write("\n")
+
+        def finish(record):
+            records[record["file"]] = record
+            log.write(json.dumps(record) + "\n")
+            log.flush()
+            if on_record is not None:
+                on_record(record)
+
+        parsing = {parsers.submit(read_text, os.path.join(input_dir, p)): p for p in pending}
+        extracting = {}
+        while parsing or extracting:
+            done, _ = wait(list(parsing) + list(extracting), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    path = parsing.pop(future)
+                    try:
+                        fp, text = future.result()
+                    except Exception as e:
+                        finish({"file": path, "error": f"{type(e).__name__}: {e}"})
+                        continue
+                    extracting[extractors.submit(extract_fields, kind, text, client, model)] = (path, fp)
+                else:
+                    path, fp = extracting.pop(future)
+                    try:
+                        finish({"file": path, "fingerprint": fp, **future.result()})
+                    except Exception as e:
+                        finish({"file": path, "fingerprint": fp, "error": f"{type(e).__name__}: {e}"})
+
+    rejected = write_outputs(records, output_path, columns)
+    return {"done": len(pending), "skipped": skipped, "rejected": rejected}
+
+
+def write_outputs(records, output_path, columns):
+    """Write complete records as the feature table and the rest as `<output>.rejects.csv`."""
+    rows, rejects = [], []
+    for path in sorted(records):
+        record = records[path]
+        if record.get("error") or record.get("missing"):
+            rejects.append({"file": path, "error": record.get("error", ""), "missing": " ".join(record.get("missing", []))})
+        else:
+            rows.append({"file": path, **{c: record["values"][c] for c in columns}})
+
+    table = pd.DataFrame(rows, columns=["file", *columns])
+    if str(output_path).endswith(".parquet"):
+        table.to_parquet(output_path, index=False)
+    else:
+        table.to_csv(output_path, index=False)
+    pd.DataFrame(rejects, columns=["file", "error", "missing"]).to_csv(f"{output_path}.rejects.csv", index=False)
+    return len(rejects)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract model features from a directory of report PDFs.")
+    parser.add_argument("input", help="Directory searched recursively for .pdf files")
+    parser.add_argument("output", help="Output .csv or .parquet feature table")
+    parser.add_argument("--kind", choices=sorted(KIND_COLUMNS), default="ctg")
+    parser.add_argument("--model", default=EXTRACTION_MODEL, help="LLM used for fields the parser cannot resolve")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Processes parsing PDF text")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY, help="Concurrent field extractions")
+    parser.add_argument("--no-llm", action="store_true", help="CTG only: use the rule-based parser alone")
+    args = parser.parse_args(argv)
+
+    client = None
+    if not args.no_llm:
+        from core.llm_utils import OPENROUTER_BASE_URL, PooledLLMClient
+
+        dotenv.load_dotenv()
+        client = PooledLLMClient(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=OPENROUTER_BASE_URL,
+                                 max_concurrency=args.concurrency)
+
+    start = time.perf_counter()
+    progress = {"n": 0}
+
+    def on_record(record):
+        progress["n"] += 1
+        status = "error" if record.get("error") else f"{len(record.get('missing', []))} missing"
+        print(f"[{progress['n']}] {record['file']}: {status}")
+
+    try:
+        result = ingest(args.input, args.output, kind=args.kind, client=client, model=args.model,
+                        workers=args.workers, concurrency=args.concurrency, on_record=on_record)
+    finally:
+        if client is not None:
+            client.close()
+    elapsed = time.perf_counter() - start
+    print(f"Ingested {result['done']} PDFs in {elapsed:.1f}s ({result['skipped']} already done), "
+          f"{result['rejected']} rejected -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
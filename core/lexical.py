@@ -0,0 +1,250 @@
+"""
+BM25 index over the advices and tiered hybrid retrieval.
+
+The index is a CSR inverted list (term -> advices, with the BM25 weight of
+each posting precomputed), built alongside the embedding store and saved as
+`<store_dir>/advices.bm25.npz`; it is rebuilt when the advice hashes change.
+Scoring a query is a few array additions, with no model involved.
+
+`retrieve_docs` serves a query in one of two tiers:
+- lexical: top-k BM25 advices, used when the embedding model is not loaded
+  yet, when RETRIEVAL_MODE=lexical, or when the median query embedding time
+  over the last RETRIEVAL_BUDGET_WINDOW dense queries exceeds the latency
+  budget (RETRIEVAL_BUDGET_MS). While over budget, every
+  RETRIEVAL_PROBE_EVERY-th query still goes through the dense tier so the
+  window sees fresh timings and the tier can recover.
+- hybrid: the top RERANK_CANDIDATES BM25 advices reranked by cosine similarity
+  to the query embedding, falling back to a full dense search when fewer than
+  k advices share a term with the query
+
+RETRIEVAL_MODE=dense keeps the previous dense-only behaviour.
+
+    python -m core.lexical "prolongued_decelerations histogram_variance"
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from core.embedding_store import ADVICES_PATH, STORE_DIR, advice_hash, corpus_digest, load_advices
+from core.embeddings import dense_search, embed_query, normalized_doc_matrix, top_k_indices
+from core.startup import timed_load
+from core.telemetry import incr, observe, traced
+
+RETRIEVAL_MODES = ("hybrid", "lexical", "dense")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RETRIEVAL_BUDGET_MS = float(os.getenv("RETRIEVAL_BUDGET_MS", "0")) or None
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RETRIEVAL_BUDGET_WINDOW = int(os.getenv("RETRIEVAL_BUDGET_WINDOW", "20"))
+RETRIEVAL_PROBE_EVERY = int(os.getenv("RETRIEVAL_PROBE_EVERY", "10"))
+
+# bump when tokenization or weighting changes so saved indexes are rebuilt
+LEXICAL_VERSION = "bm25-v1"
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from has have if in into is it its of on or that the their them then there
+these this to was were will with you your
+""".split())
+# CTG column spellings -> the words used in the advices
+ALIASES = {"prolongued": "prolonged"}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords; feature names like histogram_variance split into words."""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if token in STOPWORDS or token.isdigit():
+            continue
+        token = ALIASES.get(token, token)
+        # plural folding, so "decelerations" matches "deceleration"
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class LexicalIndex:
+    """BM25 over a fixed corpus: a vocabulary, per-term idf and CSR postings of precomputed weights."""
+
+    ARRAYS = ("terms", "indptr", "doc_ids", "weights")
+
+    def __init__(self, terms, indptr, doc_ids, weights, n_docs):
+        self.terms = terms
+        self.vocab = {t: i for i, t in enumerate(terms.tolist())}
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = int(n_docs)
+
+    @classmethod
+    def build(cls, texts, k1=BM25_K1, b=BM25_B):
+        docs = [Counter(tokenize(t)) for t in texts]
+        lengths = np.array([sum(d.values()) for d in docs], dtype=np.float32)
+        avg_length = max(float(lengths.mean()) if len(docs) else 0.0, 1.0)
+
+        postings = {}
+        for doc_id, counts in enumerate(docs):
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for i, term in enumerate(terms):
+            entries = postings[term]
+            idf = np.log(1 + (len(docs) - len(entries) + 0.5) / (len(entries) + 0.5))
+            for doc_id, tf in entries:
+                norm = k1 * (1 - b + b * lengths[doc_id] / avg_length)
+                doc_ids.append(doc_id)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            indptr[i + 1] = len(doc_ids)
+        return cls(np.array(terms, dtype=str), indptr, np.array(doc_ids, dtype=np.int32),
+                   np.array(weights, dtype=np.float32), len(docs))
+
+    def scores(self, query):
+        """BM25 score of every document for `query`."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term, count in Counter(tokenize(query)).items():
+            i = self.vocab.get(term)
+            if i is None:
+                continue
+            start, end = self.indptr[i], self.indptr[i + 1]
+            scores[self.doc_ids[start:end]] += count * self.weights[start:end]
+        return scores
+
+    def search(self, query, k=3):
+        """Ids of up to k documents sharing a term with `query`, best first."""
+        scores = self.scores(query)
+        return [int(i) for i in top_k_indices(scores, k) if scores[i] > 0]
+
+    def save(self, path):
+        np.savez(path, n_docs=self.n_docs, **{name: getattr(self, name) for name in self.ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(*(data[name] for name in cls.ARRAYS), n_docs=data["n_docs"])
+
+
+def lexical_paths(store_dir=STORE_DIR):
+    base = os.path.join(store_dir, "advices.bm25")
+    return f"{base}.npz", f"{base}.json"
+
+
+@timed_load
+def load_lexical_index(docs, store_dir=STORE_DIR):
+    """BM25 index for `docs`, read from the store when it matches the corpus and rebuilt (and saved) otherwise."""
+    index_path, meta_path = lexical_paths(store_dir)
+    digest = corpus_digest([advice_hash(d) for d in docs])
+    if os.path.exists(index_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("corpus") == digest and meta.get("version") == LEXICAL_VERSION:
+            return LexicalIndex.load(index_path)
+
+    index = LexicalIndex.build([d["advice"] for d in docs])
+    os.makedirs(store_dir, exist_ok=True)
+    # np.savez appends .npz unless the name already ends with it
+    index.save(index_path + ".tmp.npz")
+    os.replace(index_path + ".tmp.npz", index_path)
+    with open(meta_path, "w") as f:
+        json.dump({"version": LEXICAL_VERSION, "corpus": digest, "docs": index.n_docs, "terms": len(index.terms)}, f)
+    return index
+
+
+# ------------------ tiered retrieval
+
+# query embedding times of recent dense-tier queries, apart from corpus encodes
+_embed_times = deque(maxlen=RETRIEVAL_BUDGET_WINDOW)
+_budget_lock = threading.Lock()
+_skipped = {"count": 0}
+
+
+def record_query_embed(seconds):
+    observe("query_embed", seconds)
+    with _budget_lock:
+        _embed_times.append(seconds)
+
+
+def reset_budget():
+    with _budget_lock:
+        _embed_times.clear()
+        _skipped["count"] = 0
+
+
+def dense_over_budget(budget_ms, probe_every=None):
+    """
+    Whether recent query embeddings took longer than `budget_ms` at the median.
+    Every `probe_every`-th over-budget call answers False, so that query probes the dense tier.
+    """
+    if not budget_ms:
+        return False
+    probe_every = RETRIEVAL_PROBE_EVERY if probe_every is None else probe_every
+    with _budget_lock:
+        if not _embed_times or float(np.median(_embed_times)) * 1000 <= budget_ms:
+            _skipped["count"] = 0
+            return False
+        _skipped["count"] += 1
+        if not probe_every or _skipped["count"] < probe_every:
+            return True
+        _skipped["count"] = 0
+    incr("retrieval_probes_total")
+    return False
+
+
+@traced("retrieve")
+def retrieve_docs(query, advice_docs, lexical_index, k=3, dense=None, mode=None, budget_ms=None, candidates=None):
+    """
+    Top-k advices for `query`. `dense` is (doc_embeddings, emb_model, tokenizer, doc_index)
+    once the embedding model is loaded, None before; without it only the lexical tier is served.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+    budget_ms = budget_ms if budget_ms is not None else RETRIEVAL_BUDGET_MS
+
+    if dense is None or mode == "lexical" or (mode == "hybrid" and dense_over_budget(budget_ms)):
+        incr("retrieval_total", tier="lexical")
+        return [advice_docs[i] for i in lexical_index.search(query, k)]
+
+    doc_embeddings, emb_model, tokenizer, doc_index = dense
+    start = time.perf_counter()
+    query_vec = embed_query(query, emb_model, tokenizer)
+    record_query_embed(time.perf_counter() - start)
+    ids = lexical_index.search(query, candidates or RERANK_CANDIDATES) if mode == "hybrid" else []
+    if len(ids) < k:
+        incr("retrieval_total", tier="dense")
+        return [advice_docs[i] for i in dense_search(query_vec, doc_embeddings, k, doc_index)]
+
+    incr("retrieval_total", tier="hybrid")
+    similarity = normalized_doc_matrix(doc_embeddings)[ids] @ query_vec
+    return [advice_docs[ids[j]] for j in top_k_indices(similarity, k)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the BM25 advice index and run a lexical query.")
+    parser.add_argument("query", nargs="?", help="Query to run against the index")
+    parser.add_argument("--corpus", default=ADVICES_PATH)
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    docs = load_advices(args.corpus)
+    index = load_lexical_index(docs, args.store_dir)
+    print(f"{index.n_docs} advices, {len(index.terms)} terms in {lexical_paths(args.store_dir)[0]}")
+    if args.query:
+        scores = index.scores(args.query)
+        for i in index.search(args.query, args.k):
+            print(f"  {scores[i]:6.2f}  {docs[i]['advice']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Local OpenAI-compatible stub server for exercising the LLM client offline.
+
+Answers POST /chat/completions with a canned assessment after an optional
+delay, and can fail a fraction of requests with HTTP 503 to exercise retries.
+
+    python -m core.llm_stub --port 8765 --delay 0.05 --fail-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = json.dumps({
+    "classification": "Normal",
+    "confidence": 90,
+    "reason": "Stub response.",
+    "recommendations": [
+        {"advice": "Continue routine monitoring.", "source": "Stub guideline, page 1"},
+    ],
+})
+
+
+def _make_handler(server_state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with server_state["lock"]:
+                server_state["requests"] += 1
+
+            delay = server_state["delays"].get(request.get("model"), server_state["delay"])
+            if delay:
+                time.sleep(delay)
+            with server_state["lock"]:
+                fail_first = server_state["requests"] <= server_state["fail_first"]
+            if fail_first or random.random() < server_state["fail_rate"]:
+                self._reply(503, {"error": {"message": "stub failure"}})
+                return
+
+            content = server_state["respond"](request)
+            self._reply(200, {
+                "id": "stub",
+                "object": "chat.completion",
+                "model": request.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                # the client gave up on this request (deadline or a winning hedge)
+                pass
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(port=0, delay=0.0, fail_rate=0.0, respond=None, delays=None, fail_first=0):
+    """
+    Serve the stub on 127.0.0.1:`port` (0 picks a free port) in a daemon thread.
+    `respond(request) -> str` customizes the message content, `delays`
+    maps model names to per-model latencies and the first `fail_first`
+    requests always fail. Returns (server, base_url);
+    `server.state["requests"]` counts the requests received.
+    """
+    state = {
+        "lock": threading.Lock(),
+        "requests": 0,
+        "delay": delay,
+        "delays": delays or {},
+        "fail_rate": fail_rate,
+        "fail_first": fail_first,
+        "respond": respond or (lambda request: DEFAULT_RESPONSE),
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", port), _make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible stub server.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    server, url = start_stub_server(args.port, args.delay, args.fail_rate)
+    print(f"Stub LLM listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,32 @@
+import asyncio
 import json
+import os
+import random
 import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+
+import httpx
+import numpy as np
+
+from core.llm_cache import get_default_cache, make_key
+from core.telemetry import incr, span
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class LLMTimeoutError(LLMError, TimeoutError):
+    pass
+
+
+class LLMOutputError(LLMError, ValueError):
+    pass
 
 
 def safe_parse_json(text):
@@ -8,14 +35,244 @@ def safe_parse_json(text):
     except json.JSONDecodeError:
         match = re.search(r'(\{.*\}|\[.*\])', text, re.DOTALL)
         if match:
-            return json.loads(match.group(1))
-    raise ValueError("Failed to parse LLM JSON output.")
+            try:
+                return json.loads(match.group(1))
+            except json.JSONDecodeError:
+                pass
+    raise LLMOutputError("Failed to parse LLM JSON output.")
+
+
+def _complete(prompt, client, model, temp):
+    kwargs = {"temperature": temp} if temp is not None else {}
+    with span("llm", model=model):
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
+            **kwargs,
+        )
+    _count_tokens(model, getattr(response, "usage", None))
+    # PooledLLMClient names the model that answered, which differs when a hedge request wins
+    return response.choices[0].message.content, getattr(response, "answered_by", model)
+
+
+def _count_tokens(model, usage):
+    # openai returns a usage object, PooledLLMClient the raw dict
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(kind) if isinstance(usage, dict) else getattr(usage, kind, None)
+        if value:
+            incr("llm_tokens_total", value, model=model, kind=kind[:-len("_tokens")])
+
+
+def llm_generate(prompt, client, model="openai/gpt-oss-120b", temp=0.2, cache=None):
+    """
+    Chat completion for a single user prompt. Responses are served from
+    `cache` (the process-wide LLMCache by default) when the model, temperature
+    and prompt match a previous call; pass cache=False to always hit the API.
+    """
+    if cache is None:
+        cache = get_default_cache()
+    if not cache:
+        return _complete(prompt, client, model, temp)[0]
+    content = cache.get(make_key(model, temp, prompt))
+    if content is None:
+        content, answered_by = _complete(prompt, client, model, temp)
+        # an answer from the hedge model is cached as that model's, never as `model`'s
+        if content is not None:
+            cache.set(make_key(answered_by, temp, prompt), content)
+    return content
+
+
+# ------------------ pooled client
+
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class PooledLLMClient:
+    """
+    OpenAI-compatible chat client on a shared httpx connection pool.
+
+    Every request has a deadline, transient failures (timeouts, connection
+    errors, 429/5xx) are retried with jittered exponential backoff, and a
+    semaphore caps the number of requests in flight across all callers.
+    With `hedge_model` set, a second request to that model is started when
+    the first has not answered after `hedge_delay` seconds; the first answer
+    wins and the other request is cancelled.
+
+    Async callers use `acomplete`; synchronous callers (and llm_generate) use
+    `client.chat.completions.create(...)`, which runs on a background event
+    loop shared by all threads.
+    """
+
+    def __init__(self, api_key=None, base_url=OPENROUTER_BASE_URL, timeout=None, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, max_concurrency=None, max_connections=32,
+                 hedge_model=None, hedge_delay=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "60"))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.max_connections = max_connections
+        self.hedge_model = hedge_model or os.getenv("LLM_HEDGE_MODEL") or None
+        self.hedge_delay = hedge_delay if hedge_delay is not None else float(os.getenv("LLM_HEDGE_DELAY", "10"))
+
+        self.stats = {"requests": 0, "retries": 0, "timeouts": 0, "failures": 0, "hedges": 0, "hedge_wins": 0}
+        self.latencies = deque(maxlen=1000)
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._http = None
+        self._semaphore = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    # ---- event loop plumbing
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-client", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    def _ensure_http(self):
+        # created lazily so both live on the loop that uses them
+        if self._http is None:
+            headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                timeout=self.timeout,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    def run(self, coro):
+        """Run a coroutine on the client's loop from synchronous code."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._http is not None:
+            self.run(self._http.aclose())
+            self._http = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+    # ---- requests
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+    async def _post(self, payload, deadline):
+        self._ensure_http()
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                async with self._semaphore:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    response = await asyncio.wait_for(
+                        self._http.post("/chat/completions", json=payload), timeout=min(remaining, self.timeout)
+                    )
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    return response.json()
+                last_error = LLMError(f"HTTP {response.status_code} from {payload['model']}")
+            except (asyncio.TimeoutError, httpx.TimeoutException):
+                self.stats["timeouts"] += 1
+                incr("llm_timeouts_total", model=payload["model"])
+                last_error = LLMTimeoutError(f"Request to {payload['model']} timed out")
+            except httpx.TransportError as e:
+                last_error = LLMError(f"Transport error from {payload['model']}: {e}")
+            except httpx.HTTPStatusError as e:
+                raise LLMError(f"HTTP {e.response.status_code} from {payload['model']}: {e.response.text[:200]}") from e
+
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay >= deadline:
+                    break
+                self.stats["retries"] += 1
+                incr("llm_retries_total", model=payload["model"])
+                await asyncio.sleep(delay)
+
+        if last_error is None or deadline - time.monotonic() <= 0:
+            last_error = LLMTimeoutError(f"Deadline exceeded for {payload['model']}")
+        raise last_error
+
+    async def acreate(self, model, messages, timeout=None, **kwargs):
+        """Raw chat completion response (dict) within `timeout` seconds, retries included."""
+        response, _ = await self._acreate(model, messages, timeout, **kwargs)
+        return response
+
+    async def _acreate(self, model, messages, timeout=None, **kwargs):
+        """(response, name of the model that answered)."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        payload = {"model": model, "messages": messages, **kwargs}
+        start = time.perf_counter()
+        self.stats["requests"] += 1
+        try:
+            if not self.hedge_model or self.hedge_model == model:
+                result = await self._post(payload, deadline), model
+            else:
+                result = await self._hedged(payload, deadline)
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def _hedged(self, payload, deadline):
+        primary = asyncio.ensure_future(self._post(payload, deadline))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done:
+            return primary.result(), payload["model"]
+
+        self.stats["hedges"] += 1
+        incr("llm_hedges_total")
+        hedge = asyncio.ensure_future(self._post({**payload, "model": self.hedge_model}, deadline))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        self.stats["hedge_wins"] += 1
+                        return task.result(), self.hedge_model
+                    return task.result(), payload["model"]
+                error = task.exception()
+        raise error
+
+    async def acomplete(self, prompt, model, temperature=None, timeout=None):
+        """Text of a single-prompt completion."""
+        kwargs = {"temperature": temperature} if temperature is not None else {}
+        messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+        response = await self.acreate(model, messages, timeout=timeout, **kwargs)
+        return response["choices"][0]["message"]["content"]
 
+    def _create(self, model, messages, timeout=None, **kwargs):
+        response, answered_by = self.run(self._acreate(model, messages, timeout=timeout, **kwargs))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=c["message"]["content"]))
+                     for c in response["choices"]],
+            usage=response.get("usage"),
+            answered_by=answered_by,
+        )
 
-def llm_generate(prompt, client, model="openai/gpt-oss-120b", temp=0.2):
-    response = client.chat.completions.create(
-        model=model,
-        messages=[{"role": "user", "content": [{"type": "text", "text": prompt}]}],
-        temperature=temp,
-    )
-    return response.choices[0].message.content
+    def latency_percentiles(self, percentiles=(50, 90, 99)):
+        """Latency in seconds at the given percentiles over the last 1000 successful requests."""
+        if not self.latencies:
+            return {}
+        values = np.percentile(np.fromiter(self.latencies, dtype=float), percentiles)
+        return {f"p{p}": float(v) for p, v in zip(percentiles, values)}
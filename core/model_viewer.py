@@ -2,52 +2,30 @@ import streamlit as st
 import streamlit.components.v1 as components
 import os
 import base64
-import threading
-import http.server
-import socketserver
 import functools
 
+from core.static_server import asset_url
 
-@st.cache_resource
-def _start_static_server(path, port=8504):
-    """Start a tiny HTTP server serving the directory containing `path` on localhost:port.
-    Returns the URL to the file (http) or None if server couldn't be started.
-    Cached so it only runs once per Streamlit session.
+
+def _start_static_server(path, port=None):
+    """Versioned URL to `path` on the process-wide threaded asset server, or None if it is missing.
+    The server binds a free localhost port unless `port` is given and is reused across sessions.
     """
     if not os.path.exists(path):
         return None
+    return asset_url(path, port=port or 0)
 
-    serve_dir = os.path.dirname(os.path.abspath(path)) or "."
-
-    class CORSRequestHandler(http.server.SimpleHTTPRequestHandler):
-        def end_headers(self):
-            # Allow cross-origin so model-viewer in iframe can fetch the GLB
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.send_header("Access-Control-Allow-Methods", "GET, OPTIONS")
-            self.send_header("Access-Control-Allow-Headers", "*")
-            super().end_headers()
-
-        def log_message(self, format, *args):
-            # Suppress server logs
-            pass
 
-    handler = functools.partial(CORSRequestHandler, directory=serve_dir)
+@functools.lru_cache(maxsize=4)
+def _encode_base64(path, mtime_ns):
+    with open(path, "rb") as f:
+        return base64.b64encode(f.read()).decode("utf-8")
 
-    def _run():
-        try:
-            socketserver.TCPServer.allow_reuse_address = True
-            with socketserver.TCPServer(("127.0.0.1", port), handler) as httpd:
-                print(f"✓ Static server started on port {port}")
-                httpd.serve_forever()
-        except Exception as e:
-            print(f"Static server error on port {port}: {e}")
-
-    thread = threading.Thread(target=_run, daemon=True)
-    thread.start()
-    import time
 
-    time.sleep(0.5)  # Give server time to start
-    return f"http://127.0.0.1:{port}/{os.path.basename(path)}"
+def _base64_src(path):
+    """data: URI for `path`, encoded once per file version (mtime)."""
+    path = os.path.abspath(path)
+    return f"data:model/gltf-binary;base64,{_encode_base64(path, os.stat(path).st_mtime_ns)}"
 
 
 def render_3d_model(
@@ -57,7 +35,7 @@ def render_3d_model(
     show_debug=False,
     custom_colors=None,
     custom_labels=None,
-    server_port=8504,
+    server_port=None,
 ):
     """
     Render a 3D model with colored spotlight based on risk level.
@@ -77,7 +55,7 @@ def render_3d_model(
     custom_labels : dict, optional
         Custom label mapping {0: "SAFE", 1: "SUSPICIOUS", 2: "HIGH RISK"}
     server_port : int, optional
-        Port for local HTTP server (default: 8504)
+        Port for local HTTP server (default: a free port)
 
     Returns:
     --------
@@ -114,13 +92,13 @@ def render_3d_model(
 
     # Serve the GLB over HTTP (more reliable than base64 for large files)
     try:
-        src = _start_static_server(model_path, port=server_port)
+        try:
+            src = _start_static_server(model_path, port=server_port)
+        except OSError:
+            src = None
         if not src:
             st.warning("HTTP server failed, falling back to base64 encoding...")
-            with open(model_path, "rb") as f:
-                model_bytes = f.read()
-            b64 = base64.b64encode(model_bytes).decode("utf-8")
-            src = f"data:model/gltf-binary;base64,{b64}"
+            src = _base64_src(model_path)
     except Exception as e:
         st.error(f"Failed to load model: {e}")
         return
@@ -0,0 +1,146 @@
+"""
+Dependency-graph execution of the assessment stages.
+
+Each stage is a function whose keyword arguments are the results of the
+stages it depends on. A stage is submitted to a shared thread pool as soon as
+all of its dependencies have finished, so independent stages overlap and the
+end-to-end latency approaches the longest dependency chain instead of the sum
+of all stages. `run` returns a Future per stage that callers can wait on.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide thread pool shared by all pipelines."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+        return _executor
+
+
+class Pipeline:
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.stages = {}
+
+    def add(self, name, fn, deps=()):
+        """Register stage `name`; `fn` is called with one keyword argument per dependency."""
+        if name in self.stages:
+            raise ValueError(f"Stage {name!r} already defined")
+        self.stages[name] = (fn, tuple(deps))
+        return self
+
+    def _check(self, inputs):
+        overlap = sorted(set(self.stages) & set(inputs))
+        if overlap:
+            raise ValueError(f"Inputs {overlap} have the names of stages; a value is either an input or a stage's result")
+        known = set(self.stages) | set(inputs)
+        for name, (_, deps) in self.stages.items():
+            unknown = [d for d in deps if d not in known]
+            if unknown:
+                raise ValueError(f"Stage {name!r} depends on unknown stages {unknown}")
+
+        # depth-first search for cycles
+        state = {}
+
+        def visit(name, path):
+            if state.get(name) == "done" or name in inputs:
+                return
+            if state.get(name) == "active":
+                raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+            state[name] = "active"
+            for dep in self.stages[name][1]:
+                visit(dep, path + [name])
+            state[name] = "done"
+
+        for name in self.stages:
+            visit(name, [])
+
+    def run(self, **inputs):
+        """
+        Start every stage and return {name: Future}. Keyword arguments seed
+        already-known values that stages may depend on by name.
+        """
+        self._check(inputs)
+        executor = self.executor or get_executor()
+        futures = {name: Future() for name in self.stages}
+        for name, value in inputs.items():
+            futures[name] = Future()
+            futures[name].set_result(value)
+
+        def launch(name):
+            fn, deps = self.stages[name]
+            target = futures[name]
+            # a failed dependency fails this stage with the original error
+            for dep in deps:
+                if futures[dep].exception() is not None:
+                    target.set_exception(futures[dep].exception())
+                    return
+
+            def call():
+                if not target.set_running_or_notify_cancel():
+                    return
+                try:
+                    target.set_result(fn(**{d: futures[d].result() for d in deps}))
+                except BaseException as e:
+                    target.set_exception(e)
+
+            executor.submit(call)
+
+        for name, (_, deps) in self.stages.items():
+            if not deps:
+                launch(name)
+                continue
+            remaining = {"count": len(set(deps))}
+            lock = threading.Lock()
+
+            def on_done(_, name=name, remaining=remaining, lock=lock):
+                with lock:
+                    remaining["count"] -= 1
+                    ready = remaining["count"] == 0
+                if ready:
+                    launch(name)
+
+            for dep in set(deps):
+                futures[dep].add_done_callback(on_done)
+        return futures
+
+
+def run_assessment(patient_data, predict, make_query, retrieve, risk_system,
+                   render=None, warm_retrieval=None, warm_render=None, executor=None):
+    """
+    Futures for one assessment:
+    - prediction = predict(patient_data)
+    - query = make_query(prediction)
+    - advices = retrieve(query)
+    - report = risk_system(advices, prediction)
+    - pdf = render(report), when `render` is given
+    `warm_retrieval` (e.g. loading the index) and `warm_render` (e.g. preparing
+    the PDF template) run alongside model inference and gate the stage they warm.
+    """
+    pipeline = Pipeline(executor)
+    pipeline.add("prediction", lambda: predict(patient_data))
+    pipeline.add("query", lambda prediction: make_query(prediction), deps=["prediction"])
+
+    retrieval_deps = ["query"]
+    if warm_retrieval is not None:
+        pipeline.add("warm_retrieval", warm_retrieval)
+        retrieval_deps.append("warm_retrieval")
+    pipeline.add("advices", lambda query, **_: retrieve(query), deps=retrieval_deps)
+    pipeline.add("report", lambda advices, prediction: risk_system(advices, prediction), deps=["advices", "prediction"])
+
+    if render is not None:
+        render_deps = ["report"]
+        if warm_render is not None:
+            pipeline.add("warm_render", warm_render)
+            render_deps.append("warm_render")
+        pipeline.add("pdf", lambda report, **_: render(report), deps=render_deps)
+    return pipeline.run()
@@ -1,21 +1,25 @@
 import numpy as np
-import tabpfn
-import shap
 import pandas as pd
-import xgboost as xgb
 import pickle
+import functools
+import os
 
-from core.embeddings import compute_embedding
+from core.forest import CompactForest, export_forest, load_compact_forest
 from core.llm_utils import llm_generate, safe_parse_json
+from core.startup import lazy_import, timed_load
+from core.telemetry import log_payload, span
+
+# shap, xgboost and tabpfn are imported on first use (see core.startup)
 
 # ------------------ model loaders
 
-def load_tabpfn(model_path):
-    model = tabpfn.TabPFNClassifier()
-    model.load_from_fit_state(model_path)
-    return model
+def load_tabpfn(model_path, device="auto"):
+    tabpfn = lazy_import("tabpfn")
+    # load_from_fit_state is a classmethod returning the fitted classifier
+    return tabpfn.TabPFNClassifier.load_from_fit_state(model_path, device=device)
 
 def load_xgboost(model_path):
+    xgb = lazy_import("xgboost")
     model = xgb.XGBClassifier()
     model.load_model(model_path)
     return model
@@ -24,115 +28,239 @@ def load_pickle(model_path):
     with open(model_path, 'rb') as f:
         return pickle.load(f)
 
-def load_ctg_model():
-    model = load_pickle('ml/models/random_forest_model_stillbirth.pkl')
+# "sklearn" unpickles the RandomForestClassifier, "compact" uses the array-backed core.forest runtime
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "sklearn")
+
+def load_forest(model_path, backend=None):
+    backend = backend or MODEL_BACKEND
+    if backend == "sklearn":
+        return load_pickle(model_path)
+    if backend != "compact":
+        raise ValueError(f"Unknown model backend {backend!r}, expected 'sklearn' or 'compact'")
+    # exported once next to the pickle, re-exported when the pickle is newer
+    compact_path = os.path.splitext(model_path)[0] + '.npz'
+    if os.path.exists(compact_path) and os.path.getmtime(compact_path) >= os.path.getmtime(model_path):
+        return load_compact_forest(compact_path)
+    model = export_forest(load_pickle(model_path))
+    model.save(compact_path)
+    return model
+
+@timed_load
+def load_ctg_model(backend=None):
+    model = load_forest('ml/models/random_forest_model_stillbirth.pkl', backend)
     return model
 
-def load_miscarriage_model():
-    model = load_pickle('ml/models/random_forest_model_miscarriage.pkl')
+@timed_load
+def load_miscarriage_model(backend=None):
+    model = load_forest('ml/models/random_forest_model_miscarriage.pkl', backend)
+    return model
+
+@timed_load
+def load_ctg_xgboost():
+    model = load_xgboost('ml/models/fetal_xgb_model.json')
+    # trained on the Kaggle header ('baseline value'); inputs use the app's column names
+    model.get_booster().feature_names = list(CTG_COLUMNS)
     return model
 
 def load_early_fetal_loss_model():
     model = load_pickle('')
     return model
 
-def predict_ctg(model, patient_data):
-    class_map = {0: "Normal", 1: "Suspect", 2: "Pathological"}
+# ------------------ feature schemas
+CTG_COLUMNS = [
+    "baseline_value", "accelerations", "fetal_movement", "uterine_contractions",
+    "light_decelerations", "severe_decelerations", "prolongued_decelerations",
+    "abnormal_short_term_variability", "mean_value_of_short_term_variability",
+    "percentage_of_time_with_abnormal_long_term_variability",
+    "mean_value_of_long_term_variability", "histogram_width", "histogram_min",
+    "histogram_max", "histogram_number_of_peaks", "histogram_number_of_zeroes",
+    "histogram_mode", "histogram_mean", "histogram_median", "histogram_variance",
+    "histogram_tendency"
+]
+
+MISCARRIAGE_COLUMNS = [
+    "Age", "BMI", "Nmisc", "Activity", "Binking", "Walking", "Drinving", "Sitting",
+    "Location", "temp", "bpm", "stress", "bp", "Alcohol Comsumption", "Drunk"
+]
+
+CTG_CLASS_MAP = {0: "Normal", 1: "Suspect", 2: "Pathological"}
+MISCARRIAGE_CLASS_MAP = {0: "Normal", 1: "High Risk"}
+
+# (class name, shap value > 0) -> recommendation template
+RECOMMENDATION_TEMPLATES = {
+    ("Normal", True): "{feature} ({value}) supports normal fetal health.",
+    ("Normal", False): "{feature} ({value}) slightly reduces reassurance, monitor routinely.",
+    ("Suspect", True): "{feature} ({value}) increases risk; closer monitoring recommended.",
+    ("Suspect", False): "{feature} ({value}) slightly reduces risk, but patient still at suspect level.",
+    ("Pathological", True): "{feature} ({value}) strongly indicates high risk; urgent monitoring/intervention required.",
+    ("Pathological", False): "{feature} ({value}) reduces risk but patient still at pathological level.",
+    ("High Risk", True): "{feature} ({value}) increases risk; closer monitoring recommended.",
+    ("High Risk", False): "{feature} ({value}) reduces risk, but patient still at suspect level.",
+}
+
+# ------------------ prediction
+
+def normalize_column(name):
+    return name.strip().replace(" ", "_").lower()
+
+def align_columns(df, columns):
+    """Select `columns` from `df`, matching headers like 'baseline value' to 'baseline_value'."""
+    lookup = {normalize_column(c): c for c in df.columns}
+    missing = [c for c in columns if normalize_column(c) not in lookup]
+    if missing:
+        raise ValueError(f"Input is missing columns: {missing}")
+    features = df[[lookup[normalize_column(c)] for c in columns]]
+    features.columns = columns
+    return features
+
+# ------------------ training data
+CTG_BACKGROUND_PATH = 'ml/data/fetal_health.csv'
+
+def ctg_split(path=CTG_BACKGROUND_PATH, test_size=0.2, seed=42):
+    """(x_train, x_test, y_train, y_test) of the training CSV with 0-based classes, split as in the notebooks."""
+    from sklearn.model_selection import train_test_split
+
+    data = pd.read_csv(path)
+    features = align_columns(data, CTG_COLUMNS)
+    labels = data["fetal_health"].astype(int) - 1
+    return train_test_split(features, labels, test_size=test_size, random_state=seed, stratify=labels)
+
+# ------------------ explainers
+
+def load_background(path=CTG_BACKGROUND_PATH, columns=CTG_COLUMNS, n_samples=100, seed=0):
+    """Fixed background sample for interventional SHAP, drawn once from the training CSV."""
+    shap = lazy_import("shap")
+    data = align_columns(pd.read_csv(path), columns)
+    return shap.utils.sample(data, min(n_samples, len(data)), random_state=seed)
+
+def load_explainer(model, background=None):
+    """
+    Tree explainer for forest/boosting models: path-dependent when no background
+    is given, interventional against `background` otherwise. Anything else falls
+    back to the model-agnostic explainer over the same background.
+    """
+    shap = lazy_import("shap")
+    if isinstance(model, CompactForest):
+        model = model.shap_model()
+    is_booster = type(model).__module__.split(".")[0] == "xgboost"
+    if isinstance(model, dict) or hasattr(model, "estimators_") or is_booster:
+        if background is None:
+            return shap.TreeExplainer(model)
+        return shap.TreeExplainer(model, data=background, feature_perturbation="interventional")
+    if background is None:
+        raise ValueError(f"A background sample is required to explain {type(model).__name__}")
+    return shap.Explainer(model.predict_proba, background)
+
+@functools.lru_cache(maxsize=None)
+@timed_load
+def load_ctg_explainer(model):
+    return load_explainer(model, load_background())
+
+@functools.lru_cache(maxsize=None)
+@timed_load
+def load_miscarriage_explainer(model):
+    return load_explainer(model)
+
+def explain(explainer, patient_data):
+    """SHAP values for every row as an array of shape (rows, features, classes)."""
+    shap = lazy_import("shap")
+    if isinstance(explainer, shap.TreeExplainer):
+        values = explainer.shap_values(patient_data, check_additivity=False)
+    else:
+        values = explainer(patient_data).values
+    if isinstance(values, list):
+        values = np.stack(values, axis=-1)
+    if values.ndim == 2:
+        # single-output binary model: attributions for class 1, mirrored for class 0
+        values = np.stack([-values, values], axis=-1)
+    return values
+
+def predict_batch(model, patient_data, class_map, explainer, top_k=3):
+    """
+    Score a DataFrame of patients with a single predict_proba/SHAP pass.
+    Returns a dict of arrays, one entry per row.
+    """
+    n_rows = len(patient_data)
+    rows = np.arange(n_rows)[:, None]
+
     # 1️⃣ Predict probabilities and class
-    probs = model.predict_proba(patient_data)[0]
-    pred_class_idx = int(np.argmax(probs))
-    pred_class_name = class_map[pred_class_idx]
-
-    # 2️⃣ Compute SHAP values for this patient
-    explainer = shap.Explainer(model.predict_proba, patient_data)
-
-    shap_values = explainer(patient_data)
-    shap_vals_for_class = shap_values[:, :, pred_class_idx].values[0]
-
-    # 3️⃣ Create a dataframe for features and SHAP values
-    feature_df = pd.DataFrame({
-        "feature": patient_data.columns,
-        "shap_value": shap_vals_for_class,
-        "feature_value": patient_data.iloc[0].values
-    }).sort_values(by="shap_value", key=abs, ascending=False)
-
-    # 4️⃣ Top 3 most important features
-    top_features = feature_df.head(3)
-
-    # 5️⃣ Generate recommendations based on SHAP values and class
-    recommendations = []
-    for idx, row in top_features.iterrows():
-        feature, value, shap_val = row['feature'], row['feature_value'], row['shap_value']
-        if pred_class_name == "Normal":
-            # Positive features reassuring
-            if shap_val > 0:
-                recommendations.append(f"{feature} ({value}) supports normal fetal health.")
-            else:
-                recommendations.append(f"{feature} ({value}) slightly reduces reassurance, monitor routinely.")
-        elif pred_class_name == "Suspect":
-            if shap_val > 0:
-                recommendations.append(f"{feature} ({value}) increases risk; closer monitoring recommended.")
-            else:
-                recommendations.append(f"{feature} ({value}) slightly reduces risk, but patient still at suspect level.")
-        elif pred_class_name == "Pathological":
-            if shap_val > 0:
-                recommendations.append(f"{feature} ({value}) strongly indicates high risk; urgent monitoring/intervention required.")
-            else:
-                recommendations.append(f"{feature} ({value}) reduces risk but patient still at pathological level.")
-
-    # 6️⃣ Output
+    with span("predict", rows=n_rows):
+        probs = model.predict_proba(patient_data)
+    pred_idx = probs.argmax(axis=1)
+    class_names = np.array([class_map[int(i)] for i in pred_idx], dtype=object)
+
+    # 2️⃣ SHAP values for the predicted class of every row
+    with span("explain", rows=n_rows):
+        shap_vals = explain(explainer, patient_data)[np.arange(n_rows), :, pred_idx]
+
+    # 3️⃣ Top-k features by absolute SHAP value
+    top_idx = np.argsort(-np.abs(shap_vals), axis=1, kind="stable")[:, :top_k]
+    features = np.asarray(patient_data.columns, dtype=object)
+    values = patient_data.to_numpy()
+    top_features = features[top_idx]
+    top_values = values[rows, top_idx]
+    top_shap = shap_vals[rows, top_idx]
+
+    # 4️⃣ Recommendations from (class, sign) templates
+    positive = top_shap > 0
+    recommendations = [
+        [
+            RECOMMENDATION_TEMPLATES[(class_names[r], bool(positive[r, j]))].format(
+                feature=top_features[r, j], value=top_values[r, j]
+            )
+            for j in range(top_idx.shape[1])
+        ]
+        for r in range(n_rows)
+    ]
+
     return {
-        "predicted_class": pred_class_name,
+        "predicted_class": class_names,
         "predicted_probabilities": probs,
+        "top_index": top_idx,
         "top_features": top_features,
-        "recommendations": recommendations
+        "top_values": top_values,
+        "top_shap": top_shap,
+        "recommendations": recommendations,
     }
 
-def predict_miscarriage(model, patient_data):
-    class_map = {0: "Normal", 1: "High Risk"}
-    # 1️⃣ Predict probabilities and class
-    probs = model.predict_proba(patient_data)[0]
-    pred_class_idx = int(np.argmax(probs))
-    pred_class_name = class_map[pred_class_idx]
-
-    # 2️⃣ Compute SHAP values for this patient
-    explainer = shap.Explainer(model.predict_proba, patient_data)
-
-    shap_values = explainer(patient_data)
-    shap_vals_for_class = shap_values[:, :, pred_class_idx].values[0]
-
-    # 3️⃣ Create a dataframe for features and SHAP values
-    feature_df = pd.DataFrame({
-        "feature": patient_data.columns,
-        "shap_value": shap_vals_for_class,
-        "feature_value": patient_data.iloc[0].values
-    }).sort_values(by="shap_value", key=abs, ascending=False)
-
-    # 4️⃣ Top 3 most important features
-    top_features = feature_df.head(3)
-
-    # 5️⃣ Generate recommendations based on SHAP values and class
-    recommendations = []
-    for idx, row in top_features.iterrows():
-        feature, value, shap_val = row['feature'], row['feature_value'], row['shap_value']
-        if pred_class_name == "Normal":
-            # Positive features reassuring
-            if shap_val > 0:
-                recommendations.append(f"{feature} ({value}) supports normal fetal health.")
-            else:
-                recommendations.append(f"{feature} ({value}) slightly reduces reassurance, monitor routinely.")
-        elif pred_class_name == "High Risk":
-            if shap_val > 0:
-                recommendations.append(f"{feature} ({value}) increases risk; closer monitoring recommended.")
-            else:
-                recommendations.append(f"{feature} ({value}) reduces risk, but patient still at suspect level.")
-
-    # 6️⃣ Output
+def row_output(batch, row=0):
+    """The predict_ctg/predict_miscarriage result for one row of a predict_batch result."""
+    top_features = pd.DataFrame({
+        "feature": batch["top_features"][row],
+        "shap_value": batch["top_shap"][row],
+        "feature_value": batch["top_values"][row],
+    }, index=batch["top_index"][row])
     return {
-        "predicted_class": pred_class_name,
-        "predicted_probabilities": probs,
+        "predicted_class": batch["predicted_class"][row],
+        "predicted_probabilities": batch["predicted_probabilities"][row],
         "top_features": top_features,
-        "recommendations": recommendations
+        "recommendations": batch["recommendations"][row],
+    }
+
+def predict_ctg(model, patient_data, explainer=None):
+    explainer = explainer or load_ctg_explainer(model)
+    return row_output(predict_batch(model, patient_data, CTG_CLASS_MAP, explainer))
+
+def predict_miscarriage(model, patient_data, explainer=None):
+    explainer = explainer or load_miscarriage_explainer(model)
+    return row_output(predict_batch(model, patient_data, MISCARRIAGE_CLASS_MAP, explainer))
+
+def ctg_query(ctg_output):
+    return f"CTG Prediction: {ctg_output['predicted_class']}, top features: {ctg_output['top_features']}, recommendations: {ctg_output['recommendations']}"
+
+def miscarriage_query(miscarriage_output):
+    return f"Miscarriage Output: {miscarriage_output}"
+
+def prediction_to_json(output):
+    """JSON-serializable copy of a predict_ctg/predict_miscarriage result."""
+    return {
+        "predicted_class": str(output["predicted_class"]),
+        "predicted_probabilities": [float(p) for p in output["predicted_probabilities"]],
+        "top_features": [
+            {"feature": r.feature, "shap_value": float(r.shap_value), "feature_value": float(r.feature_value)}
+            for r in output["top_features"].itertuples()
+        ],
+        "recommendations": list(output["recommendations"]),
     }
 
 # ------------------ RISK SYSTEMS
@@ -168,10 +296,10 @@ def run_risk_system_ctg(top_advices, ctg_pred, client):
     references = "\n".join([f"{d['advice']} (Source: {d['source']}, Page: {d['page_number']})" for i, d in enumerate(top_advices)])
     input_prompt = f"Clinical summary:\nCTG Result: {ctg_pred}\nReferences:\n{references}"
     prompt = "\n".join([BASE_PROMPT, input_prompt])
-    print(f"-------------------\nPROMPT:\n{prompt} ")
+    log_payload("prompt", prompt)
 
     llm_text = llm_generate(prompt, client)
-    print(f"LLM RESPONSE:\n{llm_text}")
+    log_payload("response", llm_text)
     json_response = safe_parse_json(llm_text)
     return json_response
 
@@ -181,9 +309,9 @@ def run_risk_system_miscarriage(top_advices, miscarriage_result, client):
     references = "\n".join([f"{d['advice']} (Source: {d['source']}, Page: {d['page_number']})" for i, d in enumerate(top_advices)])
     input_prompt = f"Clinical summary:\nMiscarriage Result: {miscarriage_result}\nReferences:\n{references}"
     prompt = "\n".join([BASE_PROMPT, input_prompt])
-    print(f"-------------------\nPROMPT:\n{prompt} ")
+    log_payload("prompt", prompt)
 
     llm_text = llm_generate(prompt, client)
-    print(f"LLM RESPONSE:\n{llm_text}")
+    log_payload("response", llm_text)
     json_response = safe_parse_json(llm_text)
     return json_response
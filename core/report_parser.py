@@ -0,0 +1,139 @@
+"""
+Deterministic parser for CTG feature reports.
+
+Reports like input/CTG_Feature_Report.pdf list one "<label> <value>" pair per
+line. Labels are matched against CTG_COLUMNS, their spaced variants and the
+UCI CTG abbreviations (LB, ASTV, ...), and values are checked against
+physiological ranges. Generic labels such as "Min" or "Variance" only name a
+histogram feature inside a histogram section (after a heading line mentioning
+"histogram"); elsewhere they are ignored. Each resolved field carries a confidence in [0, 1];
+fields that cannot be resolved are listed in "missing" so only those need an
+LLM fallback.
+"""
+import re
+
+from core.predictors import CTG_COLUMNS
+
+# (low, high) accepted for each feature; rates are per second as in fetal_health.csv
+CTG_RANGES = {
+    "baseline_value": (50, 240),
+    "accelerations": (0, 1),
+    "fetal_movement": (0, 1),
+    "uterine_contractions": (0, 1),
+    "light_decelerations": (0, 1),
+    "severe_decelerations": (0, 1),
+    "prolongued_decelerations": (0, 1),
+    "abnormal_short_term_variability": (0, 100),
+    "mean_value_of_short_term_variability": (0, 20),
+    "percentage_of_time_with_abnormal_long_term_variability": (0, 100),
+    "mean_value_of_long_term_variability": (0, 100),
+    "histogram_width": (0, 250),
+    "histogram_min": (0, 250),
+    "histogram_max": (0, 300),
+    "histogram_number_of_peaks": (0, 50),
+    "histogram_number_of_zeroes": (0, 50),
+    "histogram_mode": (0, 300),
+    "histogram_mean": (0, 300),
+    "histogram_median": (0, 300),
+    "histogram_variance": (0, 1000),
+    "histogram_tendency": (-1, 1),
+}
+
+# abbreviations used by the UCI cardiotocography dataset and common CTG printouts
+CTG_ALIASES = {
+    "lb": "baseline_value",
+    "baseline": "baseline_value",
+    "baseline_fhr": "baseline_value",
+    "ac": "accelerations",
+    "fm": "fetal_movement",
+    "uc": "uterine_contractions",
+    "dl": "light_decelerations",
+    "ds": "severe_decelerations",
+    "dp": "prolongued_decelerations",
+    "prolonged_decelerations": "prolongued_decelerations",
+    "astv": "abnormal_short_term_variability",
+    "mstv": "mean_value_of_short_term_variability",
+    "altv": "percentage_of_time_with_abnormal_long_term_variability",
+    "mltv": "mean_value_of_long_term_variability",
+    "nmax": "histogram_number_of_peaks",
+    "nzeros": "histogram_number_of_zeroes",
+}
+
+# labels that name a histogram feature only under a histogram heading
+HISTOGRAM_ALIASES = {
+    "width": "histogram_width",
+    "min": "histogram_min",
+    "max": "histogram_max",
+    "peaks": "histogram_number_of_peaks",
+    "zeroes": "histogram_number_of_zeroes",
+    "zeros": "histogram_number_of_zeroes",
+    "mode": "histogram_mode",
+    "mean": "histogram_mean",
+    "median": "histogram_median",
+    "variance": "histogram_variance",
+    "tendency": "histogram_tendency",
+}
+
+EXACT_CONFIDENCE = 1.0
+ALIAS_CONFIDENCE = 0.9
+# assigned by callers to values recovered through the LLM fallback
+LLM_CONFIDENCE = 0.5
+
+_LINE = re.compile(
+    r"^\s*(?P<label>[A-Za-z][A-Za-z0-9_ ()/%-]*?)\s*[:=|\t]?\s*(?P<value>[-+]?\d+(?:\.\d+)?)\s*(?:[A-Za-z/%]+)?\s*$"
+)
+
+
+def normalize_label(label):
+    label = re.sub(r"\(.*?\)", "", label)
+    return re.sub(r"[^a-z0-9]+", "_", label.lower()).strip("_")
+
+
+def resolve_label(label, in_histogram=False):
+    """(column, confidence) for a report label, or (None, 0.0) if unknown."""
+    key = normalize_label(label)
+    if key in CTG_RANGES:
+        return key, EXACT_CONFIDENCE
+    if key in CTG_ALIASES:
+        return CTG_ALIASES[key], ALIAS_CONFIDENCE
+    if in_histogram and key in HISTOGRAM_ALIASES:
+        return HISTOGRAM_ALIASES[key], ALIAS_CONFIDENCE
+    return None, 0.0
+
+
+def in_range(field, value):
+    low, high = CTG_RANGES[field]
+    return low <= value <= high
+
+
+def parse_ctg_report(text):
+    """
+    Parse report text into {"values", "confidence", "missing"}.
+    A field seen twice with different values is treated as unresolved.
+    """
+    values, confidence, conflicts = {}, {}, set()
+    in_histogram = False
+    for line in text.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            # a heading (or any other line without a value) opens or closes the histogram section
+            if line.strip():
+                in_histogram = "histogram" in line.lower()
+            continue
+        field, conf = resolve_label(match.group("label"), in_histogram)
+        if field is None:
+            continue
+        value = float(match.group("value"))
+        if not in_range(field, value):
+            continue
+        if field in values and values[field] != value:
+            conflicts.add(field)
+            continue
+        if conf >= confidence.get(field, 0.0):
+            values[field], confidence[field] = value, conf
+
+    for field in conflicts:
+        values.pop(field, None)
+        confidence.pop(field, None)
+    missing = [c for c in CTG_COLUMNS if c not in values]
+    return {"values": values, "confidence": confidence, "missing": missing}
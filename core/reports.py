@@ -0,0 +1,203 @@
+"""
+Patient report PDFs.
+
+`generate_pdf` memoizes rendered reports by a content hash of the report
+dict, so dashboard reruns with an unchanged report skip ReportLab.
+`render_reports` renders a whole cohort in a process pool into a directory
+or a zip archive:
+
+    python -m core.reports reports.jsonl reports.zip --name-key patient_id
+"""
+import argparse
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+from core.telemetry import incr, traced
+
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "64"))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "0")) or None
+
+# ------------------ rendering
+
+@functools.lru_cache(maxsize=1)
+def pdf_styles():
+    """
+    Paragraph styles for the patient report, built once per process.
+    Returns (title_style, section_style, normal).
+    """
+    styles = getSampleStyleSheet()
+
+    title_style = ParagraphStyle(
+        name='TitleStyle', parent=styles['Heading1'], alignment=1, spaceAfter=20
+    )
+    section_style = ParagraphStyle(
+        name='SectionTitle', parent=styles['Heading2'], spaceAfter=10
+    )
+    return title_style, section_style, styles['Normal']
+
+
+@traced("render")
+def render_pdf(data: dict) -> bytes:
+    """
+    Render the patient report PDF for the provided patient classification JSON.
+    Always runs ReportLab; use `generate_pdf` for the memoized version.
+    """
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    title_style, section_style, normal = pdf_styles()
+
+    elements = []
+
+    # Title
+    elements.append(Paragraph("Patient Classification Report", title_style))
+    elements.append(Spacer(1, 12))
+
+    # Classification
+    elements.append(Paragraph(f"<b>Classification:</b> {data.get('classification', 'N/A')} ({data.get('confidence', 'N/A')}%)", normal))
+    elements.append(Spacer(1, 12))
+
+    # Reason
+    elements.append(Paragraph("Why (Explainable AI):", section_style))
+    elements.append(Paragraph(data.get('reason', 'N/A'), normal))
+    elements.append(Spacer(1, 12))
+
+    # Recommendations
+    recommendations = data.get('recommendations', [])
+    elements.append(Paragraph("Recommendations:", section_style))
+    if recommendations:
+        list_items = []
+        for rec in recommendations:
+            advice = rec.get("advice", "N/A")
+            source = rec.get("source", "N/A")
+            text = f"{advice} <br/><font size=9 color=grey>Source: {source}</font>"
+            list_items.append(ListItem(Paragraph(text, normal), leftIndent=10))
+        elements.append(ListFlowable(list_items, bulletType='bullet'))
+    else:
+        elements.append(Paragraph("No recommendations provided.", normal))
+
+    # Build PDF
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# ------------------ memoization
+
+_pdf_cache = OrderedDict()
+_pdf_cache_lock = threading.Lock()
+
+
+def report_hash(data):
+    """Content hash of a report dict, independent of key order."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def generate_pdf(data: dict) -> BytesIO:
+    """
+    Generate a PDF from the provided patient classification JSON.
+    Returns a fresh BytesIO stream over the (cached) PDF bytes.
+    """
+    key = report_hash(data)
+    with _pdf_cache_lock:
+        pdf = _pdf_cache.get(key)
+        if pdf is not None:
+            _pdf_cache.move_to_end(key)
+    if pdf is None:
+        incr("report_cache_total", result="miss")
+        pdf = render_pdf(data)
+        with _pdf_cache_lock:
+            _pdf_cache[key] = pdf
+            while len(_pdf_cache) > REPORT_CACHE_SIZE:
+                _pdf_cache.popitem(last=False)
+    else:
+        incr("report_cache_total", result="hit")
+    return BytesIO(pdf)
+
+
+# ------------------ batch export
+
+def _report_name(data, i, name_key):
+    name = str(data.get(name_key) or f"report_{i + 1:05d}") if name_key else f"report_{i + 1:05d}"
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name) + ".pdf"
+
+
+def render_reports(reports, output, name_key="patient_id", workers=None, chunksize=8):
+    """
+    Render every report dict in `reports` in a process pool and write the PDFs
+    into `output`: a directory path, a .zip path or a writable binary file
+    object (zip stream). Identical reports are rendered once. Returns the file names.
+    """
+    reports = list(reports)
+    # disambiguate repeated names, e.g. two reports for the same patient; a suffixed
+    # name can itself be taken (a, a, a_2), so suffixes grow until the name is unused
+    names, used = [], set()
+    for i, data in enumerate(reports):
+        name = _report_name(data, i, name_key)
+        candidate, n = name, 1
+        while candidate in used:
+            n += 1
+            candidate = f"{name[:-4]}_{n}.pdf"
+        used.add(candidate)
+        names.append(candidate)
+
+    hashes = [report_hash(data) for data in reports]
+    unique = {h: data for h, data in zip(hashes, reports)}
+
+    to_zip = not isinstance(output, (str, os.PathLike)) or str(output).endswith(".zip")
+    if not to_zip:
+        os.makedirs(output, exist_ok=True)
+    archive = zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) if to_zip else None
+    try:
+        workers = workers or REPORT_WORKERS or os.cpu_count() or 1
+        if workers == 1:
+            rendered = {h: render_pdf(data) for h, data in unique.items()}
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rendered = dict(zip(unique, pool.map(render_pdf, unique.values(), chunksize=chunksize)))
+        for name, h in zip(names, hashes):
+            if archive is not None:
+                archive.writestr(name, rendered[h])
+            else:
+                with open(os.path.join(output, name), "wb") as f:
+                    f.write(rendered[h])
+    finally:
+        if archive is not None:
+            archive.close()
+    return names
+
+
+def load_reports(path):
+    """Report dicts from a JSON array or a JSON-lines file."""
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render patient report PDFs for a cohort.")
+    parser.add_argument("reports", help="JSON array or JSON-lines file of report dicts")
+    parser.add_argument("output", help="Output directory or .zip file")
+    parser.add_argument("--name-key", default="patient_id", help="Report field used as the file name")
+    parser.add_argument("--workers", type=int, default=REPORT_WORKERS)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    names = render_reports(load_reports(args.reports), args.output, name_key=args.name_key, workers=args.workers)
+    print(f"Rendered {len(names)} reports in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
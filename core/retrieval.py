@@ -0,0 +1,93 @@
+"""
+Vector indexes over the advice embeddings.
+
+Three FAISS index kinds are supported, all on inner product over L2-normalized
+vectors (i.e. cosine similarity):
+- flat: exact search, best for small corpora
+- ivf: inverted lists over k-means cells, sub-linear for large corpora
+- hnsw: graph search, lowest latency at high recall
+
+Indexes are saved next to the embedding store and rebuilt when the corpus
+hashes in the store manifest change.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+from core.embedding_store import STORE_DIR, corpus_digest, read_manifest, store_paths
+from core.embeddings import DEFAULT_EMBEDDING_MODEL, model_key
+from core.startup import lazy_import, timed_load
+
+INDEX_KINDS = ("flat", "ivf", "hnsw")
+DEFAULT_INDEX_KIND = os.getenv("RETRIEVAL_INDEX", "flat")
+
+
+def build_index(embeddings, kind=DEFAULT_INDEX_KIND, nlist=None, nprobe=8, hnsw_m=32, ef_search=64):
+    """Build a FAISS inner-product index of the given kind over normalized `embeddings`."""
+    if kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind {kind!r}, expected one of {INDEX_KINDS}")
+    faiss = lazy_import("faiss")
+    vectors = np.array(embeddings, dtype=np.float32, order="C")
+    faiss.normalize_L2(vectors)
+    n, dim = vectors.shape
+
+    if kind == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif kind == "ivf":
+        # ~4*sqrt(n) cells, but keep enough training points per cell
+        nlist = nlist or max(1, min(int(4 * math.sqrt(n)), n // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.nprobe = min(nprobe, nlist)
+    else:
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efSearch = ef_search
+
+    index.add(vectors)
+    return index
+
+
+def search(index, query_vecs, k=3):
+    """Top-k (scores, ids) for one query vector or a (n, dim) batch of them."""
+    faiss = lazy_import("faiss")
+    queries = np.array(query_vecs, dtype=np.float32, ndmin=2, order="C")
+    faiss.normalize_L2(queries)
+    scores, ids = index.search(queries, k)
+    return scores, ids
+
+
+def index_paths(model_name, kind, store_dir=STORE_DIR):
+    vectors_path, _ = store_paths(model_name, store_dir)
+    base = vectors_path[:-len(".npy")]
+    return f"{base}.{kind}.faiss", f"{base}.{kind}.json"
+
+
+@timed_load
+def load_doc_index(_embeddings, model_name=DEFAULT_EMBEDDING_MODEL, kind=DEFAULT_INDEX_KIND, store_dir=STORE_DIR, backend=None):
+    """
+    Index over the embedding store for `model_name` on `backend`, read from disk
+    when it matches the current corpus and rebuilt (and saved) otherwise.
+    """
+    model_name = model_key(model_name, backend)
+    faiss = lazy_import("faiss")
+    index_path, meta_path = index_paths(model_name, kind, store_dir)
+    manifest = read_manifest(model_name, store_dir, dim=int(_embeddings.shape[1]))
+    digest = corpus_digest(manifest["hashes"]) if manifest is not None else None
+
+    if digest and os.path.exists(index_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("corpus") == digest:
+            index = faiss.read_index(index_path)
+            if index.d == _embeddings.shape[1]:
+                return index
+
+    index = build_index(_embeddings, kind=kind)
+    if digest:
+        faiss.write_index(index, index_path)
+        with open(meta_path, "w") as f:
+            json.dump({"kind": kind, "corpus": digest, "ntotal": int(index.ntotal)}, f)
+    return index
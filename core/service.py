@@ -0,0 +1,324 @@
+"""
+Headless HTTP service for CTG and miscarriage assessments.
+
+Models, explainers and the retrieval corpus are loaded once per process in a
+background thread; the service answers JSON requests on:
+
+- GET  /healthz       liveness, always 200 while the process is up
+- GET  /readyz        200 once every enabled component is loaded, 503 before
+- POST /ctg           {"features": {...}, "report": false}
+- POST /miscarriage   {"features": {...}, "report": false}
+- POST /extract       {"kind": "ctg" | "miscarriage", "pdf_base64": "..."}
+- GET  /metrics       stage latencies and counters in the Prometheus text format
+
+With "report": true the response also carries the retrieved advices and the
+LLM risk report, exactly as the Streamlit app builds them. The BM25 advice
+index loads first, so reports retrieve lexically while the embedding model is
+still loading (see core.lexical).
+
+SERVICE_COMPONENTS (comma-separated, default all of lexical, ctg, miscarriage,
+retrieval) picks the components to load. Components left out, and models whose
+artifacts are not on disk, are reported as "disabled" and do not hold back
+readiness; requests that need them get a 503.
+
+Invalid requests get a 400, LLM failures (errors, timeouts, unparseable
+output) a 502 and any other failure a 500.
+
+    python -m core.service --host 0.0.0.0 --port 8080
+"""
+import argparse
+import base64
+import json
+import os
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import dotenv
+import pandas as pd
+
+from core.backends import load_predictor
+from core.batching import MicroBatcher
+from core.embedding_store import load_advices, load_doc_embeddings
+from core.embeddings import load_embedding_model
+from core.extractors import cached_extract_text, extract_ctg_fields, extract_miscarriage_from_pdf
+from core.lexical import load_lexical_index, retrieve_docs
+from core.llm_utils import OPENROUTER_BASE_URL, LLMError, PooledLLMClient
+from core.pipeline import run_assessment
+from core.predictors import (
+    CTG_COLUMNS, MISCARRIAGE_COLUMNS, ctg_query, miscarriage_query,
+    prediction_to_json, run_risk_system_ctg, run_risk_system_miscarriage,
+)
+from core.retrieval import load_doc_index
+from core.telemetry import incr, prometheus_text
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+
+
+class NotReady(RuntimeError):
+    pass
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def enabled_components():
+    names = os.getenv("SERVICE_COMPONENTS")
+    if not names:
+        return ServiceState.COMPONENTS
+    return tuple(n.strip() for n in names.split(",") if n.strip())
+
+
+class ServiceState:
+    """Resources shared by all request threads, loaded once in the background."""
+
+    COMPONENTS = ("lexical", "ctg", "miscarriage", "retrieval")
+
+    def __init__(self, client=None, components=None):
+        self.client = client
+        components = enabled_components() if components is None else components
+        unknown = set(components) - set(self.COMPONENTS)
+        if unknown:
+            raise ValueError(f"Unknown components {sorted(unknown)}, expected some of {self.COMPONENTS}")
+        self.status = {name: "loading" if name in components else "disabled" for name in self.COMPONENTS}
+        self.errors = {}
+        self.ctg = None
+        self.miscarriage = None
+        self.lexical = None
+        self.retrieval = None
+
+    def load(self):
+        loaders = {
+            "lexical": self._load_lexical,
+            "ctg": self._load_ctg,
+            "miscarriage": self._load_miscarriage,
+            "retrieval": self._load_retrieval,
+        }
+        for name, loader in loaders.items():
+            if self.status[name] == "disabled":
+                continue
+            try:
+                setattr(self, name, loader())
+                self.status[name] = "ready"
+            except FileNotFoundError as e:
+                # artifact not shipped with this deployment (e.g. the miscarriage model)
+                self.status[name] = "disabled"
+                self.errors[name] = f"{type(e).__name__}: {e}"
+            except Exception as e:
+                self.status[name] = "failed"
+                self.errors[name] = f"{type(e).__name__}: {e}"
+
+    def load_async(self):
+        threading.Thread(target=self.load, name="service-loader", daemon=True).start()
+
+    # concurrent requests for the same model are coalesced into one predict_proba/SHAP pass
+    @staticmethod
+    def _load_ctg():
+        predictor = load_predictor("ctg")
+        return MicroBatcher(predictor.model, predictor.explainer, predictor.class_map)
+
+    @staticmethod
+    def _load_miscarriage():
+        predictor = load_predictor("miscarriage")
+        return MicroBatcher(predictor.model, predictor.explainer, predictor.class_map)
+
+    @staticmethod
+    def _load_lexical():
+        advice_docs = load_advices()
+        return advice_docs, load_lexical_index(advice_docs)
+
+    def _load_retrieval(self):
+        advice_docs = self.lexical[0] if self.lexical is not None else load_advices()
+        tokenizer, emb_model = load_embedding_model()
+        doc_embeddings = load_doc_embeddings(advice_docs, emb_model, tokenizer)
+        return doc_embeddings, emb_model, tokenizer, load_doc_index(doc_embeddings)
+
+    @property
+    def ready(self):
+        """Every enabled component is loaded; disabled ones are left out."""
+        return all(s in ("ready", "disabled") for s in self.status.values())
+
+    def require(self, name):
+        if self.status[name] != "ready":
+            raise NotReady(f"{name} is {self.status[name]}" + (f": {self.errors[name]}" if name in self.errors else ""))
+        return getattr(self, name)
+
+    def retrieve(self, query):
+        advice_docs, lexical_index = self.require("lexical")
+        # until the embedding model is loaded (or if it failed) only the lexical tier is served
+        dense = self.retrieval if self.status["retrieval"] == "ready" else None
+        return retrieve_docs(query, advice_docs, lexical_index, dense=dense)
+
+
+# ------------------ request handlers
+
+def _features_frame(features, columns):
+    if not isinstance(features, dict):
+        raise BadRequest('"features" must be an object of feature name to value')
+    missing = [c for c in columns if c not in features]
+    if missing:
+        raise BadRequest(f"Missing features: {missing}")
+    try:
+        return pd.DataFrame([{c: float(features[c]) for c in columns}])
+    except (TypeError, ValueError) as e:
+        raise BadRequest(f"Features must be numbers: {e}")
+
+
+def _assess(state, body, kind):
+    if kind == "ctg":
+        columns, make_query, risk_system = CTG_COLUMNS, ctg_query, run_risk_system_ctg
+    else:
+        columns, make_query, risk_system = MISCARRIAGE_COLUMNS, miscarriage_query, run_risk_system_miscarriage
+    patient_data = _features_frame(body.get("features"), columns)
+    batcher = state.require(kind)
+
+    if not body.get("report"):
+        return {"prediction": prediction_to_json(batcher.predict(patient_data))}
+
+    if state.client is None:
+        raise NotReady("No LLM client configured")
+    stages = run_assessment(
+        patient_data,
+        predict=batcher.predict,
+        make_query=make_query,
+        retrieve=state.retrieve,
+        risk_system=lambda advices, output: risk_system(advices, output, state.client),
+    )
+    return {
+        "prediction": prediction_to_json(stages["prediction"].result()),
+        "advices": stages["advices"].result(),
+        "report": stages["report"].result(),
+    }
+
+
+def _extract(state, body):
+    if state.client is None:
+        raise NotReady("No LLM client configured")
+    try:
+        pdf_bytes = base64.b64decode(body["pdf_base64"], validate=True)
+    except (KeyError, ValueError, TypeError):
+        raise BadRequest('"pdf_base64" must be a base64-encoded PDF')
+    try:
+        # memoized, so the extraction below reuses the text
+        cached_extract_text(pdf_bytes)
+    except Exception as e:
+        raise BadRequest(f'"pdf_base64" is not a readable PDF: {type(e).__name__}: {e}')
+    refresh = bool(body.get("refresh", False))
+    kind = body.get("kind", "ctg")
+    if kind == "ctg":
+        return extract_ctg_fields(pdf_bytes, state.client, refresh=refresh)
+    if kind == "miscarriage":
+        return {"values": extract_miscarriage_from_pdf(pdf_bytes, state.client, refresh=refresh)}
+    raise BadRequest('"kind" must be "ctg" or "miscarriage"')
+
+
+def make_handler(state):
+    routes = {
+        "/ctg": lambda body: _assess(state, body, "ctg"),
+        "/miscarriage": lambda body: _assess(state, body, "miscarriage"),
+        "/extract": lambda body: _extract(state, body),
+    }
+
+    class ServiceHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/healthz":
+                self._reply(200, {"status": "ok"})
+            elif self.path == "/readyz":
+                self._reply(200 if state.ready else 503, {"ready": state.ready, "components": state.status, "errors": state.errors})
+            elif self.path == "/metrics":
+                self._send(200, prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+
+        def do_POST(self):
+            handler = routes.get(self.path)
+            if handler is None:
+                self._reject(404, f"Unknown path {self.path}")
+                return
+            length = self.headers.get("Content-Length")
+            if length is None:
+                self._reject(411, "Content-Length required")
+                return
+            if not length.strip().isdigit():
+                self._reject(400, f"Invalid Content-Length {length!r}")
+                return
+            length = int(length)
+            if length > MAX_BODY_BYTES:
+                self._reject(413, "Request body too large")
+                return
+            try:
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError as e:
+                    raise BadRequest(f"Request body is not valid JSON: {e}")
+                if not isinstance(body, dict):
+                    raise BadRequest("Request body must be a JSON object")
+                self._reply(200, handler(body))
+            except BadRequest as e:
+                self._reply(400, {"error": str(e)})
+            except NotReady as e:
+                self._reply(503, {"error": str(e)})
+            except LLMError as e:
+                self._reply(502, {"error": f"{type(e).__name__}: {e}"})
+            except Exception as e:
+                traceback.print_exc()
+                self._reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def _reject(self, status, message):
+            # the body is left unread, so the connection cannot carry another request
+            self.close_connection = True
+            self._reply(status, {"error": message})
+
+        def _reply(self, status, body):
+            if self.command == "POST":
+                incr("http_requests_total", path=self.path if self.path in routes else "other", status=status)
+            self._send(status, json.dumps(body, default=str).encode("utf-8"), "application/json")
+
+        def _send(self, status, data, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ServiceHandler
+
+
+def create_server(host="127.0.0.1", port=8080, state=None):
+    """Threaded HTTP server bound to host:port; loading starts immediately in the background."""
+    if state is None:
+        dotenv.load_dotenv()
+        client = PooledLLMClient(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=OPENROUTER_BASE_URL)
+        state = ServiceState(client)
+        state.load_async()
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the headless PreSafe assessment service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    server = create_server(args.host, args.port)
+    print(f"PreSafe service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Deferred imports and a startup-time profiler.
+
+Heavy optional dependencies (shap, xgboost, tabpfn, torch, transformers,
+faiss) are imported through `lazy_import` the first time a backend needs
+them, and artifact loaders are wrapped with `timed_load`; both record how
+long they took so the cost of a cold start can be broken down.
+
+    python -m core.startup            # per-module import times of core
+    python -m core.startup --load     # plus model/corpus load times
+"""
+import argparse
+import functools
+import importlib
+import re
+import subprocess
+import sys
+import threading
+import time
+
+IMPORT_TIMES = {}
+LOAD_TIMES = {}
+_lock = threading.Lock()
+
+CORE_MODULES = (
+    "core.predictors", "core.embeddings", "core.embedding_store", "core.retrieval",
+    "core.extractors", "core.llm_utils", "core.pipeline", "core.widgets",
+)
+
+
+def lazy_import(name):
+    """Import `name` on first use, recording the time it took."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        IMPORT_TIMES.setdefault(name, time.perf_counter() - start)
+    return module
+
+
+def timed_load(fn):
+    """Record the duration of every call to an artifact loader under its name."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with _lock:
+                LOAD_TIMES.setdefault(fn.__name__, []).append(time.perf_counter() - start)
+    return wrapper
+
+
+def startup_report():
+    """Deferred import and artifact load timings recorded so far in this process, in seconds."""
+    with _lock:
+        return {
+            "imports": dict(IMPORT_TIMES),
+            "loads": {name: {"calls": len(t), "total": sum(t), "first": t[0]} for name, t in LOAD_TIMES.items()},
+        }
+
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(modules=CORE_MODULES):
+    """
+    Import `modules` in a fresh interpreter with `-X importtime`.
+    Returns [(module, self_seconds, cumulative_seconds, depth)] in import order.
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6, (len(indent) - 1) // 2))
+    return rows
+
+
+def format_report(import_rows, top=15):
+    lines = ["Module import time (fresh interpreter):"]
+    core_rows = [r for r in import_rows if r[0] in CORE_MODULES]
+    for name, _, cumulative, _ in core_rows:
+        lines.append(f"  {name:<28} {cumulative * 1000:9.1f} ms")
+    lines.append(f"Top {top} third-party packages by cumulative import time:")
+    packages = {}
+    for name, _, cumulative, _ in import_rows:
+        if "." not in name and name != "core":
+            packages[name] = max(packages.get(name, 0), cumulative)
+    for name, cumulative in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        lines.append(f"  {name:<28} {cumulative * 1000:9.1f} ms")
+
+    report = startup_report()
+    if report["imports"]:
+        lines.append("Deferred imports (first use):")
+        for name, seconds in sorted(report["imports"].items(), key=lambda kv: -kv[1]):
+            lines.append(f"  {name:<28} {seconds * 1000:9.1f} ms")
+    if report["loads"]:
+        lines.append("Artifact loads:")
+        for name, stats in report["loads"].items():
+            lines.append(f"  {name:<28} {stats['first'] * 1000:9.1f} ms")
+    return "\n".join(lines)
+
+
+def _load_artifacts():
+    from core.embedding_store import load_advices, load_doc_embeddings
+    from core.embeddings import load_embedding_model
+    from core.predictors import load_ctg_explainer, load_ctg_model, load_miscarriage_model
+    from core.retrieval import load_doc_index
+
+    steps = [
+        ("ctg model", lambda: load_ctg_explainer(load_ctg_model())),
+        ("miscarriage model", load_miscarriage_model),
+    ]
+    for label, step in steps:
+        try:
+            step()
+        except Exception as e:
+            print(f"  skipped {label}: {type(e).__name__}: {e}")
+    try:
+        advice_docs = load_advices()
+        tokenizer, emb_model = load_embedding_model()
+        load_doc_index(load_doc_embeddings(advice_docs, emb_model, tokenizer))
+    except Exception as e:
+        print(f"  skipped retrieval: {type(e).__name__}: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import and artifact load times at startup.")
+    parser.add_argument("--load", action="store_true", help="Also load models and the retrieval corpus")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args(argv)
+
+    rows = profile_imports()
+    if args.load:
+        _load_artifacts()
+    print(format_report(rows, top=args.top))
+
+
+if __name__ == "__main__":
+    # run from the importable module so timings recorded by core.* land in the same registry
+    from core.startup import main
+    main()
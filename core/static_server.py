@@ -0,0 +1,249 @@
+"""
+Threaded static file server for the 3D model viewer's assets.
+
+One server per directory and process, bound to a free localhost port and
+ready as soon as `asset_url` returns. Files are held in memory per
+(mtime, size) and served with:
+- a strong ETag, answered with 304 on If-None-Match
+- single byte ranges (206 / 416), for resumed or partial mesh loads
+- brotli or gzip variants negotiated on Accept-Encoding: `<file>.br` /
+  `<file>.gz` next to the asset when present, otherwise compressed once in
+  memory (brotli only when the optional `brotli` package is installed)
+- `Cache-Control: immutable` for a year; `asset_url` adds the ETag as a
+  version query, so a changed file gets a new URL
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+mimetypes.add_type("model/gltf-binary", ".glb")
+mimetypes.add_type("model/gltf+json", ".gltf")
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+# already-compressed formats gain nothing from another pass
+INCOMPRESSIBLE = {".png", ".jpg", ".jpeg", ".webp", ".gz", ".br", ".zip", ".ktx2"}
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class Asset:
+    """Contents of one file at a given mtime/size, with lazily built encodings."""
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.version = (stat.st_mtime_ns, stat.st_size)
+        with open(path, "rb") as f:
+            self.data = f.read()
+        self.etag = hashlib.sha256(self.data).hexdigest()[:20]
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self._variants = {}
+        self._lock = threading.Lock()
+
+    def variant(self, encoding):
+        """Bytes of the asset in `encoding` ("br" or "gzip"), or None when unavailable."""
+        with self._lock:
+            if encoding not in self._variants:
+                self._variants[encoding] = self._build_variant(encoding)
+            return self._variants[encoding]
+
+    def _build_variant(self, encoding):
+        if os.path.splitext(self.path)[1].lower() in INCOMPRESSIBLE:
+            return None
+        suffix = ".br" if encoding == "br" else ".gz"
+        on_disk = self.path + suffix
+        if os.path.exists(on_disk) and os.stat(on_disk).st_mtime_ns >= self.version[0]:
+            with open(on_disk, "rb") as f:
+                return f.read()
+        if encoding == "gzip":
+            compressed = gzip.compress(self.data, compresslevel=9, mtime=0)
+        elif brotli is not None:
+            compressed = brotli.compress(self.data)
+        else:
+            return None
+        return compressed if len(compressed) < len(self.data) else None
+
+
+class AssetCache:
+    def __init__(self, directory):
+        self.directory = os.path.realpath(directory)
+        self._assets = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url_path):
+        """Absolute path for a request path, or None when outside the directory or missing."""
+        relative = unquote(urlsplit(url_path).path).lstrip("/")
+        path = os.path.realpath(os.path.join(self.directory, relative))
+        if not path.startswith(self.directory + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def get(self, path):
+        stat = os.stat(path)
+        with self._lock:
+            asset = self._assets.get(path)
+            if asset is None or asset.version != (stat.st_mtime_ns, stat.st_size):
+                asset = self._assets[path] = Asset(path, stat)
+            return asset
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single byte range, None for no/unsupported ranges, or "invalid"."""
+    match = _RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return "invalid"
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+
+def _accepted(header, encoding):
+    """Whether an Accept-Encoding header allows `encoding` (present with a non-zero q)."""
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() != encoding:
+            continue
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                return float(q[2:]) > 0
+            except ValueError:
+                return False
+        return True
+    return False
+
+
+def make_handler(cache):
+    class StaticHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._serve(head=True)
+
+        def do_GET(self):
+            self._serve(head=False)
+
+        def _serve(self, head):
+            path = cache.resolve(self.path)
+            if path is None:
+                self._empty(404)
+                return
+            asset = cache.get(path)
+
+            byte_range = _parse_range(self.headers.get("Range"), len(asset.data))
+            encoding, body, etag = None, asset.data, asset.etag
+            if byte_range is None:
+                for candidate, tag in (("br", "br"), ("gzip", "gz")):
+                    if _accepted(self.headers.get("Accept-Encoding"), candidate):
+                        variant = asset.variant(candidate)
+                        if variant is not None:
+                            encoding, body, etag = candidate, variant, f"{asset.etag}-{tag}"
+                            break
+            etag = f'"{etag}"'
+
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+                self._empty(304, etag)
+                return
+
+            if byte_range == "invalid":
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(asset.data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            status = 200
+            if byte_range is not None:
+                start, end = byte_range
+                body = body[start:end + 1]
+                status = 206
+
+            self.send_response(status)
+            self.send_header("Content-Type", asset.content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            if status == 206:
+                self.send_header("Content-Range", f"bytes {start}-{end}/{len(asset.data)}")
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+        def _empty(self, status, etag=None):
+            self.send_response(status)
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", CACHE_CONTROL)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def end_headers(self):
+            # model-viewer runs in the component iframe, on another origin
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+            self.send_header("Access-Control-Allow-Headers", "*")
+            self.send_header("Access-Control-Expose-Headers", "Content-Length, Content-Range, ETag")
+            super().end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return StaticHandler
+
+
+# ------------------ process-wide servers
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_server(directory, port=0):
+    """Server for `directory`, started on first use on `port` (0 picks a free port)."""
+    directory = os.path.realpath(directory)
+    with _servers_lock:
+        server = _servers.get(directory)
+        if server is None:
+            assets = AssetCache(directory)
+            server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(assets))
+            server.daemon_threads = True
+            server.assets = assets
+            # bound and listening once the constructor returns, so no startup sleep is needed
+            threading.Thread(target=server.serve_forever, name="static-server", daemon=True).start()
+            _servers[directory] = server
+        return server
+
+
+def asset_url(path, port=0):
+    """Versioned http URL for `path`, served from its directory."""
+    path = os.path.realpath(path)
+    server = get_server(os.path.dirname(path), port)
+    asset = server.assets.get(path)
+    return f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(path)}?v={asset.etag}"
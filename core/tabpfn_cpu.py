@@ -0,0 +1,124 @@
+"""
+CPU inference for the TabPFN backend.
+
+The shipped fit state (ml/models/tabpfn_model.tabpfn_fit) uses
+fit_mode="fit_preprocessors", so every predict call runs the transformer over
+the whole training context again: seconds and hundreds of MB per call on CPU.
+Here the classifier is fitted once on CPU with fit_mode="fit_with_cache",
+which encodes the training context into a KV cache so predict only processes
+the test rows. That fitted state is saved next to the shipped one
+(`tabpfn_model.cpu<n>.tabpfn_fit`) and reloaded on later starts.
+
+- rows are predicted in chunks of TABPFN_CPU_CHUNK_ROWS (default 256)
+- TABPFN_CPU_THREADS sets torch's (process-wide) thread count when TabPFN loads (0 keeps torch's default)
+- TABPFN_CPU_ESTIMATORS ensemble members (default 8, as shipped); the
+  "tabpfn-fast" backend uses TABPFN_CPU_FAST_ESTIMATORS (default 2)
+
+Build the cached fit states ahead of deployment, then compare against the forest:
+
+    python -m core.tabpfn_cpu --estimators 8 2
+    python -m core.backends --task ctg --backends rf tabpfn tabpfn-fast
+"""
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+from core.embeddings import set_torch_threads
+from core.predictors import ctg_split, load_tabpfn
+from core.startup import lazy_import, timed_load
+
+TABPFN_FIT_PATH = 'ml/models/tabpfn_model.tabpfn_fit'
+TABPFN_CPU_THREADS = int(os.getenv("TABPFN_CPU_THREADS", "0"))
+TABPFN_CPU_CHUNK_ROWS = int(os.getenv("TABPFN_CPU_CHUNK_ROWS", "256"))
+TABPFN_CPU_ESTIMATORS = int(os.getenv("TABPFN_CPU_ESTIMATORS", "8"))
+TABPFN_CPU_FAST_ESTIMATORS = int(os.getenv("TABPFN_CPU_FAST_ESTIMATORS", "2"))
+# matches the shipped fit state
+SOFTMAX_TEMPERATURE = 0.9
+
+
+class TabPFNCPU:
+    """predict_proba/predict of a fitted TabPFNClassifier, in row chunks."""
+
+    def __init__(self, estimator, chunk_rows=None, threads=None):
+        self.estimator = estimator
+        self.classes_ = estimator.classes_
+        self.chunk_rows = chunk_rows or TABPFN_CPU_CHUNK_ROWS
+        self.threads = TABPFN_CPU_THREADS if threads is None else threads
+        set_torch_threads(self.threads)
+        # each call already uses every torch thread, so calls are serialized rather than oversubscribing cores
+        self._lock = threading.Lock()
+
+    def predict_proba(self, patient_data):
+        chunks = [patient_data[i:i + self.chunk_rows] for i in range(0, len(patient_data), self.chunk_rows)]
+        with self._lock:
+            return np.concatenate([self.estimator.predict_proba(chunk) for chunk in chunks])
+
+    def predict(self, patient_data):
+        return self.classes_[self.predict_proba(patient_data).argmax(axis=1)]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        set_torch_threads(self.threads)
+        self._lock = threading.Lock()
+
+
+def cpu_fit_path(n_estimators):
+    return os.path.splitext(TABPFN_FIT_PATH)[0] + f'.cpu{n_estimators}.tabpfn_fit'
+
+
+def fit_tabpfn_cpu(n_estimators, threads=None):
+    """TabPFNClassifier fitted on CPU on the notebooks' training split, with the training context cached."""
+    tabpfn = lazy_import("tabpfn")
+    x_train, _, y_train, _ = ctg_split()
+    model = tabpfn.TabPFNClassifier(
+        n_estimators=n_estimators, softmax_temperature=SOFTMAX_TEMPERATURE,
+        device="cpu", fit_mode="fit_with_cache", random_state=0,
+    )
+    set_torch_threads(TABPFN_CPU_THREADS if threads is None else threads)
+    return model.fit(x_train, y_train)
+
+
+def load_tabpfn_cpu(n_estimators=None, refit=False):
+    """CPU TabPFN with `n_estimators` members, fitted and saved on first use."""
+    n_estimators = n_estimators or TABPFN_CPU_ESTIMATORS
+    path = cpu_fit_path(n_estimators)
+    if os.path.exists(path) and not refit:
+        estimator = load_tabpfn(path, device="cpu")
+    else:
+        estimator = fit_tabpfn_cpu(n_estimators)
+        estimator.save_fit_state(path)
+    return TabPFNCPU(estimator)
+
+
+@timed_load
+def load_ctg_tabpfn():
+    return load_tabpfn_cpu(TABPFN_CPU_ESTIMATORS)
+
+
+@timed_load
+def load_ctg_tabpfn_fast():
+    return load_tabpfn_cpu(TABPFN_CPU_FAST_ESTIMATORS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit and cache CPU TabPFN states for the CTG backend.")
+    parser.add_argument("--estimators", type=int, nargs="+", default=[TABPFN_CPU_ESTIMATORS, TABPFN_CPU_FAST_ESTIMATORS])
+    parser.add_argument("--refit", action="store_true", help="Refit even when a cached state exists")
+    args = parser.parse_args(argv)
+
+    for n in args.estimators:
+        start = time.perf_counter()
+        load_tabpfn_cpu(n, refit=args.refit)
+        print(f"{n} estimators: {cpu_fit_path(n)} ready in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+In-process tracing and metrics for the assessment stages.
+
+- `span(stage)` / `@traced(stage)` time a block: durations feed a per-stage
+  window for p50/p99, and an exception also bumps `errors_total{stage}`.
+  Stages must be listed in STAGES, so a typo cannot start a new series.
+- `incr(name, **labels)` bumps a counter (tokens, cache hits, retries...).
+- `snapshot()` returns everything as a dict; `prometheus_text()` renders it
+  in the Prometheus text format (served on GET /metrics by core.service).
+- With TELEMETRY_LOG set, every finished span is appended to that file as a
+  JSON line.
+- `log_payload` logs prompts/responses on the "core.payloads" logger for a
+  sampled fraction of calls (PAYLOAD_LOG_SAMPLE, default 0), truncated and with
+  numbers masked so patient values never reach the logs.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+
+STAGES = ("extract", "predict", "explain", "embed", "query_embed", "retrieve", "llm", "render")
+TELEMETRY_LOG = os.getenv("TELEMETRY_LOG") or None
+PAYLOAD_LOG_SAMPLE = float(os.getenv("PAYLOAD_LOG_SAMPLE", "0"))
+PAYLOAD_LOG_CHARS = int(os.getenv("PAYLOAD_LOG_CHARS", "200"))
+WINDOW = 2048
+
+payload_logger = logging.getLogger("core.payloads")
+
+_lock = threading.Lock()
+_durations = defaultdict(lambda: deque(maxlen=WINDOW))
+_totals = defaultdict(lambda: [0, 0.0])
+_counters = defaultdict(float)
+
+
+def _label_key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def incr(name, value=1, **labels):
+    with _lock:
+        _counters[_label_key(name, labels)] += value
+
+
+def _check_stage(stage):
+    if stage not in STAGES:
+        raise ValueError(f"Unknown telemetry stage {stage!r}, expected one of {STAGES}")
+
+
+def observe(stage, seconds, error=None, **attrs):
+    _check_stage(stage)
+    with _lock:
+        _durations[stage].append(seconds)
+        totals = _totals[stage]
+        totals[0] += 1
+        totals[1] += seconds
+        if error is not None:
+            _counters[_label_key("errors_total", {"stage": stage})] += 1
+    if TELEMETRY_LOG:
+        event = {"ts": time.time(), "stage": stage, "seconds": round(seconds, 6), **attrs}
+        if error is not None:
+            event["error"] = type(error).__name__
+        _write_event(event)
+
+
+_log_lock = threading.Lock()
+
+
+def _write_event(event):
+    line = json.dumps(event, default=str) + "\n"
+    with _log_lock, open(TELEMETRY_LOG, "a") as f:
+        f.write(line)
+
+
+@contextlib.contextmanager
+def span(stage, **attrs):
+    _check_stage(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        observe(stage, time.perf_counter() - start, error=e, **attrs)
+        raise
+    observe(stage, time.perf_counter() - start, **attrs)
+
+
+def traced(stage):
+    _check_stage(stage)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def percentiles(stage, qs=(50, 99)):
+    """Duration in seconds at each percentile over the last WINDOW spans of `stage`."""
+    with _lock:
+        durations = list(_durations.get(stage, ()))
+    if not durations:
+        return {}
+    return {q: float(v) for q, v in zip(qs, np.percentile(durations, qs))}
+
+
+def snapshot():
+    with _lock:
+        stages = list(_durations)
+        totals = {stage: tuple(t) for stage, t in _totals.items()}
+        counters = dict(_counters)
+    return {
+        "stages": {
+            stage: {"count": totals[stage][0], "sum": totals[stage][1], **{f"p{q}": v for q, v in percentiles(stage).items()}}
+            for stage in stages
+        },
+        "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(counters.items())],
+    }
+
+
+def reset():
+    with _lock:
+        _durations.clear()
+        _totals.clear()
+        _counters.clear()
+
+
+def _escape(value):
+    """Prometheus label value escaping: backslash, double quote and newline."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def prometheus_text(prefix="presafe"):
+    snap = snapshot()
+    lines = [f"# TYPE {prefix}_stage_seconds summary"]
+    for stage, stats in snap["stages"].items():
+        for q in (50, 99):
+            if f"p{q}" in stats:
+                lines.append(f'{prefix}_stage_seconds{_format_labels({"stage": stage, "quantile": q / 100})} {stats[f"p{q}"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_sum{_format_labels({"stage": stage})} {stats["sum"]:.6f}')
+        lines.append(f'{prefix}_stage_seconds_count{_format_labels({"stage": stage})} {stats["count"]}')
+    typed = set()
+    for counter in snap["counters"]:
+        name = f"{prefix}_{counter['name']}"
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']:g}")
+    return "\n".join(lines) + "\n"
+
+
+_NUMBER = re.compile(r"\d+(\.\d+)?")
+
+
+def redact(text, max_chars=None):
+    max_chars = max_chars or PAYLOAD_LOG_CHARS
+    text = _NUMBER.sub("#", str(text))
+    return text if len(text) <= max_chars else text[:max_chars] + f"... [{len(text) - max_chars} more chars]"
+
+
+def log_payload(kind, text):
+    """Log a redacted prompt/response for a sampled fraction of calls."""
+    if PAYLOAD_LOG_SAMPLE <= 0 or random.random() >= PAYLOAD_LOG_SAMPLE:
+        return
+    payload_logger.info("%s (%d chars): %s", kind, len(str(text)), redact(text))
@@ -1,76 +1,25 @@
 import streamlit as st
 from core.model_viewer import render_3d_model
 import streamlit as st
-from io import BytesIO
 
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
+from core.reports import generate_pdf, pdf_styles
 
-def generate_pdf(data: dict) -> BytesIO:
-    """
-    Generate a PDF from the provided patient classification JSON.
-    Returns a BytesIO stream of the PDF.
-    """
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-
-    title_style = ParagraphStyle(
-        name='TitleStyle', parent=styles['Heading1'], alignment=1, spaceAfter=20
-    )
-    section_style = ParagraphStyle(
-        name='SectionTitle', parent=styles['Heading2'], spaceAfter=10
-    )
-    normal = styles['Normal']
-
-    elements = []
-
-    # Title
-    elements.append(Paragraph("Patient Classification Report", title_style))
-    elements.append(Spacer(1, 12))
-
-    # Classification
-    elements.append(Paragraph(f"<b>Classification:</b> {data.get('classification', 'N/A')} ({data.get('confidence', 'N/A')}%)", normal))
-    elements.append(Spacer(1, 12))
-
-    # Reason
-    elements.append(Paragraph("Why (Explainable AI):", section_style))
-    elements.append(Paragraph(data.get('reason', 'N/A'), normal))
-    elements.append(Spacer(1, 12))
-
-    # Recommendations
-    recommendations = data.get('recommendations', [])
-    elements.append(Paragraph("Recommendations:", section_style))
-    if recommendations:
-        list_items = []
-        for rec in recommendations:
-            advice = rec.get("advice", "N/A")
-            source = rec.get("source", "N/A")
-            text = f"{advice} <br/><font size=9 color=grey>Source: {source}</font>"
-            list_items.append(ListItem(Paragraph(text, normal), leftIndent=10))
-        elements.append(ListFlowable(list_items, bulletType='bullet'))
-    else:
-        elements.append(Paragraph("No recommendations provided.", normal))
-
-    # Build PDF
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
-
-def show_download_button(data: dict):
+def show_download_button(data: dict, pdf_buffer=None):
     """
     Display a Streamlit download button that downloads the generated PDF.
+    `pdf_buffer` may be an already rendered PDF or a Future resolving to one.
     """
-    pdf_buffer = generate_pdf(data)
+    if hasattr(pdf_buffer, "result"):
+        pdf_buffer = pdf_buffer.result()
+    if pdf_buffer is None:
+        pdf_buffer = generate_pdf(data)
 
     st.download_button(
         label="📄 Download Patient Report (PDF)",
         data=pdf_buffer,
         file_name="patient_report.pdf",
-        mime="application/pdf"
+        mime="application/pdf",
+        on_click="ignore",  # downloading should not rerun the app
     )
 
 def progress_bar(PROGRESS_VALUE, bar_color):
@@ -126,7 +75,7 @@ def progress_bar(PROGRESS_VALUE, bar_color):
 
     st.markdown(circle_html, unsafe_allow_html=True)
 
-def render_report_dashboard(report_data, test_type="CTG"):
+def render_report_dashboard(report_data, test_type="CTG", pdf_buffer=None):
     st.markdown("---")
     st.markdown(f"## 🧾 {test_type} Risk Report Dashboard")
 
@@ -172,4 +121,4 @@ def render_report_dashboard(report_data, test_type="CTG"):
             if rec.get("source"):
                 st.markdown(f"**Source:** _{rec['source']}_")
     
-    show_download_button(report_data)
+    show_download_button(report_data, pdf_buffer)
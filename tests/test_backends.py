@@ -0,0 +1,54 @@
+import pytest
+
+from core import backends
+from core.backends import clear_predictor_cache, load_predictor, select_backend
+
+
+def result(accuracy, p99):
+    return {"accuracy": accuracy, "latency_ms": {"p50": p99 / 2, "p99": p99}}
+
+
+REPORT = {"task": "ctg", "backends": {
+    "rf": result(0.95, 20.0),
+    "xgboost": result(0.96, 10.0),
+    "tabpfn": result(0.97, 5.0),
+    "tabpfn-fast": {"error": "RuntimeError: weights unavailable"},
+}}
+
+
+@pytest.fixture(autouse=True)
+def no_override(monkeypatch):
+    monkeypatch.delenv("ALLOW_UNVALIDATED_BACKENDS", raising=False)
+    clear_predictor_cache()
+    yield
+    clear_predictor_cache()
+
+
+def test_selects_fastest_backend_meeting_accuracy():
+    assert select_backend("ctg", 0.9, REPORT) == "xgboost"
+    assert select_backend("ctg", 0.955, REPORT) == "xgboost"
+
+
+def test_unvalidated_backends_are_not_selected(monkeypatch):
+    with pytest.raises(ValueError, match="No ctg backend"):
+        select_backend("ctg", 0.965, REPORT)
+    monkeypatch.setenv("ALLOW_UNVALIDATED_BACKENDS", "1")
+    assert select_backend("ctg", 0.9, REPORT) == "tabpfn"
+
+
+def test_unvalidated_backends_are_not_served():
+    with pytest.raises(ValueError, match="not validated"):
+        load_predictor("ctg", "tabpfn")
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown ctg backend"):
+        load_predictor("ctg", "nope")
+
+
+def test_default_backend_shares_the_cached_predictor(monkeypatch):
+    loads = []
+    monkeypatch.setitem(backends.BACKENDS["ctg"], "stub", lambda: loads.append(1) or object())
+    monkeypatch.setenv("CTG_BACKEND", "stub")
+    assert load_predictor("ctg") is load_predictor("ctg", "stub")
+    assert len(loads) == 1
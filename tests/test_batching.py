@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.backends import load_predictor
+from core.batching import MicroBatcher
+from core.predictors import align_columns, predict_batch, row_output
+
+
+@pytest.fixture(scope="module")
+def ctg():
+    predictor = load_predictor("ctg", "rf")
+    rows = align_columns(pd.read_csv("ml/data/fetal_health.csv"), predictor.columns).iloc[:24]
+    return predictor, rows
+
+
+def assert_same_result(result, expected):
+    assert result["predicted_class"] == expected["predicted_class"]
+    np.testing.assert_allclose(result["predicted_probabilities"], expected["predicted_probabilities"])
+    pd.testing.assert_frame_equal(result["top_features"], expected["top_features"])
+    assert result["recommendations"] == expected["recommendations"]
+
+
+def test_concurrent_requests_are_coalesced_and_match_serial(ctg):
+    predictor, rows = ctg
+    batcher = MicroBatcher(predictor.model, predictor.explainer, predictor.class_map, max_wait_ms=200)
+    try:
+        with ThreadPoolExecutor(max_workers=len(rows)) as pool:
+            results = list(pool.map(lambda i: batcher.predict(rows.iloc[i:i + 1], timeout=30), range(len(rows))))
+    finally:
+        batcher.close()
+
+    assert batcher.stats["requests"] == batcher.stats["rows"] == len(rows)
+    assert batcher.stats["batches"] < len(rows)
+    for i, result in enumerate(results):
+        expected = row_output(predict_batch(predictor.model, rows.iloc[i:i + 1], predictor.class_map, predictor.explainer))
+        assert_same_result(result, expected)
+
+
+def test_batch_error_reaches_every_caller(ctg):
+    predictor, rows = ctg
+    batcher = MicroBatcher(predictor.model, predictor.explainer, predictor.class_map, max_wait_ms=200)
+    try:
+        futures = [batcher.submit(rows.iloc[:1].drop(columns=rows.columns[0])) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(Exception):
+                future.result(timeout=30)
+    finally:
+        batcher.close()
+
+
+def test_rejects_multi_row_requests_and_closed_batcher(ctg):
+    predictor, rows = ctg
+    batcher = MicroBatcher(predictor.model, predictor.explainer, predictor.class_map)
+    with pytest.raises(ValueError):
+        batcher.submit(rows.iloc[:2])
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(rows.iloc[:1])
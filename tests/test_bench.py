@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pytest
+
+from bench import runner
+from bench.runner import compare, run_stages
+
+BASELINE = {"stages": {"fast": {"median": 0.010}, "slow": {"median": 0.010}, "gone": {"median": 0.010}}}
+
+
+@pytest.fixture
+def stages(monkeypatch):
+    def missing_dependency(fx):
+        raise ImportError("no module named tabpfn")
+
+    def broken(fx):
+        raise RuntimeError("model file is corrupt")
+
+    monkeypatch.setattr(runner, "STAGES", {
+        "ok": lambda fx: (lambda: None),
+        "missing": missing_dependency,
+        "broken": broken,
+    })
+
+
+def test_run_stages_skips_only_missing_dependencies(stages):
+    results = run_stages(["ok", "missing", "broken"], SimpleNamespace(notes={}), repeats=2, warmup=0)
+    assert "median" in results["ok"]
+    assert results["missing"] == {"skipped": "ImportError: no module named tabpfn"}
+    assert results["broken"] == {"error": "RuntimeError: model file is corrupt"}
+
+
+def test_compare_flags_slow_stages_past_threshold_and_min_delta():
+    results = {"fast": {"median": 0.0105}, "slow": {"median": 0.020}}
+    assert [name for name, _ in compare(results, BASELINE)] == ["slow"]
+    assert compare(results, BASELINE, min_delta_ms=50) == []
+
+
+def test_compare_flags_baseline_stages_without_a_timing():
+    results = {"fast": {"median": 0.010}, "gone": {"error": "RuntimeError: boom"}, "new": {"skipped": "ImportError: x"}}
+    regressions = compare(results, BASELINE)
+    assert [name for name, _ in regressions] == ["gone"]
+    assert "RuntimeError: boom" in regressions[0][1]
+
+
+def test_main_fails_on_stage_errors_and_without_a_baseline(stages, monkeypatch, tmp_path):
+    monkeypatch.setattr(runner, "Fixtures", lambda *args: SimpleNamespace(notes={}))
+    baseline = str(tmp_path / "baseline.json")
+    with pytest.raises(SystemExit) as exited:
+        runner.main(["--only", "ok", "broken", "--save-baseline", "--baseline", baseline, "--repeats", "1"])
+    assert exited.value.code == 1
+    assert runner.load_baseline(baseline) is None
+
+    with pytest.raises(SystemExit) as exited:
+        runner.main(["--only", "ok", "--baseline", baseline, "--repeats", "1"])
+    assert exited.value.code == 1
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from core import embedding_store
+from core.embedding_store import advice_hash, load_doc_embeddings, read_manifest, record_evaluation
+
+DIM = 4
+MODEL = SimpleNamespace(config=SimpleNamespace(hidden_size=DIM))
+DOCS = [{"advice": "Prolonged decelerations need urgent review."}, {"advice": "Accelerations are reassuring."}]
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    """Texts passed to the (fake) embedding model, one list per call."""
+    calls = []
+
+    def fake_embeddings(docs, _emb_model, _tokenizer):
+        calls.append([d["advice"] for d in docs])
+        return np.array([[len(d["advice"]), 1.0, 0.0, 0.0] for d in docs], dtype=np.float32)
+    monkeypatch.setattr(embedding_store, "precompute_doc_embeddings", fake_embeddings)
+    monkeypatch.delenv("ALLOW_UNVALIDATED_BACKENDS", raising=False)
+    return calls
+
+
+def load(docs, store_dir, backend="int8", **kwargs):
+    return load_doc_embeddings(docs, MODEL, None, model_name="test-model", store_dir=str(store_dir), backend=backend, **kwargs)
+
+
+def test_int8_is_refused_without_a_passing_evaluation(embedded, tmp_path):
+    with pytest.raises(ValueError, match="embedding_eval"):
+        load(DOCS, tmp_path)
+    load(DOCS, tmp_path, unvalidated=True)
+    hashes = [advice_hash(d) for d in DOCS]
+
+    record_evaluation("test-model", "int8", hashes, {"passed": False}, str(tmp_path))
+    with pytest.raises(ValueError, match="it failed"):
+        load(DOCS, tmp_path)
+
+    record_evaluation("test-model", "int8", hashes, {"passed": True}, str(tmp_path))
+    assert load(DOCS, tmp_path).shape == (2, DIM)
+    assert load(DOCS, tmp_path, backend="fp32").shape == (2, DIM)
+
+
+def test_evaluation_is_keyed_by_corpus(embedded, tmp_path, monkeypatch):
+    load(DOCS, tmp_path, unvalidated=True)
+    record_evaluation("test-model", "int8", [advice_hash(d) for d in DOCS], {"passed": True}, str(tmp_path))
+    changed = DOCS + [{"advice": "Reduced movements should be reported."}]
+    with pytest.raises(ValueError, match="none was recorded"):
+        load(changed, tmp_path)
+
+    monkeypatch.setenv("ALLOW_UNVALIDATED_BACKENDS", "1")
+    assert load(changed, tmp_path).shape == (3, DIM)
+    # the rewritten store no longer carries the old corpus' evaluation
+    assert "evaluation" not in read_manifest("test-model+int8", str(tmp_path))
+
+
+def test_only_new_or_changed_advices_are_embedded(embedded, tmp_path):
+    first = np.array(load(DOCS, tmp_path, backend="fp32"))
+    assert embedded == [[d["advice"] for d in DOCS]]
+    assert np.array_equal(load(DOCS, tmp_path, backend="fp32"), first)
+    assert len(embedded) == 1
+
+    changed = [{"advice": "Reduced movements should be reported."}, DOCS[1], {"advice": DOCS[0]["advice"] + " Now."}]
+    vectors = load(changed, tmp_path, backend="fp32")
+    assert embedded[1] == [changed[0]["advice"], changed[2]["advice"]]
+    assert np.array_equal(vectors[1], first[1])
+    assert read_manifest("test-model", str(tmp_path))["hashes"] == [advice_hash(d) for d in changed]
+
+    # reordering copies rows without embedding anything
+    assert np.array_equal(load(changed[::-1], tmp_path, backend="fp32"), np.array(vectors)[::-1])
+    assert len(embedded) == 2
+
+
+def test_vectors_of_another_width_are_rebuilt(embedded, tmp_path):
+    load(DOCS, tmp_path, backend="fp32")
+    wider = SimpleNamespace(config=SimpleNamespace(hidden_size=DIM + 1))
+    load_doc_embeddings(DOCS, wider, None, model_name="test-model", store_dir=str(tmp_path), backend="fp32")
+    assert len(embedded) == 2
+
+
+def test_empty_corpus(embedded, tmp_path):
+    assert load([], tmp_path, backend="fp32").shape == (0, DIM)
+    assert embedded == []
+    assert load(DOCS, tmp_path, backend="fp32").shape == (2, DIM)
+    assert load([], tmp_path, backend="fp32").shape == (0, DIM)
@@ -0,0 +1,21 @@
+import threading
+
+import torch
+
+from core.embeddings import set_torch_threads
+
+
+def test_thread_count_is_set_once_and_not_restored():
+    original = torch.get_num_threads()
+    try:
+        set_torch_threads(1)
+        threads = [threading.Thread(target=set_torch_threads, args=(1,)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert torch.get_num_threads() == 1
+        set_torch_threads(0)  # 0 keeps the current setting
+        assert torch.get_num_threads() == 1
+    finally:
+        torch.set_num_threads(original)
@@ -0,0 +1,63 @@
+import pytest
+
+from core import extractors
+from core.extractors import cached_extract_text, clear_extraction_cache, extract_miscarriage_from_pdf
+
+CTG_PDF = "input/CTG_Feature_Report.pdf"
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Counts of text extractions and LLM calls, with the `cache` argument of each LLM call."""
+    counts = {"text": 0, "llm": []}
+    extract_text = extractors.extract_text
+
+    def counting_extract_text(data):
+        counts["text"] += 1
+        return extract_text(data)
+
+    def fake_llm(prompt, client, model=None, temp=None, cache=None):
+        counts["llm"].append(cache)
+        return '{"Age": 30}'
+    monkeypatch.setattr(extractors, "extract_text", counting_extract_text)
+    monkeypatch.setattr(extractors, "llm_generate", fake_llm)
+    clear_extraction_cache()
+    yield counts
+    clear_extraction_cache()
+
+
+@pytest.fixture
+def pdf():
+    with open(CTG_PDF, "rb") as f:
+        return f.read()
+
+
+def test_text_and_fields_are_memoized(calls, pdf):
+    fp, text = cached_extract_text(pdf)
+    assert cached_extract_text(pdf) == (fp, text)
+    assert calls["text"] == 1
+
+    assert extract_miscarriage_from_pdf(pdf, client=None) == {"Age": 30}
+    assert extract_miscarriage_from_pdf(pdf, client=None) == {"Age": 30}
+    assert calls["text"] == 1 and calls["llm"] == [None]
+
+    # another model is another entry
+    extract_miscarriage_from_pdf(pdf, client=None, model="other/model")
+    assert len(calls["llm"]) == 2
+
+
+def test_refresh_bypasses_memo_and_llm_cache(calls, pdf):
+    extract_miscarriage_from_pdf(pdf, client=None)
+    extract_miscarriage_from_pdf(pdf, client=None, refresh=True)
+    assert calls["text"] == 2
+    assert calls["llm"] == [None, False]
+    # the refreshed entry is served afterwards
+    extract_miscarriage_from_pdf(pdf, client=None)
+    assert calls["text"] == 2 and len(calls["llm"]) == 2
+
+
+def test_entries_of_another_extraction_version_are_not_reused(calls, pdf, monkeypatch):
+    extract_miscarriage_from_pdf(pdf, client=None)
+    monkeypatch.setattr(extractors, "EXTRACTION_VERSION", "extract-v2")
+    extract_miscarriage_from_pdf(pdf, client=None)
+    assert calls["text"] == 2 and len(calls["llm"]) == 2
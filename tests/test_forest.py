@@ -0,0 +1,57 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+import shap
+
+from core.forest import export_forest, load_compact_forest
+from core.predictors import align_columns, explain
+
+MODEL_PATH = "ml/models/random_forest_model_stillbirth.pkl"
+DATA_PATH = "ml/data/fetal_health.csv"
+
+
+@pytest.fixture(scope="module")
+def forests():
+    with open(MODEL_PATH, "rb") as f:
+        model = pickle.load(f)
+    return model, export_forest(model)
+
+
+@pytest.fixture(scope="module")
+def X(forests):
+    return align_columns(pd.read_csv(DATA_PATH), list(forests[0].feature_names_in_))
+
+
+def test_predict_proba_matches_sklearn(forests, X):
+    model, compact = forests
+    np.testing.assert_allclose(compact.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-6)
+    np.testing.assert_array_equal(compact.predict(X), model.predict(X))
+
+
+def test_saved_forest_round_trips(forests, X, tmp_path):
+    _, compact = forests
+    compact.save(tmp_path / "forest.npz")
+    loaded = load_compact_forest(tmp_path / "forest.npz")
+    np.testing.assert_array_equal(loaded.predict_proba(X), compact.predict_proba(X))
+    np.testing.assert_array_equal(loaded.feature_names_in_, compact.feature_names_in_)
+
+
+def test_shap_values_match_sklearn(forests, X):
+    model, compact = forests
+    rows = X.sample(50, random_state=0)
+    expected = explain(shap.TreeExplainer(model), rows)
+    actual = explain(shap.TreeExplainer(compact.shap_model()), rows)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=1e-6)
+
+
+def test_interventional_shap_values_add_up_to_sklearn(forests, X):
+    # shap rounds sklearn's float64 thresholds to the nearest float32 on this path, so its own
+    # values for the sklearn forest are off by ~1e-4; the compact forest's must add up exactly
+    model, compact = forests
+    background, rows = X.sample(100, random_state=1), X.sample(20, random_state=2)
+    explainer = shap.TreeExplainer(compact.shap_model(), data=background, feature_perturbation="interventional")
+    np.testing.assert_allclose(explainer.expected_value, model.predict_proba(background).mean(axis=0), rtol=0, atol=1e-6)
+    total = explain(explainer, rows).sum(axis=1) + explainer.expected_value
+    np.testing.assert_allclose(total, model.predict_proba(rows), rtol=0, atol=1e-6)
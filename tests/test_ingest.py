@@ -0,0 +1,57 @@
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+from core.ingest import checkpoint_path, ingest, load_checkpoint
+
+CTG_PDF = "input/CTG_Feature_Report.pdf"
+
+
+@pytest.fixture
+def reports(tmp_path):
+    directory = tmp_path / "reports"
+    (directory / "nested").mkdir(parents=True)
+    shutil.copy(CTG_PDF, directory / "a.pdf")
+    shutil.copy(CTG_PDF, directory / "nested" / "b.pdf")
+    (directory / "broken.pdf").write_bytes(b"not a pdf")
+    return directory
+
+
+def run(reports, output):
+    seen = []
+    result = ingest(str(reports), str(output), workers=1, on_record=lambda r: seen.append(r["file"]))
+    return result, sorted(seen)
+
+
+def test_checkpoint_resume_skips_only_complete_unchanged_pdfs(reports, tmp_path):
+    output = tmp_path / "features.csv"
+    result, seen = run(reports, output)
+    assert result == {"done": 3, "skipped": 0, "rejected": 1}
+    assert seen == ["a.pdf", "broken.pdf", "nested/b.pdf"]
+    assert list(pd.read_csv(output)["file"]) == ["a.pdf", "nested/b.pdf"]
+
+    # failed PDFs are retried, complete ones are skipped
+    result, seen = run(reports, output)
+    assert result == {"done": 1, "skipped": 2, "rejected": 1}
+    assert seen == ["broken.pdf"]
+
+    # a PDF replaced under the same name is extracted again
+    (reports / "a.pdf").write_bytes(b"replaced")
+    result, seen = run(reports, output)
+    assert seen == ["a.pdf", "broken.pdf"]
+    assert load_checkpoint(checkpoint_path(output))["a.pdf"]["error"]
+    assert list(pd.read_csv(output)["file"]) == ["nested/b.pdf"]
+
+
+def test_incomplete_and_torn_records_are_extracted_again(reports, tmp_path):
+    output = tmp_path / "features.csv"
+    run(reports, output)
+    records = load_checkpoint(checkpoint_path(output))
+    with open(checkpoint_path(output), "a") as f:
+        f.write(json.dumps({**records["a.pdf"], "missing": ["baseline_value"]}) + "\n")
+        f.write('{"file": "nested/b.pdf", "finger')
+    result, seen = run(reports, output)
+    assert seen == ["a.pdf", "broken.pdf"]
+    assert load_checkpoint(checkpoint_path(output))["a.pdf"]["missing"] == []
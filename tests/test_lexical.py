@@ -0,0 +1,94 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from core import lexical
+from core.lexical import LexicalIndex, dense_over_budget, record_query_embed, reset_budget, retrieve_docs, tokenize
+
+DOCS = [
+    {"advice": "Prolonged decelerations need urgent obstetric review."},
+    {"advice": "Reduced fetal movements should be reported the same day."},
+    {"advice": "Low short term variability may indicate fetal hypoxia."},
+    {"advice": "Uterine contractions are monitored during labour."},
+    {"advice": "Accelerations are a reassuring sign."},
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_budget():
+    reset_budget()
+    yield
+    reset_budget()
+
+
+@pytest.fixture
+def index():
+    return LexicalIndex.build([d["advice"] for d in DOCS])
+
+
+@pytest.fixture
+def dense(monkeypatch):
+    """Dense resources with a fake query embedding that takes state["seconds"] on a fake clock."""
+    state = {"seconds": 0.0, "calls": 0, "clock": 0.0}
+
+    def embed_query(query, emb_model, tokenizer):
+        state["calls"] += 1
+        state["clock"] += state["seconds"]
+        return np.ones(4, dtype=np.float32) / 2
+
+    monkeypatch.setattr(lexical, "embed_query", embed_query)
+    monkeypatch.setattr(lexical, "time", SimpleNamespace(perf_counter=lambda: state["clock"]))
+    monkeypatch.setattr(lexical, "RETRIEVAL_PROBE_EVERY", 10)
+    embeddings = np.eye(len(DOCS), 4, dtype=np.float32) + 0.1
+    return (embeddings, object(), object(), None), state
+
+
+def test_tokenize_folds_plurals_aliases_and_feature_names():
+    assert tokenize("prolongued_decelerations of the Histogram variance 12") == ["prolonged", "deceleration", "histogram", "variance"]
+
+
+def test_bm25_ranks_matching_advices(index):
+    assert index.search("prolongued_decelerations", k=3) == [0]
+    assert index.search("fetal movements", k=3)[0] == 1
+    assert index.search("nothing matches here", k=3) == []
+
+
+def test_index_round_trips(index, tmp_path):
+    index.save(tmp_path / "index.npz")
+    loaded = LexicalIndex.load(tmp_path / "index.npz")
+    np.testing.assert_array_equal(loaded.scores("fetal variability"), index.scores("fetal variability"))
+
+
+def test_lexical_tier_without_dense(index):
+    assert retrieve_docs("fetal movements", DOCS, index, k=1, mode="hybrid") == [DOCS[1]]
+
+
+def test_budget_ignores_time_outside_query_embeds():
+    record_query_embed(0.001)
+    # a slow corpus encode elsewhere does not count; only query embeddings do
+    lexical.observe("embed", 5.0)
+    assert not dense_over_budget(50)
+
+
+def test_slow_embeddings_switch_to_lexical_and_probes_recover(index, dense):
+    resources, state = dense
+    state["seconds"] = 0.2
+    retrieve_docs("fetal movements", DOCS, index, k=1, dense=resources, budget_ms=50)
+    assert state["calls"] == 1
+
+    # over budget: only every probe_every-th query embeds
+    for _ in range(9):
+        retrieve_docs("fetal movements", DOCS, index, k=1, dense=resources, budget_ms=50)
+    assert state["calls"] == 1
+    state["seconds"] = 0.001
+    retrieve_docs("fetal movements", DOCS, index, k=1, dense=resources, budget_ms=50)
+    assert state["calls"] == 2
+
+    # fast probes bring the window's median back under budget
+    for _ in range(30):
+        retrieve_docs("fetal movements", DOCS, index, k=1, dense=resources, budget_ms=50)
+    calls = state["calls"]
+    retrieve_docs("fetal movements", DOCS, index, k=1, dense=resources, budget_ms=50)
+    assert state["calls"] == calls + 1
+    assert not dense_over_budget(50)
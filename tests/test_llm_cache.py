@@ -0,0 +1,84 @@
+import sqlite3
+
+import pytest
+
+from core import llm_cache
+from core.llm_cache import LLMCache, make_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    return now
+
+
+def disk_keys(path):
+    with sqlite3.connect(path) as db:
+        return {key for (key,) in db.execute("SELECT key FROM responses")}
+
+
+def test_keys_depend_on_model_temperature_and_prompt():
+    key = make_key("model", 0.2, "prompt")
+    assert key == make_key("model", 0.2, "prompt")
+    assert len({key, make_key("other", 0.2, "prompt"), make_key("model", None, "prompt"), make_key("model", 0.2, "prompt ")}) == 4
+
+
+@pytest.mark.skipif(llm_cache.CACHE_PERSIST, reason="CACHE_PERSIST=1 is set")
+def test_memory_only_by_default():
+    assert LLMCache()._db is None
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    cache = LLMCache(tmp_path / "cache.sqlite", ttl=60)
+    cache.set("k", "v")
+    clock[0] += 59
+    assert cache.get("k") == "v"
+    clock[0] += 2
+    assert cache.get("k") is None
+    assert disk_keys(tmp_path / "cache.sqlite") == set()
+
+
+def test_expired_rows_are_purged_on_open(tmp_path, clock):
+    LLMCache(tmp_path / "cache.sqlite", ttl=60).set("k", "v")
+    clock[0] += 120
+    LLMCache(tmp_path / "cache.sqlite", ttl=60)
+    assert disk_keys(tmp_path / "cache.sqlite") == set()
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LLMCache(path=None, max_memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats["evictions"] == 1
+
+
+def test_disk_tier_evicts_least_recently_accessed(tmp_path, clock):
+    path = tmp_path / "cache.sqlite"
+    cache = LLMCache(path, max_memory_entries=1, max_disk_entries=2)
+    cache.set("a", "1")
+    clock[0] += 1
+    cache.set("b", "2")
+    clock[0] += 1
+    assert cache.get("a") == "1"  # disk hit refreshes a's access time
+    clock[0] += 1
+    cache.set("c", "3")
+    assert disk_keys(path) == {"a", "c"}
+
+
+def test_disk_tier_survives_restarts(tmp_path):
+    LLMCache(tmp_path / "cache.sqlite").set("k", "v")
+    cache = LLMCache(tmp_path / "cache.sqlite")
+    assert cache.get("k") == "v"
+    assert cache.stats["disk_hits"] == 1
+
+
+def test_get_or_compute_skips_none():
+    cache = LLMCache(path=None)
+    assert cache.get_or_compute("k", lambda: None) is None
+    assert cache.get_or_compute("k", lambda: "v") == "v"
+    assert cache.get_or_compute("k", lambda: "other") == "v"
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.llm_cache import LLMCache, make_key
+from core.llm_stub import start_stub_server
+from core.llm_utils import LLMError, LLMTimeoutError, PooledLLMClient, llm_generate
+
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**kwargs):
+        server, url = start_stub_server(**kwargs)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def client():
+    clients = []
+
+    def make(base_url, **kwargs):
+        kwargs.setdefault("backoff_base", 0.01)
+        c = PooledLLMClient(base_url=base_url, **kwargs)
+        clients.append(c)
+        return c
+
+    yield make
+    for c in clients:
+        c.close()
+
+
+def test_transient_failures_are_retried(stub, client):
+    server, url = stub(fail_first=2)
+    llm = client(url, max_retries=3, timeout=5)
+    response = llm.chat.completions.create(model="m", messages=MESSAGES)
+    assert response.choices[0].message.content
+    assert server.state["requests"] == 3
+    assert llm.stats["retries"] == 2
+
+
+def test_gives_up_after_max_retries(stub, client):
+    server, url = stub(fail_first=10)
+    llm = client(url, max_retries=1, timeout=5)
+    with pytest.raises(LLMError, match="HTTP 503"):
+        llm.chat.completions.create(model="m", messages=MESSAGES)
+    assert server.state["requests"] == 2
+    assert llm.stats["failures"] == 1
+
+
+def test_deadline_bounds_the_call(stub, client):
+    _, url = stub(delay=2.0)
+    llm = client(url, max_retries=3)
+    start = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        llm.chat.completions.create(model="m", messages=MESSAGES, timeout=0.3)
+    assert time.monotonic() - start < 1.0
+    assert llm.stats["timeouts"] >= 1
+
+
+def test_hedge_wins_when_primary_is_slow(stub, client):
+    _, url = stub(delays={"slow": 2.0}, respond=lambda request: request["model"])
+    llm = client(url, hedge_model="fast", hedge_delay=0.05, timeout=5)
+    response = llm.chat.completions.create(model="slow", messages=MESSAGES)
+    assert response.choices[0].message.content == "fast"
+    assert response.answered_by == "fast"
+    assert llm.stats["hedges"] == llm.stats["hedge_wins"] == 1
+
+
+def test_primary_answer_within_hedge_delay_is_not_hedged(stub, client):
+    _, url = stub(respond=lambda request: request["model"])
+    llm = client(url, hedge_model="fast", hedge_delay=1.0, timeout=5)
+    response = llm.chat.completions.create(model="slow", messages=MESSAGES)
+    assert response.answered_by == "slow"
+    assert llm.stats["hedges"] == 0
+
+
+def test_hedged_answer_is_cached_under_the_answering_model(stub, client):
+    _, url = stub(delays={"slow": 2.0}, respond=lambda request: request["model"])
+    llm = client(url, hedge_model="fast", hedge_delay=0.05, timeout=5)
+    cache = LLMCache(path=None)
+    assert llm_generate("prompt", llm, model="slow", temp=0.2, cache=cache) == "fast"
+    assert cache.get(make_key("slow", 0.2, "prompt")) is None
+    assert cache.get(make_key("fast", 0.2, "prompt")) == "fast"
+
+
+def test_concurrency_is_capped(stub, client):
+    state = {"in_flight": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def respond(request):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.1)
+        with lock:
+            state["in_flight"] -= 1
+        return "ok"
+
+    _, url = stub(respond=respond)
+    llm = client(url, max_concurrency=2, timeout=10)
+
+    async def burst():
+        return await asyncio.gather(*(llm.acomplete("hi", "m") for _ in range(6)))
+
+    assert llm.run(burst()) == ["ok"] * 6
+    assert state["peak"] == 2
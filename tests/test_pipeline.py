@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core.pipeline import Pipeline
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        yield pool
+
+
+def test_stages_receive_their_dependencies(executor):
+    pipeline = (Pipeline(executor)
+                .add("double", lambda x: 2 * x, deps=["x"])
+                .add("square", lambda x: x * x, deps=["x"])
+                .add("total", lambda double, square: double + square, deps=["double", "square"]))
+    futures = pipeline.run(x=3)
+    assert futures["total"].result(timeout=5) == 15
+
+
+def test_independent_stages_overlap(executor):
+    barrier = threading.Barrier(2, timeout=5)
+    pipeline = Pipeline(executor).add("a", barrier.wait).add("b", barrier.wait)
+    futures = pipeline.run()
+    # each stage blocks until the other has started, so this only finishes if they run concurrently
+    assert {futures["a"].result(timeout=5), futures["b"].result(timeout=5)} == {0, 1}
+
+
+def test_stage_error_propagates_to_dependents(executor):
+    calls = []
+
+    def fail():
+        raise RuntimeError("predict failed")
+
+    pipeline = (Pipeline(executor)
+                .add("predict", fail)
+                .add("query", lambda predict: calls.append("query"), deps=["predict"])
+                .add("advice", lambda query: calls.append("advice"), deps=["query"])
+                .add("other", lambda: "ok"))
+    futures = pipeline.run()
+    for name in ("predict", "query", "advice"):
+        with pytest.raises(RuntimeError, match="predict failed"):
+            futures[name].result(timeout=5)
+    assert futures["other"].result(timeout=5) == "ok"
+    assert calls == []
+
+
+def test_cycles_are_rejected():
+    pipeline = (Pipeline()
+                .add("a", lambda c: c, deps=["c"])
+                .add("b", lambda a: a, deps=["a"])
+                .add("c", lambda b: b, deps=["b"]))
+    with pytest.raises(ValueError, match="Dependency cycle"):
+        pipeline.run()
+
+
+def test_unknown_and_duplicate_stages_are_rejected():
+    pipeline = Pipeline().add("a", lambda missing: missing, deps=["missing"])
+    with pytest.raises(ValueError, match="unknown stages"):
+        pipeline.run()
+    with pytest.raises(ValueError, match="already defined"):
+        pipeline.add("a", lambda: None)
+
+
+def test_inputs_named_like_stages_are_rejected():
+    pipeline = Pipeline().add("text", lambda: "parsed").add("fields", lambda text: text, deps=["text"])
+    with pytest.raises(ValueError, match=r"Inputs \['text'\] have the names of stages"):
+        pipeline.run(text="given")
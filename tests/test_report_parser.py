@@ -0,0 +1,45 @@
+from core.extractors import extract_text
+from core.predictors import CTG_COLUMNS
+from core.report_parser import ALIAS_CONFIDENCE, EXACT_CONFIDENCE, parse_ctg_report
+
+REPORT_PDF = "input/CTG_Feature_Report.pdf"
+
+
+def test_sample_report_parses_every_field():
+    result = parse_ctg_report(extract_text(REPORT_PDF))
+    assert result["missing"] == []
+    assert set(result["values"]) == set(CTG_COLUMNS)
+    assert set(result["confidence"].values()) == {EXACT_CONFIDENCE}
+    assert result["values"]["baseline_value"] == 133.0
+    assert result["values"]["histogram_variance"] == 9.0
+    assert result["values"]["mean_value_of_short_term_variability"] == 1.1
+
+
+def test_uci_abbreviations():
+    result = parse_ctg_report("LB: 120\nASTV 73 %\nMSTV = 0.5\nNmax 2\n")
+    assert result["values"] == {
+        "baseline_value": 120.0,
+        "abnormal_short_term_variability": 73.0,
+        "mean_value_of_short_term_variability": 0.5,
+        "histogram_number_of_peaks": 2.0,
+    }
+    assert set(result["confidence"].values()) == {ALIAS_CONFIDENCE}
+
+
+def test_generic_labels_only_inside_histogram_section():
+    text = "Variability summary\nMean 1.1\nVariance 9\nFHR histogram\nMin 95\nMean 135\nVariance 9\n"
+    result = parse_ctg_report(text)
+    assert result["values"] == {"histogram_min": 95.0, "histogram_mean": 135.0, "histogram_variance": 9.0}
+    assert "histogram_mode" in result["missing"]
+
+
+def test_generic_labels_outside_histogram_section_are_missing():
+    result = parse_ctg_report("Mean 135\nMin 95\n")
+    assert result["values"] == {}
+    assert "histogram_mean" in result["missing"]
+
+
+def test_out_of_range_and_conflicting_values_are_unresolved():
+    result = parse_ctg_report("baseline value 400\nhistogram_mode 139\nhistogram_mode 141\n")
+    assert "baseline_value" in result["missing"]
+    assert "histogram_mode" in result["missing"]
@@ -0,0 +1,54 @@
+import os
+import zipfile
+
+import pytest
+
+from core import reports
+from core.reports import render_reports
+
+
+def report(patient_id, classification="Normal"):
+    return {"patient_id": patient_id, "classification": classification, "confidence": 90, "reason": "r", "recommendations": []}
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """Reports passed to the renderer; workers=1 keeps rendering in this process."""
+    calls = []
+
+    def fake_render(data):
+        calls.append(data)
+        return f"%PDF {data.get('patient_id')} {data.get('classification')}".encode()
+    monkeypatch.setattr(reports, "render_pdf", fake_render)
+    return calls
+
+
+def test_suffixed_names_never_collide_with_original_names(rendered, tmp_path):
+    cohort = [report("a"), report("a", "Suspect"), report("a_2", "Pathological"), report("a", "Normal ")]
+    names = render_reports(cohort, tmp_path, workers=1)
+    assert names == ["a.pdf", "a_2.pdf", "a_2_2.pdf", "a_3.pdf"]
+    assert sorted(os.listdir(tmp_path)) == sorted(names)
+    with open(tmp_path / "a_2_2.pdf", "rb") as f:
+        assert f.read() == b"%PDF a_2 Pathological"
+
+
+def test_identical_reports_are_rendered_once(rendered, tmp_path):
+    cohort = [report("a"), report("b"), report("a"), {}]
+    names = render_reports(cohort, tmp_path / "out.zip", workers=1)
+    assert names == ["a.pdf", "b.pdf", "a_2.pdf", "report_00004.pdf"]
+    assert len(rendered) == 3
+    with zipfile.ZipFile(tmp_path / "out.zip") as archive:
+        assert archive.namelist() == names
+        assert archive.read("a.pdf") == archive.read("a_2.pdf")
+
+
+def test_names_are_sanitized(rendered, tmp_path):
+    assert render_reports([report("../etc/passwd x")], tmp_path, workers=1) == [".._etc_passwd_x.pdf"]
+
+
+def test_process_pool_writes_real_pdfs(tmp_path):
+    names = render_reports([report("a"), report("b", "Suspect"), report("a")], tmp_path, workers=2)
+    assert names == ["a.pdf", "b.pdf", "a_2.pdf"]
+    for name in names:
+        with open(tmp_path / name, "rb") as f:
+            assert f.read(5) == b"%PDF-"
@@ -0,0 +1,135 @@
+import base64
+import http.client
+import json
+import threading
+
+import pytest
+
+from core.llm_stub import start_stub_server
+from core.llm_utils import PooledLLMClient
+from core.predictors import CTG_COLUMNS, MISCARRIAGE_COLUMNS
+from core.service import MAX_BODY_BYTES, ServiceState, create_server
+
+FEATURES = {c: 0.0 for c in CTG_COLUMNS} | {"baseline_value": 133.0, "histogram_mean": 135.0}
+
+
+def missing_model():
+    raise FileNotFoundError("ml/models/random_forest_model_miscarriage.pkl")
+
+
+@pytest.fixture(scope="module")
+def llm():
+    server, url = start_stub_server(respond=lambda request: "not json")
+    client = PooledLLMClient(base_url=url, timeout=5)
+    yield client
+    client.close()
+    server.shutdown()
+
+
+@pytest.fixture(scope="module")
+def service(llm):
+    state = ServiceState(llm, components=("lexical", "ctg", "miscarriage"))
+    state._load_miscarriage = missing_model
+    state.load()
+    server = create_server(port=0, state=state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(server, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=30)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = json.loads(response.read())
+    conn.close()
+    return response.status, data
+
+
+def post(server, path, body):
+    data = json.dumps(body).encode("utf-8")
+    return request(server, "POST", path, data, {"Content-Length": str(len(data))})
+
+
+def test_ready_without_disabled_components(service):
+    status, body = request(service, "GET", "/readyz")
+    assert status == 200
+    assert body["components"] == {"lexical": "ready", "ctg": "ready", "miscarriage": "disabled", "retrieval": "disabled"}
+    assert "miscarriage" in body["errors"]
+
+
+def test_not_ready_while_an_enabled_component_fails():
+    state = ServiceState(components=("miscarriage",))
+    assert not state.ready
+    state.status["miscarriage"] = "failed"
+    assert not state.ready
+
+
+def test_unknown_components_are_rejected():
+    with pytest.raises(ValueError):
+        ServiceState(components=("ctg", "nope"))
+
+
+def test_prediction(service):
+    status, body = post(service, "/ctg", {"features": FEATURES})
+    assert status == 200
+    assert body["prediction"]["predicted_class"]
+
+
+def test_disabled_component_is_unavailable(service):
+    status, body = post(service, "/miscarriage", {"features": {c: 1.0 for c in MISCARRIAGE_COLUMNS}})
+    assert status == 503
+    assert "miscarriage is disabled" in body["error"]
+
+
+def test_validation_errors_are_400(service):
+    assert post(service, "/ctg", {"features": {"baseline_value": 1}})[0] == 400
+    assert post(service, "/ctg", {"features": FEATURES | {"accelerations": "fast"}})[0] == 400
+    assert post(service, "/ctg", [1, 2])[0] == 400
+    assert request(service, "POST", "/ctg", b"{", {"Content-Length": "1"})[0] == 400
+    assert post(service, "/extract", {"kind": "ctg", "pdf_base64": "%%%"})[0] == 400
+
+
+def test_content_length_is_required_and_numeric(service):
+    assert request(service, "POST", "/ctg", headers={"Content-Length": "abc"})[0] == 400
+    conn = http.client.HTTPConnection(*service.server_address, timeout=30)
+    conn.putrequest("POST", "/ctg")
+    conn.endheaders()
+    response = conn.getresponse()
+    assert response.status == 411
+    conn.close()
+
+
+def test_unparseable_llm_output_is_502(service):
+    status, body = post(service, "/ctg", {"features": FEATURES, "report": True})
+    assert status == 502
+    assert "LLMOutputError" in body["error"]
+
+
+def test_unparseable_extraction_is_502(service):
+    with open("input/CTG_Feature_Report.pdf", "rb") as f:
+        pdf_base64 = base64.b64encode(f.read()).decode("ascii")
+    # every miscarriage field goes through the LLM, which answers garbage here
+    status, body = post(service, "/extract", {"kind": "miscarriage", "pdf_base64": pdf_base64, "refresh": True})
+    assert status == 502
+    assert "LLMOutputError" in body["error"]
+
+
+def test_base64_that_is_not_a_pdf_is_400(service):
+    status, body = post(service, "/extract", {"kind": "ctg", "pdf_base64": base64.b64encode(b"hello").decode("ascii")})
+    assert status == 400
+    assert "not a readable PDF" in body["error"]
+
+
+@pytest.mark.parametrize("length", ["abc", str(MAX_BODY_BYTES + 1)])
+def test_rejected_bodies_close_the_connection(service, length):
+    conn = http.client.HTTPConnection(*service.server_address, timeout=30)
+    conn.putrequest("POST", "/ctg")
+    conn.putheader("Content-Length", length)
+    conn.endheaders(b'{"features": {}}')
+    response = conn.getresponse()
+    assert response.status in (400, 413)
+    assert response.getheader("Connection") == "close"
+    response.read()
+    conn.close()
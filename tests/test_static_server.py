@@ -0,0 +1,82 @@
+import gzip
+import http.client
+
+import pytest
+
+from core.static_server import asset_url, get_server
+
+DATA = b"".join(f"vertex {i}\n".encode() for i in range(200))
+
+
+@pytest.fixture
+def server(tmp_path):
+    (tmp_path / "mesh.gltf").write_bytes(DATA)
+    (tmp_path / "texture.png").write_bytes(DATA)
+    return get_server(str(tmp_path))
+
+
+def get(server, path, headers=None, method="GET"):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=10)
+    try:
+        conn.request(method, path, headers=headers or {})
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_full_response_with_etag_and_versioned_url(server, tmp_path):
+    status, headers, body = get(server, "/mesh.gltf")
+    assert status == 200 and body == DATA
+    assert headers["Content-Type"] == "model/gltf+json"
+    assert headers["Content-Length"] == str(len(DATA))
+    assert "immutable" in headers["Cache-Control"]
+    etag = headers["ETag"]
+    assert etag.startswith('"') and "Content-Encoding" not in headers
+    assert asset_url(str(tmp_path / "mesh.gltf")).endswith(f"/mesh.gltf?v={etag.strip(chr(34))}")
+
+
+def test_if_none_match_is_304_per_encoding(server):
+    _, plain, _ = get(server, "/mesh.gltf")
+    status, headers, body = get(server, "/mesh.gltf", {"If-None-Match": plain["ETag"]})
+    assert (status, body, headers["ETag"]) == (304, b"", plain["ETag"])
+
+    _, gzipped, _ = get(server, "/mesh.gltf", {"Accept-Encoding": "gzip"})
+    assert gzipped["ETag"] == plain["ETag"][:-1] + '-gz"'
+    assert get(server, "/mesh.gltf", {"Accept-Encoding": "gzip", "If-None-Match": gzipped["ETag"]})[0] == 304
+    # the plain ETag does not validate the gzip variant
+    assert get(server, "/mesh.gltf", {"Accept-Encoding": "gzip", "If-None-Match": plain["ETag"]})[0] == 200
+
+
+def test_gzip_negotiation(server):
+    status, headers, body = get(server, "/mesh.gltf", {"Accept-Encoding": "deflate, gzip;q=0.5"})
+    assert status == 200 and headers["Content-Encoding"] == "gzip" and headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == DATA and len(body) < len(DATA)
+
+    assert "Content-Encoding" not in get(server, "/mesh.gltf", {"Accept-Encoding": "gzip;q=0"})[1]
+    # already-compressed formats are sent as is
+    assert "Content-Encoding" not in get(server, "/texture.png", {"Accept-Encoding": "gzip"})[1]
+
+
+@pytest.mark.parametrize("header, start, end", [("bytes=10-19", 10, 19), ("bytes=-10", len(DATA) - 10, len(DATA) - 1),
+                                                 ("bytes=100-", 100, len(DATA) - 1)])
+def test_byte_ranges(server, header, start, end):
+    status, headers, body = get(server, "/mesh.gltf", {"Range": header, "Accept-Encoding": "gzip"})
+    assert status == 206 and body == DATA[start:end + 1]
+    assert headers["Content-Range"] == f"bytes {start}-{end}/{len(DATA)}"
+    # ranges address the identity bytes, so they are never compressed
+    assert "Content-Encoding" not in headers
+
+
+@pytest.mark.parametrize("header", [f"bytes={len(DATA)}-", "bytes=-0", "bytes=20-10"])
+def test_unsatisfiable_range_is_416(server, header):
+    status, headers, body = get(server, "/mesh.gltf", {"Range": header})
+    assert (status, body) == (416, b"")
+    assert headers["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+def test_head_and_missing_files(server):
+    status, headers, body = get(server, "/mesh.gltf", method="HEAD")
+    assert status == 200 and body == b"" and headers["Content-Length"] == str(len(DATA))
+    assert get(server, "/missing.glb")[0] == 404
+    assert get(server, "/../../etc/passwd")[0] == 404
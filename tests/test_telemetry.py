@@ -0,0 +1,62 @@
+import pytest
+
+from core import telemetry
+from core.telemetry import incr, prometheus_text, snapshot, span, traced
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    telemetry.reset()
+    yield
+    telemetry.reset()
+
+
+def test_spans_record_durations_and_errors():
+    with span("render"):
+        pass
+
+    @traced("render")
+    def fail():
+        raise RuntimeError("boom")
+    with pytest.raises(RuntimeError):
+        fail()
+
+    stats = snapshot()["stages"]["render"]
+    assert stats["count"] == 2 and stats["sum"] >= 0 and "p50" in stats and "p99" in stats
+    assert snapshot()["counters"] == [{"name": "errors_total", "labels": {"stage": "render"}, "value": 1}]
+
+
+def test_unknown_stages_are_rejected():
+    with pytest.raises(ValueError, match="render"):
+        with span("rendr"):
+            pass
+    with pytest.raises(ValueError):
+        traced("rendr")
+    assert snapshot()["stages"] == {}
+
+
+def test_counters_sum_per_label_set():
+    incr("llm_tokens_total", 10, kind="prompt")
+    incr("llm_tokens_total", 5, kind="prompt")
+    incr("llm_tokens_total", 3, kind="completion")
+    counters = {c["labels"]["kind"]: c["value"] for c in snapshot()["counters"]}
+    assert counters == {"prompt": 15, "completion": 3}
+
+
+def test_prometheus_text():
+    telemetry.observe("llm", 0.5)
+    incr("llm_requests_total", model="qwen")
+    incr("llm_requests_total", model="qwen")
+    incr("cache_total")
+    lines = prometheus_text().splitlines()
+    assert lines[0] == "# TYPE presafe_stage_seconds summary"
+    assert 'presafe_stage_seconds{stage="llm",quantile="0.5"} 0.500000' in lines
+    assert 'presafe_stage_seconds_count{stage="llm"} 1' in lines
+    assert lines.count("# TYPE presafe_llm_requests_total counter") == 1
+    assert 'presafe_llm_requests_total{model="qwen"} 2' in lines
+    assert "presafe_cache_total 1" in lines
+
+
+def test_prometheus_label_values_are_escaped():
+    incr("errors_total", model='a\\b "c"\nd')
+    assert 'presafe_errors_total{model="a\\\\b \\"c\\"\\nd"} 1' in prometheus_text().splitlines()